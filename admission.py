@@ -0,0 +1,53 @@
+"""
+Admission control untuk /upload, chunk upload resumable (PATCH /uploads/{file_id}), /compress, dan /batch_compress.
+
+Request ditolak cepat dengan 503 + Retry-After (sebelum body dibaca) jika service sedang jenuh:
+antrean job terlalu panjang, ruang disk STORAGE_DIR/RESULTS_DIR hampir habis (termasuk
+ukuran upload yang akan masuk), atau memori proses sudah di atas batas.
+"""
+import os
+import shutil
+import logging
+
+from backend import jobs
+
+MAX_QUEUE_DEPTH = int(os.environ.get('MAX_QUEUE_DEPTH', '200'))
+MIN_FREE_DISK_MB = int(os.environ.get('MIN_FREE_DISK_MB', '1024'))
+# 0 = tanpa batas memori
+MAX_RSS_MB = int(os.environ.get('MAX_RSS_MB', '0'))
+RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER', '30'))
+
+
+def process_rss_bytes():
+    """RSS proses saat ini dari /proc (Linux). None jika tidak tersedia."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def check(dirs, incoming_bytes=0):
+    """
+    Return alasan penolakan (string) jika service jenuh, atau None jika request boleh masuk.
+    incoming_bytes: ukuran body yang akan ditulis ke disk (dari Content-Length).
+    """
+    depth = jobs.queue_depth()
+    if depth >= MAX_QUEUE_DEPTH:
+        return f"Antrean kompresi penuh ({depth} job menunggu)"
+    reserve = MIN_FREE_DISK_MB * 1024 * 1024
+    for path in dirs:
+        free = shutil.disk_usage(path).free
+        if free - incoming_bytes < reserve:
+            return f"Ruang disk tidak cukup di {os.path.basename(path) or path}"
+    if MAX_RSS_MB:
+        rss = process_rss_bytes()
+        if rss is not None and rss > MAX_RSS_MB * 1024 * 1024:
+            return f"Memori proses di atas batas ({rss // (1024 * 1024)}MB)"
+    return None
+
+
+def retry_after(reason):
+    logging.warning(f"ADMISSION REJECT: {reason}")
+    return {"Retry-After": str(RETRY_AFTER_SECONDS)}
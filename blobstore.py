@@ -0,0 +1,460 @@
+"""
+Penyimpanan content-addressed untuk file upload dan hasil kompresi.
+
+Setiap isi file disimpan sekali di ``<root>/blobs/<shard>/<content_hash>`` dengan reference count di SQLite:
+upload duplikat hanya menaikkan refcount dan berbagi blob yang sama. Hasil kompresi juga disimpan
+sebagai blob, dan cache hasil memetakan (content hash, codec, profile, parameter) ke blob hasil
+sehingga aset yang sama tidak perlu di-encode ulang.
+
+Dengan STORE_ORIGINALS_COMPRESSED, original yang sudah dikompresi lossless (gzip) hanya disimpan dalam
+bentuk terkompresinya: blob original diganti hardlink ke blob hasil dan diberi encoding di DB, lalu
+dibaca lewat open_raw/raw_path yang mendekompresi secara streaming.
+
+Dengan PACK_MAX_KB, blob kecil ditambahkan ke segment packfile (lihat modul packfile) alih-alih menjadi
+file sendiri; open_raw/raw_path membacanya dengan pread. Dengan CDC_MIN_FILE_MB, file besar dipecah menjadi
+chunk content-defined (lihat modul chunkstore) sehingga versi-versi sebuah file berbagi chunk yang sama.
+"""
+import os
+import io
+import gzip
+import json
+import time
+import shutil
+import struct
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager, ExitStack
+
+from backend import db_utils
+from backend import ingest
+from backend import packfile
+from backend import chunkstore
+from backend import procpool
+from backend import scratch
+from backend import storage
+
+BLOB_DIRNAME = 'blobs'
+# Simpan original hanya dalam bentuk hasil kompresi lossless-nya (hardlink ke blob hasil)
+STORE_ORIGINALS_COMPRESSED = os.environ.get('STORE_ORIGINALS_COMPRESSED', '0').lower() in ('1', 'true', 'yes')
+# Pembaca stream untuk blob yang tersimpan terkompresi
+DECODERS = {
+    'gzip': lambda path: gzip.open(path, 'rb'),
+    chunkstore.ENCODING: chunkstore.open_manifest,
+}
+# File non-blob dengan nama tetap (patch diff, hasil restore)
+NAMED_DIRNAME = 'files'
+# Chunk CDC
+CHUNK_DIRNAME = chunkstore.CHUNK_DIRNAME
+# Layout shard: <root>/blobs/ab/cd/<hash>, sehingga satu direktori tidak pernah berisi jutaan entri
+SHARD_DEPTH = int(os.environ.get('SHARD_DEPTH', '2'))
+SHARD_WIDTH = 2
+
+# Menjaga urutan rename/unlink file dan update refcount tetap konsisten antar thread
+_lock = threading.Lock()
+
+
+def shard_dir(base, key):
+    """Direktori shard untuk key (hex): prefix key dipecah per SHARD_WIDTH karakter, SHARD_DEPTH tingkat."""
+    parts = [key[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return os.path.join(base, *parts)
+
+
+def blob_path(root, content_hash):
+    return os.path.join(shard_dir(os.path.join(root, BLOB_DIRNAME), content_hash), content_hash)
+
+
+def chunk_path(root, chunk_hash):
+    return os.path.join(shard_dir(os.path.join(root, CHUNK_DIRNAME), chunk_hash), chunk_hash)
+
+
+def in_store(path):
+    """True jika path ada di area blob store (blobs/, packs/, chunks/): file di sana hanya boleh dihapus lewat release."""
+    parents = os.path.normpath(path).split(os.sep)[:-1]
+    return any(part in (BLOB_DIRNAME, packfile.PACK_DIRNAME, CHUNK_DIRNAME) for part in parents)
+
+
+def named_path(root, name):
+    """Path ter-shard untuk file bernama tetap; shard dari hash nama, jadi bisa dihitung tanpa listing direktori."""
+    key = hashlib.blake2b(name.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(shard_dir(os.path.join(root, NAMED_DIRNAME), key), name)
+
+
+def hash_file(path):
+    return digest_file(path)[0]
+
+
+def digest_file(path):
+    """Content hash dan checksum integritas file dalam satu baca. Return (content_hash, checksum)."""
+    hasher = ingest.new_hasher()
+    checksum = ingest.Checksum()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(ingest.WRITE_BLOCK), b''):
+            hasher.update(block)
+            checksum.update(block)
+    return hasher.hexdigest(), checksum.value()
+
+
+class DigestWriter(io.RawIOBase):
+    """
+    File tulis yang menghitung content hash dan checksum integritas sambil menulis, untuk codec yang menulis
+    output sendiri (gzip, copy) supaya hasilnya tidak perlu dibaca ulang dengan digest_file.
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.hasher = ingest.new_hasher()
+        self.checksum = ingest.Checksum()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.checksum.update(data)
+        return self.f.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.f.close()
+        super().close()
+
+    def digest(self):
+        """(content_hash, checksum) atas semua byte yang ditulis."""
+        return self.hasher.hexdigest(), self.checksum.value()
+
+
+def _write_chunks(path, chunks, paths):
+    # Tulis chunk yang file-nya belum ada (paths: hash -> path chunk) dari file sumber
+    offset = 0
+    with open(path, 'rb') as src:
+        for chunk_hash, size in chunks:
+            target = paths[chunk_hash]
+            if not storage.backend.exists(target):
+                storage.backend.put_bytes(target, os.pread(src.fileno(), size, offset))
+            offset += size
+
+
+def _split(path, content_hash, root, size):
+    # Di luar _lock: potong file (di procpool) dan tulis chunk baru. Return daftar chunk, atau None jika tidak di-chunk
+    if not chunkstore.accepts(size) or db_utils.get_blob(content_hash):
+        return None
+    chunks = procpool.run(chunkstore.split, path)
+    known = db_utils.chunk_paths([chunk_hash for chunk_hash, _ in chunks])
+    _write_chunks(path, chunks, {chunk_hash: known.get(chunk_hash) or chunk_path(root, chunk_hash) for chunk_hash, _ in chunks})
+    return chunks
+
+
+def _discard_chunks(root, chunks):
+    # Dipanggil dengan _lock: hapus chunk yang ditulis _split tapi tidak jadi dipakai karena blob yang sama sudah
+    # tersimpan. Hanya chunk tanpa baris di tabel chunks (tidak direferensikan blob lain) yang dihapus; adopt lain
+    # yang masih di tengah jalan menulis ulang chunk yang hilang di _place.
+    known = db_utils.chunk_paths([chunk_hash for chunk_hash, _ in chunks])
+    for chunk_hash in {chunk_hash for chunk_hash, _ in chunks if chunk_hash not in known}:
+        storage.backend.delete(chunk_path(root, chunk_hash))
+
+
+def _store(path, target, staged):
+    # File lokal diupload/dipindah ke backend; object staging (sudah di backend) dipindah di sisi backend
+    if staged:
+        storage.backend.promote(path, target)
+    else:
+        storage.backend.put_file(target, path)
+
+
+def _drop(path, staged):
+    if staged:
+        storage.backend.delete(path)
+    else:
+        os.remove(path)
+
+
+def _place(path, content_hash, root, size, chunks=None, staged=False):
+    # Dipanggil dengan _lock. Return (path blob, pack_offset, encoding, ukuran tersimpan). Jika blob dengan isi sama
+    # sudah ada, file baru dibuang dan blob lama dipakai (blob lama bisa saja tersimpan terkompresi, jadi tidak boleh ditimpa).
+    existing = db_utils.get_blob(content_hash)
+    if existing and existing["corrupt"] and existing["encoding"] is None and existing["pack_offset"] is None:
+        # Isi baru dengan hash yang sama memperbaiki blob yang gagal verifikasi
+        if chunks is not None:
+            _discard_chunks(root, chunks)
+        _store(path, existing["path"], staged)
+        db_utils.record_blob_check(content_hash, None, False, time.time())
+        logging.info(f"BLOB REPAIRED: {content_hash}")
+        return existing["path"], None, None, size
+    if existing and storage.backend.exists(existing["path"]):
+        if chunks is not None:
+            _discard_chunks(root, chunks)
+        _drop(path, staged)
+        return existing["path"], existing["pack_offset"], existing["encoding"], existing["size"]
+    target = blob_path(root, content_hash)
+    if staged:
+        _store(path, target, staged)
+        return target, None, None, size
+    if chunks is not None:
+        paths = db_utils.acquire_chunks([(chunk_hash, chunk_path(root, chunk_hash), chunk_size) for chunk_hash, chunk_size in chunks], time.time())
+        # Chunk yang terhapus bersamaan (refcount sempat habis) ditulis ulang dari file sumber
+        _write_chunks(path, chunks, paths)
+        manifest = chunkstore.manifest_bytes(chunks)
+        storage.backend.put_bytes(target, manifest)
+        os.remove(path)
+        return target, None, chunkstore.ENCODING, len(manifest)
+    # Packfile butuh append ke file lokal
+    if storage.backend.local and packfile.accepts(size):
+        segment, offset = packfile.append(root, path)
+        os.remove(path)
+        return segment, offset, None, size
+    storage.backend.put_file(target, path)
+    return target, None, None, size
+
+
+@contextmanager
+def _chunk_source(path, content_hash, size, staged):
+    """
+    Yield (path, staged) untuk _split/_place. Object staging yang akan di-chunk (CDC butuh file lokal) disalin
+    sekali ke workspace scratch dan object staging-nya dihapus; selain itu path dipakai apa adanya.
+    """
+    if not staged or not chunkstore.accepts(size) or db_utils.get_blob(content_hash):
+        yield path, staged
+        return
+    with scratch.workspace('cdc') as ws:
+        ws.reserve(size)
+        local_path = ws.file('upload')
+        src = storage.backend.open(path)
+        try:
+            with open(local_path, 'wb') as out:
+                shutil.copyfileobj(src, out, ingest.WRITE_BLOCK)
+        finally:
+            src.close()
+        storage.backend.delete(path)
+        yield local_path, False
+
+
+def adopt(path, content_hash, root, checksum=None, staged=False):
+    """
+    Pindahkan file yang baru ditulis ke blob store dan ambil satu referensi.
+    Jika blob dengan isi sama sudah ada, file baru dihapus dan blob yang ada dipakai bersama.
+    checksum (ingest.Checksum().value() atas isi mentah) disimpan untuk verifikasi integritas.
+    staged: path adalah object yang sudah ditulis ke backend storage (upload streaming ke backend remote),
+    dipindah di sisi backend tanpa salinan lokal (kecuali file yang di-chunk).
+    Return (blob_path, deduplicated).
+    """
+    size = storage.backend.size(path) if staged else os.path.getsize(path)
+    with _chunk_source(path, content_hash, size, staged) as (path, staged):
+        chunks = None if staged else _split(path, content_hash, root, size)
+        with _lock:
+            target, pack_offset, encoding, stored_size = _place(path, content_hash, root, size, chunks, staged)
+            refcount = db_utils.acquire_blob(content_hash, target, stored_size, time.time(), pack_offset, encoding, checksum)
+    return target, refcount > 1
+
+
+def adopt_many(items, root, staged=False):
+    """adopt untuk banyak file sekaligus (list of (path, content_hash, checksum)), refcount diperbarui dalam satu transaksi."""
+    sizes = [storage.backend.size(path) if staged else os.path.getsize(path) for path, _, _ in items]
+    with ExitStack() as stack:
+        sources = [stack.enter_context(_chunk_source(path, content_hash, size, staged))
+                   for (path, content_hash, _), size in zip(items, sizes)]
+        chunk_lists = [None if source_staged else _split(path, content_hash, root, size)
+                       for (path, source_staged), (_, content_hash, _), size in zip(sources, items, sizes)]
+        with _lock:
+            placed = [_place(path, content_hash, root, size, chunks, source_staged)
+                      for (path, source_staged), (_, content_hash, _), size, chunks in zip(sources, items, sizes, chunk_lists)]
+            refcounts = db_utils.acquire_blobs([(content_hash, target, stored_size, pack_offset, encoding, checksum)
+                                                for (_, content_hash, checksum), (target, pack_offset, encoding, stored_size) in zip(items, placed)],
+                                               time.time())
+    return [(placement[0], refcount > 1) for placement, refcount in zip(placed, refcounts)]
+
+
+def acquire(content_hash):
+    """Tambah referensi ke blob yang sudah ada. Return path blob, atau None jika blob sudah hilang."""
+    with _lock:
+        blob = db_utils.get_blob(content_hash)
+        if not blob or blob["corrupt"] or not storage.backend.exists(blob["path"]):
+            return None
+        db_utils.acquire_blob(content_hash, blob["path"], blob["size"], time.time(), blob["pack_offset"], blob["encoding"])
+        return blob["path"]
+
+
+def release(content_hash):
+    """Lepas satu referensi; file blob dihapus saat referensi terakhir dilepas."""
+    if not content_hash:
+        return
+    with _lock:
+        blob = db_utils.get_blob(content_hash)
+        path = db_utils.release_blob(content_hash)
+        if path and storage.backend.exists(path):
+            if blob and blob["encoding"] == chunkstore.ENCODING:
+                for unused in db_utils.release_chunks([chunk_hash for chunk_hash, _ in chunkstore.read_manifest(path)]):
+                    storage.backend.delete(unused)
+            storage.backend.delete(path)
+            logging.info(f"BLOB DELETED: {content_hash}")
+
+
+def _gzip_size(path):
+    # Field ISIZE di trailer gzip: ukuran data asli modulo 2^32
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0]
+
+
+def pack_original(content_hash, result_path, encoding, original_size):
+    """
+    Ganti blob original dengan hardlink ke hasil kompresi lossless-nya sehingga isi mentah tidak
+    disimpan dua kali. Return True jika berhasil; original tetap mentah jika tidak bisa (misal beda filesystem).
+    """
+    # Hardlink hanya bisa di filesystem lokal
+    if not storage.backend.local or encoding not in DECODERS or packfile.is_segment(result_path):
+        return False
+    if encoding == 'gzip' and _gzip_size(result_path) != original_size % (1 << 32):
+        logging.warning(f"PACK SKIPPED: ukuran hasil gzip tidak cocok untuk {content_hash}")
+        return False
+    with _lock:
+        blob = db_utils.get_blob(content_hash)
+        if not blob or blob["encoding"] or blob["pack_offset"] is not None or not os.path.exists(blob["path"]):
+            return False
+        tmp_path = f"{blob['path']}.pack-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.link(result_path, tmp_path)
+        except OSError as e:
+            logging.warning(f"PACK SKIPPED: {content_hash} | Error: {e}")
+            return False
+        os.replace(tmp_path, blob["path"])
+        db_utils.set_blob_encoding(content_hash, encoding, os.path.getsize(blob["path"]))
+    logging.info(f"ORIGINAL PACKED: {content_hash} ({encoding})")
+    return True
+
+
+def blob_encoding(content_hash):
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    return blob["encoding"] if blob else None
+
+
+def is_plain_file(content_hash):
+    """
+    True jika isi blob bisa dikirim langsung dari path lokalnya (bukan blob terkompresi, ber-chunk,
+    di packfile, atau di backend remote). File lama di luar blob store selalu lokal.
+    """
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    return not blob or (storage.backend.local and not blob["encoding"] and blob["pack_offset"] is None)
+
+
+def exists(path, content_hash=None):
+    """Cek keberadaan isi file: blob di backend storage, segment packfile dan file lama di disk lokal."""
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    if not blob or blob["pack_offset"] is not None:
+        return os.path.exists(path)
+    return storage.backend.exists(path)
+
+
+def is_object(content_hash):
+    """True jika blob tersimpan utuh dan mentah sebagai satu objek di backend, sehingga bisa dibaca per range."""
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    return bool(blob) and not blob["encoding"] and blob["pack_offset"] is None
+
+
+def open_raw(path, content_hash=None):
+    """
+    Buka isi mentah file sebagai stream: blob terkompresi/ber-chunk didekompresi/dirangkai secara streaming,
+    blob packfile dibaca dengan pread, blob lain dibaca dari backend storage.
+    """
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    if not blob:
+        return open(path, 'rb')
+    if blob["pack_offset"] is not None:
+        return io.BytesIO(packfile.read(content_hash))
+    if blob["encoding"]:
+        return DECODERS[blob["encoding"]](path)
+    return storage.backend.open(path)
+
+
+@contextmanager
+def raw_path(path, content_hash=None):
+    """
+    Path lokal berisi isi mentah untuk tool yang butuh path (codec, diff). Untuk blob terkompresi, ber-chunk,
+    di packfile, atau di backend remote, isi ditulis ke workspace scratch dan dihapus setelah blok with.
+    """
+    if is_plain_file(content_hash):
+        yield path
+        return
+    with scratch.workspace('raw') as ws:
+        with ws.open('input') as out, open_raw(path, content_hash) as src:
+            shutil.copyfileobj(src, out, ingest.WRITE_BLOCK)
+        yield ws.file('input')
+
+
+def dedup_stats(content_hash):
+    """
+    Statistik deduplikasi satu blob. Untuk blob ber-chunk: jumlah chunk, chunk yang juga dipakai file lain
+    (versi lain), dan byte yang hanya disimpan untuk blob ini. Return None jika blob tidak ada.
+    """
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    if not blob:
+        return None
+    stats = {"chunked": blob["encoding"] == chunkstore.ENCODING, "blob_refcount": blob["refcount"], "stored_bytes": blob["size"]}
+    if not stats["chunked"]:
+        return stats
+    chunks = chunkstore.read_manifest(blob["path"])
+    sizes = dict(chunks)
+    occurrences = {}
+    for chunk_hash, _ in chunks:
+        occurrences[chunk_hash] = occurrences.get(chunk_hash, 0) + 1
+    refcounts = db_utils.chunk_refcounts(list(sizes))
+    # Chunk dipakai bersama jika referensinya lebih banyak dari kemunculannya di blob ini
+    shared = [chunk_hash for chunk_hash, count in occurrences.items() if refcounts.get(chunk_hash, 0) > count]
+    unique_bytes = sum(sizes.values())
+    shared_bytes = sum(sizes[chunk_hash] for chunk_hash in shared)
+    stats.update({
+        "chunks": len(chunks),
+        "unique_chunks": len(sizes),
+        "shared_chunks": len(shared),
+        "shared_bytes": shared_bytes,
+        "exclusive_bytes": unique_bytes - shared_bytes,
+        "stored_bytes": blob["size"] + unique_bytes - shared_bytes,
+        "avg_chunk_size": round(sum(size for _, size in chunks) / len(chunks)) if chunks else 0,
+    })
+    return stats
+
+
+def compact_packs():
+    """Compact segment packfile yang banyak berisi blob terhapus. Return jumlah byte yang dibebaskan."""
+    reclaimed = 0
+    for segment in db_utils.pack_segments_to_compact(packfile.PACK_COMPACT_RATIO):
+        try:
+            with _lock:
+                reclaimed += packfile.compact(segment)
+        except OSError as e:
+            logging.warning(f"PACK COMPACTION GAGAL: {segment} | Error: {e}")
+    return reclaimed
+
+
+def cache_key(content_hash, codec, profile):
+    params = json.dumps(codec.params or {}, sort_keys=True)
+    return f"{content_hash}:{codec.name}:{profile or 'default'}:{params}"
+
+
+def lookup_result(key):
+    """
+    Cari hasil kompresi tersimpan untuk cache key dan ambil satu referensi ke blob hasilnya.
+    Return dict cache (result_hash, output_path, size_after, compression_method, warning, checksum) atau None.
+    """
+    cached = db_utils.load_cached_result(key)
+    if not cached:
+        return None
+    output_path = acquire(cached["result_hash"])
+    if output_path is None:
+        db_utils.delete_cached_result(key)
+        return None
+    cached["output_path"] = output_path
+    return cached
+
+
+def store_result(key, content_hash, codec_name, result_hash, size_after, compression_method, warning=None, checksum=None):
+    db_utils.save_cached_result(key, {
+        "content_hash": content_hash,
+        "codec": codec_name,
+        "result_hash": result_hash,
+        "size_after": size_after,
+        "compression_method": compression_method,
+        "warning": warning,
+        "checksum": checksum,
+        "created_at": time.time(),
+    })
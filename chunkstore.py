@@ -0,0 +1,200 @@
+"""
+Content-defined chunking (FastCDC) untuk deduplikasi antar versi file.
+
+File besar (>= CDC_MIN_FILE_MB) dipotong menjadi chunk berukuran variabel dengan gear hash ala FastCDC:
+cut point ditentukan oleh isi, bukan offset, sehingga sisipan atau hapusan di satu bagian file hanya
+mengubah chunk di sekitarnya. Setiap chunk disimpan sekali di ``<root>/chunks/<shard>/<chunk_hash>``
+dengan reference count di tabel ``chunks``; blob file berisi manifest (daftar chunk) dan diberi
+encoding ``chunks``. Versi baru dari dokumen yang sama hanya menambah chunk yang berubah.
+
+Pemotongan dan hashing chunk CPU-bound, jadi ``split`` dijalankan di procpool. Jika numpy terpasang,
+gear hash dihitung per blok secara vektor (cut point identik dengan loop Python, yang tetap dipakai
+sebagai fallback dan untuk 63 byte pertama setiap chunk). Pembacaan kembali
+(download, codec, diff) memakai ChunkReader yang merangkai chunk secara streaming dari backend storage.
+"""
+import io
+import os
+import bisect
+import hashlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from backend import db_utils
+from backend import ingest
+from backend import storage
+
+ENCODING = 'chunks'
+CHUNK_DIRNAME = 'chunks'
+# File >= CDC_MIN_FILE_MB dipecah menjadi chunk; 0 = nonaktif
+CDC_MIN_FILE_MB = int(os.environ.get('CDC_MIN_FILE_MB', '0'))
+CDC_AVG_KB = int(os.environ.get('CDC_AVG_KB', '64'))
+CDC_AVG = CDC_AVG_KB * 1024
+CDC_MIN = CDC_AVG // 4
+CDC_MAX = CDC_AVG * 4
+READ_BLOCK = 4 * 1024 * 1024
+
+_MASK64 = (1 << 64) - 1
+# Tabel gear deterministik (harus sama di semua proses/versi supaya cut point stabil)
+GEAR = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), 'big') for i in range(256)]
+# Normalized chunking: sebelum ukuran rata-rata mask lebih ketat, sesudahnya lebih longgar.
+# Bit diambil dari bagian atas hash karena bit atas dipengaruhi 64 byte terakhir.
+_BITS = max(1, CDC_AVG.bit_length() - 1)
+MASK_S = ((1 << (_BITS + 2)) - 1) << (64 - _BITS - 2)
+MASK_L = ((1 << (_BITS - 2)) - 1) << (64 - _BITS + 2)
+# Hash 64-bit dengan shift 1 per byte hanya bergantung pada 64 byte terakhir
+WINDOW = 64
+_GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint64) if numpy is not None else None
+
+
+def accepts(size):
+    return CDC_MIN_FILE_MB > 0 and size >= CDC_MIN_FILE_MB * 1024 * 1024
+
+
+def _cut(data, start, end):
+    """Panjang chunk berikutnya yang dimulai di data[start], paling jauh sampai end."""
+    size = end - start
+    if size <= CDC_MIN:
+        return size
+    normal = start + min(CDC_AVG, size)
+    h = 0
+    i = start + CDC_MIN
+    for b in data[i:normal]:
+        h = ((h << 1) + GEAR[b]) & _MASK64
+        i += 1
+        if not h & MASK_S:
+            return i - start
+    for b in data[normal:end]:
+        h = ((h << 1) + GEAR[b]) & _MASK64
+        i += 1
+        if not h & MASK_L:
+            return i - start
+    return size
+
+
+def _window_hashes(data):
+    """
+    Gear hash jendela 64 byte yang berakhir di setiap posisi data, dihitung vektor dengan menggandakan
+    lebar jendela (1, 2, 4, ... 64): H_2m[i] = H_m[i] + (H_m[i - m] << m). Sama dengan nilai h di _cut
+    untuk posisi yang sudah >= 63 byte setelah awal hash.
+    """
+    hashes = _GEAR_ARRAY[numpy.frombuffer(data, dtype=numpy.uint8)]
+    # Buffer terpisah supaya numpy tidak menyalin operand yang tumpang tindih
+    shifted = numpy.empty_like(hashes)
+    width = 1
+    while width < WINDOW:
+        numpy.left_shift(hashes[:-width], numpy.uint64(width), out=shifted[width:])
+        numpy.add(hashes[width:], shifted[width:], out=hashes[width:])
+        width *= 2
+    return hashes
+
+
+class _CutPoints:
+    """Posisi kandidat cut point (mask MASK_S dan MASK_L terpenuhi) dalam satu buffer, dari _window_hashes."""
+
+    def __init__(self, data):
+        # Kedua mask hanya memakai bit atas; MASK_L adalah bagian atas dari MASK_S
+        top = _window_hashes(data) >> numpy.uint64(64 - _BITS - 2)
+        self.small = numpy.flatnonzero(top == 0).tolist()
+        self.large = numpy.flatnonzero(top < (1 << 4)).tolist()
+
+    @staticmethod
+    def _first(positions, lo, hi):
+        index = bisect.bisect_left(positions, lo)
+        if index < len(positions) and positions[index] < hi:
+            return positions[index]
+        return None
+
+    def cut(self, data, start, end):
+        """Sama dengan _cut(data, start, end)."""
+        size = end - start
+        if size <= CDC_MIN:
+            return size
+        normal = start + min(CDC_AVG, size)
+        first = start + CDC_MIN
+        # Jendela belum penuh (hash mulai dari 0 di awal pencarian): hitung langsung
+        warm = min(first + WINDOW - 1, end)
+        h = 0
+        for i in range(first, warm):
+            h = ((h << 1) + GEAR[data[i]]) & _MASK64
+            if not h & (MASK_S if i < normal else MASK_L):
+                return i + 1 - start
+        found = self._first(self.small, warm, normal)
+        if found is None:
+            found = self._first(self.large, max(warm, normal), end)
+        return found + 1 - start if found is not None else size
+
+
+def split(path):
+    """Potong file menjadi chunk. Return list of (chunk_hash, size) sesuai urutan di file."""
+    chunks = []
+    buf = b''
+    eof = False
+    with open(path, 'rb') as f:
+        while buf or not eof:
+            if not eof:
+                block = f.read(READ_BLOCK)
+                eof = not block
+                buf += block
+            pos = 0
+            cut = _CutPoints(buf).cut if numpy is not None and buf else _cut
+            # Selama sisa buffer >= CDC_MAX cut point pasti ada di buffer; di akhir file sisa ikut dipotong
+            while len(buf) - pos >= CDC_MAX or (eof and pos < len(buf)):
+                size = cut(buf, pos, min(len(buf), pos + CDC_MAX))
+                hasher = ingest.new_hasher()
+                hasher.update(buf[pos:pos + size])
+                chunks.append((hasher.hexdigest(), size))
+                pos += size
+            buf = buf[pos:]
+    return chunks
+
+
+def manifest_bytes(chunks):
+    return "".join(f"{chunk_hash} {size}\n" for chunk_hash, size in chunks).encode()
+
+
+def read_manifest(path):
+    body = storage.backend.open(path)
+    try:
+        lines = body.read().decode().splitlines()
+    finally:
+        body.close()
+    return [(chunk_hash, int(size)) for chunk_hash, size in (line.split() for line in lines if line.strip())]
+
+
+class ChunkReader(io.RawIOBase):
+    """Stream isi file asli dari manifest: chunk dibuka satu per satu sesuai urutan."""
+
+    def __init__(self, manifest_path):
+        self.chunks = read_manifest(manifest_path)
+        self.paths = db_utils.chunk_paths([chunk_hash for chunk_hash, _ in self.chunks])
+        self.index = 0
+        self.current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.index < len(self.chunks):
+            if self.current is None:
+                self.current = storage.backend.open(self.paths[self.chunks[self.index][0]])
+            data = self.current.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+            self.current.close()
+            self.current = None
+            self.index += 1
+        return 0
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def open_manifest(path):
+    return io.BufferedReader(ChunkReader(path), ingest.WRITE_BLOCK)
@@ -1,16 +1,30 @@
-import os
+"""
+Jalankan satu putaran GC retensi secara manual (GC yang sama juga berjalan otomatis di service).
+
+Usage: python -m backend.cleanup [--max-age-days N] [--quota-mb N]
+"""
 import time
+import argparse
+import logging
+
+from backend import db_utils
+from backend import retention
+
 
-STORAGE_DIR = r'd:/smart_shrink_AI/storage'
+def cleanup_storage(max_age_days=None, quota_mb=None):
+    if max_age_days is not None:
+        retention.RETENTION_DAYS = max_age_days
+    if quota_mb is not None:
+        retention.STORAGE_QUOTA_MB = quota_mb
+    db_utils.init_db()
+    db_utils.backfill_retention(time.time())
+    return retention.collect()
 
-def cleanup_storage(storage_dir, max_age_days=7):
-    now = time.time()
-    for filename in os.listdir(storage_dir):
-        filepath = os.path.join(storage_dir, filename)
-        if os.path.isfile(filepath):
-            if now - os.path.getmtime(filepath) > max_age_days * 86400:
-                print(f"Deleting {filepath}")
-                os.remove(filepath)
 
 if __name__ == "__main__":
-    cleanup_storage(STORAGE_DIR, max_age_days=7)
+    parser = argparse.ArgumentParser(description="Hapus file kedaluwarsa dan tegakkan kuota storage")
+    parser.add_argument("--max-age-days", type=float, default=None, help=f"Default RETENTION_DAYS ({retention.RETENTION_DAYS})")
+    parser.add_argument("--quota-mb", type=int, default=None, help=f"Default STORAGE_QUOTA_MB ({retention.STORAGE_QUOTA_MB})")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(cleanup_storage(args.max_age_days, args.quota_mb))
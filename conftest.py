@@ -0,0 +1,39 @@
+"""
+Fixture pytest bersama untuk test backend yang tidak butuh server.
+
+- db_path: DB_PATH diarahkan ke file SQLite di tmp_path (belum di-init), koneksi thread test ditutup setelahnya.
+- db: seperti db_path, ditambah init_db. Nilai fixture adalah tmp_path, dipakai juga untuk file sementara.
+- client: TestClient untuk app FastAPI dengan STORAGE_DIR/RESULTS_DIR di tmp_path dan rate limit nonaktif
+  (event startup tidak dijalankan: tanpa GC, scrubber, maupun worker pool).
+"""
+import os
+
+import pytest
+
+from backend import db_utils
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'test.sqlite3')
+    monkeypatch.setattr(db_utils, 'DB_PATH', path)
+    yield path
+    db_utils.close()
+
+
+@pytest.fixture
+def db(db_path, tmp_path):
+    db_utils.init_db()
+    return tmp_path
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import main
+    storage_dir = str(db / 'storage')
+    monkeypatch.setattr(main, 'STORAGE_DIR', storage_dir)
+    monkeypatch.setattr(main, 'RESULTS_DIR', os.path.join(storage_dir, 'results'))
+    os.makedirs(main.RESULTS_DIR)
+    monkeypatch.setattr(main.limiter, 'enabled', False)
+    return TestClient(main.app, headers={"X-API-Key": main.API_KEYS[0]})
@@ -1,57 +1,559 @@
-import sqlite3
+"""
+Akses SQLite untuk metadata file, blob store, cache hasil, dan index retensi.
+
+Setiap thread memakai satu koneksi persisten (thread-local) yang dibuka sekali dengan WAL journaling,
+synchronous=NORMAL, dan busy timeout, jadi pembaca tidak memblokir penulis dan penulis paralel menunggu
+lock alih-alih langsung gagal "database is locked". Statement di-cache per koneksi (prepared sekali).
+Fungsi tulis berjalan dalam transaksi BEGIN IMMEDIATE lewat _write(): lock tulis diambil di awal,
+sehingga read-modify-write tidak gagal di tengah transaksi karena snapshot-nya sudah basi.
+
+Entry metadata file disimpan di tabel results dengan kolom bertipe ber-index (RESULT_COLUMNS) dan sisa
+field sebagai JSON di kolom extra; save/load memetakan dict entry ke kolom-kolom itu secara transparan.
+"""
+import os
 import json
-DB_PATH = 'results_db.sqlite3'
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Path absolut supaya semua proses memakai DB yang sama apa pun CWD-nya (default: sebelah folder backend)
+DB_PATH = os.path.abspath(os.environ.get('DB_PATH') or os.path.join(os.path.dirname(__file__), '../results_db.sqlite3'))
+# Lama penulis menunggu lock penulis lain sebelum menyerah (ms)
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '30000'))
+# Jumlah prepared statement yang di-cache per koneksi
+DB_STATEMENT_CACHE = 256
+
+_local = threading.local()
+
+# Kolom bertipe tabel results; field entry lain disimpan di kolom extra (JSON)
+RESULT_COLUMNS = (
+    ('status', 'TEXT'),
+    ('mime_type', 'TEXT'),
+    ('size_before', 'INTEGER'),
+    ('size_after', 'INTEGER'),
+    ('compression_method', 'TEXT'),
+    ('created_at', 'REAL'),
+    ('content_hash', 'TEXT'),
+    ('owner_key', 'TEXT'),
+)
+_RESULT_COLUMN_NAMES = [column for column, _ in RESULT_COLUMNS]
+_RESULT_SELECT = ', '.join(['data'] + _RESULT_COLUMN_NAMES + ['extra'])
+# created_at tidak pernah ditimpa; data (format lama) dikosongkan begitu baris ditulis dalam format baru.
+# Baris format lama tidak punya created_at: diambil dari entry lama (legacy_created_at), bukan waktu tulis
+_RESULT_UPSERT = (
+    f'INSERT INTO results (file_id, {", ".join(_RESULT_COLUMN_NAMES)}, extra) VALUES ({", ".join("?" * (len(RESULT_COLUMNS) + 2))}) '
+    f'ON CONFLICT(file_id) DO UPDATE SET {", ".join(f"{column}=excluded.{column}" for column in _RESULT_COLUMN_NAMES if column != "created_at")}, '
+    'created_at=CASE WHEN results.extra IS NULL THEN legacy_created_at(results.data) '
+    'ELSE COALESCE(results.created_at, excluded.created_at) END, extra=excluded.extra, data=NULL'
+)
+
+def _legacy_created_at(legacy):
+    """created_at entry format lama: timestamp di entry, atau mtime file upload/hasil; None jika tidak ada."""
+    try:
+        data = json.loads(legacy) if legacy else {}
+        if data.get('created_at'):
+            return data['created_at']
+        for key in ('file_path', 'output_path'):
+            if data.get(key) and os.path.exists(data[key]):
+                return os.path.getmtime(data[key])
+    except (ValueError, TypeError, AttributeError, OSError):
+        pass
+    return None
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           cached_statements=DB_STATEMENT_CACHE)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.create_function('legacy_created_at', 1, _legacy_created_at)
+    return conn
+
+def connection():
+    """Koneksi persisten milik thread ini; dibuka ulang jika DB_PATH berubah atau proses hasil fork."""
+    key = (DB_PATH, os.getpid())
+    if getattr(_local, 'key', None) != key:
+        _local.conn = _connect(DB_PATH)
+        _local.key = key
+    return _local.conn
+
+def close():
+    """Tutup koneksi thread ini (dibuka lagi otomatis saat dipakai)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+    _local.conn = None
+    _local.key = None
+
+def _read():
+    # Autocommit: setiap SELECT membaca snapshot terbaru tanpa menahan transaksi
+    return connection().cursor()
+
+@contextmanager
+def _write():
+    """Transaksi tulis (BEGIN IMMEDIATE). Exception membatalkan transaksi; dipanggil bersarang ikut transaksi luar."""
+    conn = connection()
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS results (
-        file_id TEXT PRIMARY KEY,
-        data TEXT
-    )''')
-    conn.commit()
-    conn.close()
+    with _write() as c:
+        # Field yang sering difilter punya kolom bertipe; sisa entry (path, fitur, timings, ...) di kolom extra (JSON).
+        # data: format lama (seluruh entry JSON); extra NULL = baris lama yang belum dimigrasi (lihat migrate_schema)
+        c.execute('''CREATE TABLE IF NOT EXISTS results (
+            file_id TEXT PRIMARY KEY,
+            data TEXT
+        )''')
+        columns = [row[1] for row in c.execute('PRAGMA table_info(results)')]
+        for column, column_type in RESULT_COLUMNS + (('extra', 'TEXT'),):
+            if column not in columns:
+                c.execute(f'ALTER TABLE results ADD COLUMN {column} {column_type}')
+        for column in ('status', 'mime_type', 'compression_method', 'created_at', 'content_hash'):
+            c.execute(f'CREATE INDEX IF NOT EXISTS idx_results_{column} ON results ({column})')
+        # Daftar file per pemilik, terbaru dulu
+        c.execute('CREATE INDEX IF NOT EXISTS idx_results_owner_created ON results (owner_key, created_at)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_results_legacy ON results (file_id) WHERE extra IS NULL')
+        c.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            status_code INTEGER,
+            media_type TEXT,
+            body TEXT,
+            created_at REAL
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at)')
+        # headers: header response yang ikut dikembalikan saat replay (JSON, misal Location)
+        if 'headers' not in [row[1] for row in c.execute('PRAGMA table_info(idempotency_keys)')]:
+            c.execute('ALTER TABLE idempotency_keys ADD COLUMN headers TEXT')
+        c.execute('''CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            path TEXT,
+            size INTEGER,
+            refcount INTEGER,
+            created_at REAL
+        )''')
+        # encoding: NULL = isi mentah, selain itu format kompresi lossless tempat blob disimpan (misal gzip)
+        if 'encoding' not in [row[1] for row in c.execute('PRAGMA table_info(blobs)')]:
+            c.execute('ALTER TABLE blobs ADD COLUMN encoding TEXT')
+        # pack_offset: NULL = blob file sendiri, selain itu offset blob di dalam segment packfile (path)
+        if 'pack_offset' not in [row[1] for row in c.execute('PRAGMA table_info(blobs)')]:
+            c.execute('ALTER TABLE blobs ADD COLUMN pack_offset INTEGER')
+        # checksum: checksum integritas isi mentah ('<algoritma>:<hex>'); verified_at/corrupt diisi oleh verifikasi
+        columns = [row[1] for row in c.execute('PRAGMA table_info(blobs)')]
+        if 'checksum' not in columns:
+            c.execute('ALTER TABLE blobs ADD COLUMN checksum TEXT')
+        if 'verified_at' not in columns:
+            c.execute('ALTER TABLE blobs ADD COLUMN verified_at REAL')
+        if 'corrupt' not in columns:
+            c.execute('ALTER TABLE blobs ADD COLUMN corrupt INTEGER NOT NULL DEFAULT 0')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_blobs_path ON blobs (path)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_blobs_verified ON blobs (verified_at)')
+        c.execute('''CREATE TABLE IF NOT EXISTS pack_segments (
+            path TEXT PRIMARY KEY,
+            root TEXT,
+            size INTEGER,
+            dead INTEGER
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS chunks (
+            hash TEXT PRIMARY KEY,
+            path TEXT,
+            size INTEGER,
+            refcount INTEGER,
+            created_at REAL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS result_cache (
+            cache_key TEXT PRIMARY KEY,
+            content_hash TEXT,
+            result_hash TEXT,
+            data TEXT
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_result ON result_cache (result_hash)')
+        c.execute('''CREATE TABLE IF NOT EXISTS retention (
+            file_id TEXT PRIMARY KEY,
+            created_at REAL,
+            last_access REAL,
+            expires_at REAL
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_retention_last_access ON retention (last_access)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_retention_expires ON retention (expires_at)')
+
+def _result_row(file_id, data, now):
+    extra = {key: value for key, value in data.items() if key not in _RESULT_COLUMN_NAMES}
+    values = [data.get(column) for column in _RESULT_COLUMN_NAMES]
+    values[_RESULT_COLUMN_NAMES.index('created_at')] = data.get('created_at') or now
+    return (file_id, *values, json.dumps(extra))
+
+def _result_entry(row):
+    # row: (data, kolom bertipe..., extra)
+    if row[-1] is None:
+        return json.loads(row[0])
+    data = json.loads(row[-1])
+    data.update({column: value for column, value in zip(_RESULT_COLUMN_NAMES, row[1:-1]) if value is not None})
+    return data
 
 def save_result(file_id, data):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('REPLACE INTO results (file_id, data) VALUES (?, ?)', (file_id, json.dumps(data)))
-    conn.commit()
-    conn.close()
+    with _write() as c:
+        c.execute(_RESULT_UPSERT, _result_row(file_id, data, time.time()))
+
+def save_results_many(items):
+    """Simpan banyak entry (list of (file_id, data)) dalam satu transaksi."""
+    now = time.time()
+    with _write() as c:
+        c.executemany(_RESULT_UPSERT, [_result_row(file_id, data, now) for file_id, data in items])
 
 def load_result(file_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT data FROM results WHERE file_id=?', (file_id,))
+    c = _read()
+    c.execute(f'SELECT {_RESULT_SELECT} FROM results WHERE file_id=?', (file_id,))
     row = c.fetchone()
-    conn.close()
     if row:
-        return json.loads(row[0])
+        return _result_entry(row)
     return None
 
 def update_result_field(file_id, field, value):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT data FROM results WHERE file_id=?', (file_id,))
-    row = c.fetchone()
-    if row:
-        data = json.loads(row[0])
-        data[field] = value
-        c.execute('REPLACE INTO results (file_id, data) VALUES (?, ?)', (file_id, json.dumps(data)))
-        conn.commit()
-    conn.close()
+    update_result_fields(file_id, {field: value})
+
+def update_result_fields(file_id, fields):
+    modify_result(file_id, lambda data: data.update(fields))
 
 def load_all_results():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT file_id, data FROM results')
+    c = _read()
+    c.execute(f'SELECT file_id, {_RESULT_SELECT} FROM results')
     rows = c.fetchall()
-    conn.close()
-    return {fid: json.loads(data) for fid, data in rows}
+    return {row[0]: _result_entry(row[1:]) for row in rows}
+
+def load_results_page(after, limit):
+    """Satu halaman entry urut file_id setelah cursor after (keyset, tanpa OFFSET). Return list of (file_id, data)."""
+    c = _read()
+    c.execute(f'SELECT file_id, {_RESULT_SELECT} FROM results WHERE file_id > ? ORDER BY file_id LIMIT ?', (after, limit))
+    return [(row[0], _result_entry(row[1:])) for row in c.fetchall()]
+
+def find_results(status=None, mime_type=None, compression_method=None, owner_key=None, created_after=None, limit=100):
+    """Cari entry lewat kolom ber-index (filter None diabaikan), terbaru dulu. Return list of (file_id, data)."""
+    filters = {"status": status, "mime_type": mime_type, "compression_method": compression_method, "owner_key": owner_key}
+    where = [f'{column}=?' for column, value in filters.items() if value is not None]
+    params = [value for value in filters.values() if value is not None]
+    if created_after is not None:
+        where.append('created_at > ?')
+        params.append(created_after)
+    c = _read()
+    c.execute(f'SELECT file_id, {_RESULT_SELECT} FROM results {"WHERE " + " AND ".join(where) if where else ""} '
+              'ORDER BY created_at DESC LIMIT ?', params + [limit])
+    return [(row[0], _result_entry(row[1:])) for row in c.fetchall()]
+
+def migrate_legacy_results(limit):
+    """
+    Pindahkan satu batch baris format lama ke kolom bertipe. created_at diambil dari entry lama atau mtime
+    file-nya (NULL jika keduanya tidak ada), bukan waktu migrasi. Return jumlah baris.
+    """
+    with _write() as c:
+        c.execute('SELECT file_id, data FROM results WHERE extra IS NULL LIMIT ?', (limit,))
+        rows = c.fetchall()
+        for file_id, legacy in rows:
+            c.execute(_RESULT_UPSERT, _result_row(file_id, json.loads(legacy), None))
+    return len(rows)
 
 def delete_result(file_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('DELETE FROM results WHERE file_id=?', (file_id,))
-    conn.commit()
-    conn.close()
+    with _write() as c:
+        c.execute('DELETE FROM results WHERE file_id=?', (file_id,))
+
+def reserve_idempotency_key(key, fingerprint, now, expire_before):
+    """
+    Klaim idempotency key untuk request baru. Entry yang lebih tua dari expire_before dibuang dulu.
+    Return None jika klaim berhasil, atau dict entry yang sudah ada (status_code None = masih diproses).
+    """
+    with _write() as c:
+        c.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (expire_before,))
+        c.execute('INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, created_at) VALUES (?, ?, ?)', (key, fingerprint, now))
+        claimed = c.rowcount == 1
+        row = None
+        if not claimed:
+            c.execute('SELECT fingerprint, status_code, media_type, body, headers FROM idempotency_keys WHERE key=?', (key,))
+            row = c.fetchone()
+    if row:
+        return {"fingerprint": row[0], "status_code": row[1], "media_type": row[2], "body": row[3],
+                "headers": json.loads(row[4]) if row[4] else {}}
+    return None
+
+def complete_idempotency_key(key, status_code, media_type, body, headers=None):
+    with _write() as c:
+        c.execute('UPDATE idempotency_keys SET status_code=?, media_type=?, body=?, headers=? WHERE key=?',
+                  (status_code, media_type, body, json.dumps(headers) if headers else None, key))
+
+def release_idempotency_key(key):
+    with _write() as c:
+        c.execute('DELETE FROM idempotency_keys WHERE key=? AND status_code IS NULL', (key,))
+
+_ACQUIRE_INSERT = ('INSERT OR IGNORE INTO blobs (hash, path, size, refcount, created_at, pack_offset, encoding, checksum) '
+                   'VALUES (?, ?, ?, 0, ?, ?, ?, ?)')
+# Checksum yang sudah tercatat tidak ditimpa (None = tidak diketahui, misal blob yang di-acquire ulang)
+_ACQUIRE_UPDATE = 'UPDATE blobs SET refcount = refcount + 1, path=?, pack_offset=?, encoding=?, checksum=COALESCE(checksum, ?) WHERE hash=?'
+
+def acquire_blob(content_hash, path, size, now, pack_offset=None, encoding=None, checksum=None):
+    """Tambah satu referensi ke blob (buat baris baru jika belum ada). Return refcount terbaru."""
+    with _write() as c:
+        c.execute(_ACQUIRE_INSERT, (content_hash, path, size, now, pack_offset, encoding, checksum))
+        c.execute(_ACQUIRE_UPDATE, (path, pack_offset, encoding, checksum, content_hash))
+        c.execute('SELECT refcount FROM blobs WHERE hash=?', (content_hash,))
+        refcount = c.fetchone()[0]
+    return refcount
+
+def acquire_blobs(items, now):
+    """acquire_blob untuk banyak blob (list of (hash, path, size, pack_offset, encoding, checksum)) dalam satu transaksi. Return list refcount."""
+    with _write() as c:
+        refcounts = []
+        for content_hash, path, size, pack_offset, encoding, checksum in items:
+            c.execute(_ACQUIRE_INSERT, (content_hash, path, size, now, pack_offset, encoding, checksum))
+            c.execute(_ACQUIRE_UPDATE, (path, pack_offset, encoding, checksum, content_hash))
+            c.execute('SELECT refcount FROM blobs WHERE hash=?', (content_hash,))
+            refcounts.append(c.fetchone()[0])
+    return refcounts
+
+def list_blobs():
+    c = _read()
+    # Blob di packfile tidak punya path sendiri
+    c.execute('SELECT hash, path FROM blobs WHERE pack_offset IS NULL')
+    rows = c.fetchall()
+    return rows
+
+def update_blob_paths(items):
+    """Perbarui path banyak blob (list of (hash, path)) dalam satu transaksi."""
+    with _write() as c:
+        c.executemany('UPDATE blobs SET path=? WHERE hash=?', [(path, content_hash) for content_hash, path in items])
+
+def get_blob(content_hash):
+    c = _read()
+    c.execute('SELECT path, size, refcount, encoding, pack_offset, checksum, verified_at, corrupt FROM blobs WHERE hash=?', (content_hash,))
+    row = c.fetchone()
+    if row:
+        return {"path": row[0], "size": row[1], "refcount": row[2], "encoding": row[3], "pack_offset": row[4],
+                "checksum": row[5], "verified_at": row[6], "corrupt": bool(row[7])}
+    return None
+
+def set_blob_encoding(content_hash, encoding, size):
+    with _write() as c:
+        c.execute('UPDATE blobs SET encoding=?, size=? WHERE hash=?', (encoding, size, content_hash))
+
+def record_blob_check(content_hash, checksum, corrupt, now):
+    """
+    Catat hasil verifikasi isi blob. checksum mengisi kolom yang masih kosong (backfill blob lama).
+    Blob rusak dikeluarkan dari cache hasil supaya kompresi berikutnya tidak memakai hasil yang rusak.
+    """
+    with _write() as c:
+        c.execute('UPDATE blobs SET checksum=COALESCE(checksum, ?), corrupt=?, verified_at=? WHERE hash=?',
+                  (checksum, int(corrupt), now, content_hash))
+        if corrupt:
+            c.execute('DELETE FROM result_cache WHERE result_hash=?', (content_hash,))
+
+def blobs_to_scrub(verified_before, limit):
+    """Blob sehat yang belum pernah atau terakhir diverifikasi sebelum verified_before, yang paling lama dulu."""
+    c = _read()
+    c.execute('SELECT hash, path, checksum FROM blobs WHERE corrupt=0 AND (verified_at IS NULL OR verified_at < ?) '
+              'ORDER BY COALESCE(verified_at, 0) LIMIT ?', (verified_before, limit))
+    rows = c.fetchall()
+    return rows
+
+def release_blob(content_hash):
+    """
+    Kurangi satu referensi blob. Jika refcount habis, baris blob dan cache hasil yang menunjuk
+    ke blob itu dihapus, lalu path blob dikembalikan supaya file-nya bisa dihapus. Selain itu return None.
+    Blob di packfile tidak dikembalikan path-nya; byte-nya dicatat sebagai dead di segment untuk compaction.
+    """
+    with _write() as c:
+        c.execute('UPDATE blobs SET refcount = refcount - 1 WHERE hash=? AND refcount > 0', (content_hash,))
+        c.execute('SELECT path, refcount, size, pack_offset FROM blobs WHERE hash=?', (content_hash,))
+        row = c.fetchone()
+        path = None
+        if row and row[1] <= 0:
+            if row[3] is None:
+                path = row[0]
+            else:
+                c.execute('UPDATE pack_segments SET dead = dead + ? WHERE path=?', (row[2], row[0]))
+            c.execute('DELETE FROM blobs WHERE hash=?', (content_hash,))
+            c.execute('DELETE FROM result_cache WHERE result_hash=?', (content_hash,))
+    return path
+
+def save_pack_segment(path, root, size):
+    with _write() as c:
+        c.execute('INSERT INTO pack_segments (path, root, size, dead) VALUES (?, ?, ?, 0) '
+                  'ON CONFLICT(path) DO UPDATE SET size=excluded.size', (path, root, size))
+
+def pack_segments_to_compact(ratio):
+    """Segment yang byte mati-nya >= ratio dari ukurannya, paling banyak byte mati dulu."""
+    c = _read()
+    c.execute('SELECT path FROM pack_segments WHERE dead > 0 AND dead >= size * ? ORDER BY dead DESC', (ratio,))
+    rows = c.fetchall()
+    return [row[0] for row in rows]
+
+def pack_blobs(segment):
+    """Blob hidup di satu segment: list of (hash, offset, size) urut offset."""
+    c = _read()
+    c.execute('SELECT hash, pack_offset, size FROM blobs WHERE path=? AND pack_offset IS NOT NULL ORDER BY pack_offset', (segment,))
+    rows = c.fetchall()
+    return rows
+
+def replace_pack_segment(segment, offsets, size):
+    """Catat hasil compaction: offset baru (list of (hash, offset)) dan ukuran segment, dalam satu transaksi."""
+    with _write() as c:
+        c.executemany('UPDATE blobs SET pack_offset=? WHERE hash=? AND path=?', [(offset, content_hash, segment) for content_hash, offset in offsets])
+        c.execute('UPDATE pack_segments SET size=?, dead=0 WHERE path=?', (size, segment))
+
+def delete_pack_segment(segment):
+    with _write() as c:
+        c.execute('DELETE FROM pack_segments WHERE path=?', (segment,))
+
+def acquire_chunks(items, now):
+    """
+    Tambah satu referensi per kemunculan chunk (list of (hash, path, size)) dalam satu transaksi.
+    Return dict hash -> path tersimpan (bisa berbeda dari path usulan jika chunk sudah ada).
+    """
+    with _write() as c:
+        c.executemany('INSERT OR IGNORE INTO chunks (hash, path, size, refcount, created_at) VALUES (?, ?, ?, 0, ?)',
+                      [(chunk_hash, path, size, now) for chunk_hash, path, size in items])
+        c.executemany('UPDATE chunks SET refcount = refcount + 1 WHERE hash=?', [(chunk_hash,) for chunk_hash, _, _ in items])
+    return chunk_paths([chunk_hash for chunk_hash, _, _ in items])
+
+def release_chunks(hashes):
+    """Lepas satu referensi per kemunculan chunk. Return path chunk yang refcount-nya habis (barisnya dihapus)."""
+    with _write() as c:
+        c.executemany('UPDATE chunks SET refcount = refcount - 1 WHERE hash=? AND refcount > 0', [(chunk_hash,) for chunk_hash in hashes])
+        c.execute('SELECT path FROM chunks WHERE refcount <= 0')
+        paths = [row[0] for row in c.fetchall()]
+        c.execute('DELETE FROM chunks WHERE refcount <= 0')
+    return paths
+
+def _chunk_rows(columns, hashes):
+    hashes = list(set(hashes))
+    c = _read()
+    rows = []
+    # Batas jumlah parameter SQLite
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        c.execute(f'SELECT hash, {columns} FROM chunks WHERE hash IN ({",".join("?" * len(batch))})', batch)
+        rows.extend(c.fetchall())
+    return rows
+
+def chunk_paths(hashes):
+    return {chunk_hash: path for chunk_hash, path in _chunk_rows('path', hashes)}
+
+def chunk_refcounts(hashes):
+    return {chunk_hash: refcount for chunk_hash, refcount in _chunk_rows('refcount', hashes)}
+
+def list_chunks():
+    c = _read()
+    c.execute('SELECT hash, path FROM chunks')
+    rows = c.fetchall()
+    return rows
+
+def update_chunk_paths(items):
+    """Perbarui path banyak chunk (list of (hash, path)) dalam satu transaksi."""
+    with _write() as c:
+        c.executemany('UPDATE chunks SET path=? WHERE hash=?', [(path, chunk_hash) for chunk_hash, path in items])
+
+def load_cached_result(cache_key):
+    c = _read()
+    c.execute('SELECT data FROM result_cache WHERE cache_key=?', (cache_key,))
+    row = c.fetchone()
+    if row:
+        return json.loads(row[0])
+    return None
+
+def save_cached_result(cache_key, data):
+    with _write() as c:
+        c.execute('REPLACE INTO result_cache (cache_key, content_hash, result_hash, data) VALUES (?, ?, ?, ?)',
+                  (cache_key, data["content_hash"], data["result_hash"], json.dumps(data)))
+
+def delete_cached_result(cache_key):
+    with _write() as c:
+        c.execute('DELETE FROM result_cache WHERE cache_key=?', (cache_key,))
+
+def modify_result(file_id, modify):
+    """
+    Read-modify-write atomik untuk satu entry: modify(data) mengubah dict di tempat di dalam
+    transaksi BEGIN IMMEDIATE, sehingga penulis paralel tidak saling menimpa. Exception dari
+    modify membatalkan transaksi. Return data terbaru, atau None jika file_id tidak ada.
+    """
+    with _write() as c:
+        c.execute(f'SELECT {_RESULT_SELECT} FROM results WHERE file_id=?', (file_id,))
+        row = c.fetchone()
+        if not row:
+            return None
+        data = _result_entry(row)
+        modify(data)
+        c.execute(_RESULT_UPSERT, _result_row(file_id, data, time.time()))
+    return data
+
+def touch_files(file_ids, now, expires_at=None):
+    """Catat akses terakhir (dan opsional waktu kedaluwarsa eksplisit) untuk index retensi."""
+    with _write() as c:
+        c.executemany('''INSERT INTO retention (file_id, created_at, last_access, expires_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(file_id) DO UPDATE SET last_access=excluded.last_access,
+            expires_at=COALESCE(excluded.expires_at, retention.expires_at)''',
+            [(file_id, now, now, expires_at) for file_id in file_ids])
+
+def clear_expiry(file_id):
+    with _write() as c:
+        c.execute('UPDATE retention SET expires_at=NULL WHERE file_id=?', (file_id,))
+
+def backfill_retention(now):
+    """Entry yang belum punya baris retensi (data lama) dianggap diakses sekarang."""
+    with _write() as c:
+        c.execute('INSERT OR IGNORE INTO retention (file_id, created_at, last_access) SELECT file_id, ?, ? FROM results', (now, now))
+        count = c.rowcount
+    return count
+
+def expired_file_ids(now, access_before, limit, after=''):
+    """file_id kedaluwarsa urut file_id, mulai setelah cursor after."""
+    c = _read()
+    c.execute('''SELECT file_id FROM retention WHERE expires_at < ? AND file_id > ?
+        UNION SELECT file_id FROM retention WHERE last_access < ? AND file_id > ?
+        ORDER BY file_id LIMIT ?''', (now, after, access_before, after, limit))
+    rows = c.fetchall()
+    return [row[0] for row in rows]
+
+def lru_file_ids(limit, offset=0):
+    c = _read()
+    c.execute('SELECT file_id FROM retention ORDER BY last_access LIMIT ? OFFSET ?', (limit, offset))
+    rows = c.fetchall()
+    return [row[0] for row in rows]
+
+def blob_usage():
+    """Total byte semua blob (original + hasil, sudah terdeduplikasi), chunk CDC, dan byte mati packfile yang belum di-compact."""
+    c = _read()
+    c.execute('SELECT COALESCE(SUM(size), 0) FROM blobs')
+    total = c.fetchone()[0]
+    c.execute('SELECT COALESCE(SUM(dead), 0) FROM pack_segments')
+    total += c.fetchone()[0]
+    c.execute('SELECT COALESCE(SUM(size), 0) FROM chunks')
+    total += c.fetchone()[0]
+    return total
+
+def patch_owners(paths):
+    """Return {path: set file_id} semua entry yang mencatat path di field patches."""
+    c = _read()
+    c.execute(f'''SELECT r.file_id, p.value FROM results r, json_each(COALESCE(r.extra, r.data), '$.patches') p
+        WHERE p.value IN ({",".join("?" * len(paths))})''', list(paths))
+    owners = {path: set() for path in paths}
+    for file_id, path in c.fetchall():
+        owners[path].add(file_id)
+    return owners
+
+def load_results_many(file_ids):
+    c = _read()
+    c.execute(f'SELECT file_id, {_RESULT_SELECT} FROM results WHERE file_id IN ({",".join("?" * len(file_ids))})', list(file_ids))
+    rows = c.fetchall()
+    return {row[0]: _result_entry(row[1:]) for row in rows}
+
+def delete_results_many(file_ids):
+    """Hapus metadata dan baris retensi banyak file dalam satu transaksi."""
+    with _write() as c:
+        c.executemany('DELETE FROM results WHERE file_id=?', [(file_id,) for file_id in file_ids])
+        c.executemany('DELETE FROM retention WHERE file_id=?', [(file_id,) for file_id in file_ids])
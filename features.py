@@ -0,0 +1,78 @@
+"""
+Ekstraksi fitur file sekali saat ingest.
+
+FeatureExtractor diberi blok-blok byte yang sama dengan yang ditulis ke disk (dan di-hash), jadi
+entropi, format (magic number), dan resolusi gambar didapat tanpa membaca ulang file. Jumlah halaman
+PDF butuh xref di akhir file, sehingga dihitung sekali dari file yang sudah ditulis.
+Hasilnya disimpan di metadata (entry["features"]) dan dipakai selector, estimasi biaya job, dan codec.
+"""
+import io
+import math
+import logging
+from collections import Counter
+
+from backend import utils
+
+# Jumlah byte awal yang dipakai untuk entropi dan header gambar
+SAMPLE_BYTES = 1024 * 1024
+
+
+class FeatureExtractor:
+    def __init__(self):
+        self.sample = bytearray()
+        self.size = 0
+
+    def update(self, block):
+        self.size += len(block)
+        if len(self.sample) < SAMPLE_BYTES:
+            self.sample += block[:SAMPLE_BYTES - len(self.sample)]
+
+    def finish(self, path, mime_type=None, content_hash=None):
+        """Return dict fitur: entropy, format, img_res, pdf_pages, size, content_hash."""
+        sample = bytes(self.sample)
+        fmt = utils.sniff_mime(sample[:utils.SNIFF_BYTES])
+        mime_type = mime_type or fmt or ""
+        features = {
+            "entropy": entropy(sample),
+            "format": fmt,
+            "img_res": None,
+            "pdf_pages": None,
+            "size": self.size,
+            "content_hash": content_hash,
+        }
+        try:
+            if mime_type.startswith("image/"):
+                features["img_res"] = image_resolution(sample)
+            if path and (mime_type == "application/pdf" or fmt == "application/pdf"):
+                features["pdf_pages"] = utils.pdf_page_count(path)
+        except Exception as e:
+            logging.warning(f"Gagal ekstraksi fitur: {path} | Error: {e}")
+        return features
+
+
+def entropy(data):
+    """Entropi byte (bit per byte, 0-8) dari sampel data."""
+    if not data:
+        return 0
+    total = len(data)
+    return -sum(c / total * math.log2(c / total) for c in Counter(data).values())
+
+
+def image_resolution(sample):
+    """Resolusi gambar dari header di sampel byte awal (Pillow hanya membaca header)."""
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(sample)) as img:
+            return list(img.size)
+    except Exception:
+        return None
+
+
+def extract_file(path, mime_type=None, content_hash=None):
+    """Fitur untuk file yang sudah ada di disk (entry lama tanpa fitur), cukup membaca sampel awal."""
+    extractor = FeatureExtractor()
+    with open(path, 'rb') as f:
+        extractor.update(f.read(SAMPLE_BYTES))
+        f.seek(0, 2)
+        extractor.size = f.tell()
+    return extractor.finish(path, mime_type, content_hash)
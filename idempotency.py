@@ -0,0 +1,60 @@
+"""
+Dukungan header Idempotency-Key untuk /compress dan /batch_compress.
+
+Response pertama untuk sebuah key disimpan di SQLite dan dikembalikan apa adanya untuk
+request ulang dengan key yang sama selama IDEMPOTENCY_TTL detik, tanpa mendaftarkan job
+baru atau menimpa metadata, termasuk header penting seperti Location. Key dibedakan per pemilik
+(fingerprint API key dari main.owner_key, API key mentah tidak disimpan) dan per endpoint.
+"""
+import os
+import json
+import time
+import hashlib
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from backend import db_utils
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+
+
+def scoped_key(owner, endpoint, key):
+    """owner: fingerprint API key (main.owner_key), bukan API key mentah."""
+    return f"{owner}:{endpoint}:{key}"
+
+
+def fingerprint(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def begin(key, payload):
+    """
+    Klaim key untuk request ini. Return Response tersimpan jika request ini adalah replay,
+    atau None jika request harus diproses (lalu panggil complete/release).
+    """
+    now = time.time()
+    fp = fingerprint(payload)
+    existing = db_utils.reserve_idempotency_key(key, fp, now, now - IDEMPOTENCY_TTL)
+    if existing is None:
+        return None
+    if existing["fingerprint"] != fp:
+        raise HTTPException(status_code=422, detail="Idempotency-Key sudah dipakai untuk request dengan isi berbeda")
+    if existing["status_code"] is None:
+        raise HTTPException(status_code=409, detail="Request dengan Idempotency-Key ini masih diproses")
+    return Response(
+        content=existing["body"],
+        status_code=existing["status_code"],
+        media_type=existing["media_type"],
+        headers=dict(existing["headers"], **{"Idempotent-Replayed": "true"})
+    )
+
+
+def complete(key, status_code, body, media_type="application/json", headers=None):
+    """Simpan response final untuk key. body berupa string (JSON/NDJSON), headers ikut dikembalikan saat replay."""
+    db_utils.complete_idempotency_key(key, status_code, media_type, body, headers)
+
+
+def release(key):
+    """Lepas klaim key tanpa menyimpan response (request gagal), supaya client bisa retry."""
+    db_utils.release_idempotency_key(key)
@@ -0,0 +1,324 @@
+"""
+Ingest upload secara streaming.
+
+Body multipart dibaca langsung dari request stream dan bagian file ditulis sekali lewat writer backend
+storage (tanpa spool ke temp file lalu disalin lagi): file di STORAGE_DIR untuk backend fs, multipart upload
+ke object staging untuk backend s3 (file tidak pernah ditulis ke disk lokal). Dalam pass yang sama:
+- upload dibatalkan begitu ukurannya melewati batas (413), file parsial dihapus,
+- field form biasa (bukan file) dibatasi total MAX_FIELD_BYTES di memori (413),
+- content hash (BLAKE2b-256) dan checksum integritas cepat (xxh3-64, fallback CRC32) dihitung,
+- byte awal disimpan untuk deteksi format (magic number), dan
+- fitur file (entropi, resolusi, dsb.) dikumpulkan lewat features.FeatureExtractor.
+Penulisan dan hashing dijalankan di threadpool per blok supaya event loop tidak terblokir.
+"""
+import os
+import zlib
+import uuid
+import asyncio
+import hashlib
+import mimetypes
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from backend import utils
+from backend import storage
+from backend import features
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', '500'))
+# Ukuran blok yang dikumpulkan sebelum ditulis ke disk di threadpool
+WRITE_BLOCK = 1024 * 1024
+# Total ukuran field form biasa per request (di-buffer di memori, bukan di-stream ke disk)
+MAX_FIELD_BYTES = 64 * 1024
+HASH_NAME = 'blake2b-256'
+# Checksum integritas (deteksi file rusak/terpotong, bukan identitas isi): xxh3-64 jika paket xxhash ada
+CHECKSUM_NAME = 'xxh3_64' if xxhash is not None else 'crc32'
+
+# Fallback MIME berbasis ekstensi (menimpa hasil mimetypes)
+EXT_MIME_TYPES = {
+    '.rar': 'application/x-rar-compressed',
+    '.7z': 'application/x-7z-compressed',
+    '.tar': 'application/x-tar',
+    '.gz': 'application/gzip',
+    '.doc': 'application/msword',
+    '.xls': 'application/vnd.ms-excel',
+    '.ppt': 'application/vnd.ms-powerpoint',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.gif': 'image/gif',
+    '.tiff': 'image/tiff',
+    '.bmp': 'image/bmp',
+    '.csv': 'text/csv',
+    '.json': 'application/json',
+    '.xml': 'application/xml',
+    '.html': 'text/html',
+}
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+
+class Checksum:
+    """Checksum streaming; value() berformat '<algoritma>:<hex>' supaya algoritma lama tetap bisa diverifikasi."""
+
+    def __init__(self, name=CHECKSUM_NAME):
+        if not checksum_supported(name):
+            raise ValueError(f"Algoritma checksum tidak tersedia: {name}")
+        self.name = name
+        self._xxh = xxhash.xxh3_64() if name == 'xxh3_64' else None
+        self._crc = 0
+
+    def update(self, data):
+        if self._xxh is not None:
+            self._xxh.update(data)
+        else:
+            self._crc = zlib.crc32(data, self._crc)
+
+    def value(self):
+        digest = self._xxh.hexdigest() if self._xxh is not None else format(self._crc, '08x')
+        return f"{self.name}:{digest}"
+
+
+def checksum_supported(name):
+    """name boleh nama algoritma atau nilai checksum lengkap ('<algoritma>:<hex>')."""
+    name = name.split(':', 1)[0]
+    return name == 'crc32' or (name == 'xxh3_64' and xxhash is not None)
+
+
+def detect_mime(filename, content_type=None, head=b""):
+    """MIME dari ekstensi, lalu Content-Type part, lalu magic number dari byte awal file."""
+    ext = os.path.splitext(filename)[1].lower()
+    mime_type = EXT_MIME_TYPES.get(ext) or mimetypes.guess_type(filename)[0] or content_type
+    if not mime_type or mime_type == 'application/octet-stream':
+        mime_type = utils.sniff_mime(head) or mime_type
+    return mime_type
+
+
+def safe_filename(filename):
+    name = os.path.basename((filename or '').replace('\\', '/'))
+    return name or 'upload'
+
+
+class _UploadTooLarge(Exception):
+    pass
+
+
+class _MultipartIngest:
+    def __init__(self, storage_dir, max_bytes, max_files):
+        self.storage_dir = storage_dir
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.files = []
+        self.fields = {}
+        self._field_bytes = 0
+        self._part = None
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._content_type = None
+
+    # --- callback parser (sinkron, tanpa I/O berat) ---
+
+    def on_part_begin(self):
+        self._part = {"data": bytearray(), "file": None}
+        self._disposition = b""
+        self._content_type = None
+
+    def on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        name = self._header_name.lower()
+        if name == b"content-disposition":
+            self._disposition = self._header_value
+        elif name == b"content-type":
+            self._content_type = self._header_value.decode('latin-1')
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._part["name"] = options.get(b"name", b"").decode('utf-8', errors='replace')
+        if b"filename" not in options:
+            return
+        if len(self.files) >= self.max_files:
+            raise HTTPException(status_code=400, detail=f"Terlalu banyak file (maksimal {self.max_files})")
+        filename = safe_filename(options[b"filename"].decode('utf-8', errors='replace'))
+        file_id = str(uuid.uuid4())
+        upload = {
+            "file_id": file_id,
+            "field": self._part["name"],
+            "filename": filename,
+            "content_type": self._content_type,
+            "file_path": os.path.join(self.storage_dir, file_id + '_' + filename),
+            "size": 0,
+            "head": b"",
+            "hasher": new_hasher(),
+            "checksum": Checksum(),
+            "features": features.FeatureExtractor(),
+            "pending": bytearray(),
+            "done": False,
+            "closing": False,
+            "writer": None,
+            "fh": None,
+        }
+        upload["fh"] = storage.backend.writer(upload["file_path"])
+        self.files.append(upload)
+        self._part["file"] = upload
+
+    def on_part_data(self, data, start, end):
+        upload = self._part["file"]
+        if upload is None:
+            self._field_bytes += end - start
+            if self._field_bytes > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Field form terlalu besar (maksimal {MAX_FIELD_BYTES // 1024}KB)")
+            self._part["data"] += data[start:end]
+            return
+        chunk = data[start:end]
+        upload["size"] += len(chunk)
+        if upload["size"] > self.max_bytes:
+            raise _UploadTooLarge(upload["filename"])
+        if len(upload["head"]) < utils.SNIFF_BYTES:
+            upload["head"] += chunk[:utils.SNIFF_BYTES - len(upload["head"])]
+        upload["pending"] += chunk
+
+    def on_part_end(self):
+        if self._part["file"] is None:
+            self.fields[self._part["name"]] = self._part["data"].decode('utf-8', errors='replace')
+        else:
+            self._part["file"]["done"] = True
+
+    # --- I/O di threadpool ---
+
+    @staticmethod
+    def _write_block(upload, block, close):
+        if block:
+            upload["hasher"].update(block)
+            upload["checksum"].update(block)
+            upload["features"].update(block)
+            upload["fh"].write(block)
+        if close:
+            upload["fh"].close()
+            upload["fh"] = None
+
+    async def _flush(self):
+        # Satu tulisan per file boleh berjalan di threadpool sementara parser membaca chunk berikutnya
+        # (double buffering); tulisan berikutnya untuk file yang sama menunggu yang sebelumnya selesai.
+        for upload in self.files:
+            if upload["closing"]:
+                continue
+            if len(upload["pending"]) >= WRITE_BLOCK or upload["done"]:
+                block = bytes(upload["pending"])
+                upload["pending"].clear()
+                upload["closing"] = upload["done"]
+                if upload["writer"] is not None:
+                    await upload["writer"]
+                upload["writer"] = asyncio.ensure_future(run_in_threadpool(self._write_block, upload, block, upload["done"]))
+
+    async def _drain(self):
+        for upload in self.files:
+            if upload["writer"] is not None:
+                await upload["writer"]
+                upload["writer"] = None
+
+    async def _drain_quietly(self):
+        for upload in self.files:
+            if upload["writer"] is not None:
+                try:
+                    await upload["writer"]
+                except Exception:
+                    pass
+                upload["writer"] = None
+
+    def _cleanup(self):
+        for upload in self.files:
+            if upload["fh"] is not None:
+                upload["fh"].abort()
+                upload["fh"] = None
+            else:
+                storage.backend.delete(upload["file_path"])
+
+    async def parse(self, request):
+        _, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise HTTPException(status_code=400, detail="Body harus multipart/form-data")
+        callbacks = {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+        parser = multipart.MultipartParser(boundary, callbacks)
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await self._flush()
+            parser.finalize()
+            await self._flush()
+            await self._drain()
+        except _UploadTooLarge:
+            await self._drain_quietly()
+            await run_in_threadpool(self._cleanup)
+            raise HTTPException(status_code=413, detail=f"File terlalu besar (maksimal {self.max_bytes // (1024 * 1024)}MB)")
+        except BaseException:
+            await self._drain_quietly()
+            await run_in_threadpool(self._cleanup)
+            raise
+        return [
+            {
+                "file_id": u["file_id"],
+                "field": u["field"],
+                "filename": u["filename"],
+                "content_type": u["content_type"],
+                "file_path": u["file_path"],
+                "size": u["size"],
+                "head": u["head"],
+                "content_hash": u["hasher"].hexdigest(),
+                "checksum": u["checksum"].value(),
+                "features": u["features"],
+                "staged": not storage.backend.local,
+            }
+            for u in self.files
+        ], self.fields
+
+
+def discard(files):
+    """Hapus file hasil receive_files yang tidak jadi dipakai (lokal maupun object staging)."""
+    for upload in files:
+        storage.backend.delete(upload["file_path"])
+
+
+async def receive_files(request, storage_dir, max_bytes=None, max_files=1):
+    """
+    Stream body multipart request ke storage_dir. Return (files, fields): files berisi dict
+    {file_id, field, filename, content_type, file_path, size, head, content_hash, checksum, features, staged}
+    per part file, fields berisi field form biasa; features adalah FeatureExtractor yang tinggal di-finish().
+    staged True berarti file_path adalah object di backend storage (bukan file lokal), lihat blobstore.adopt.
+    Raise HTTPException 413 jika file melewati max_bytes atau field form melewati MAX_FIELD_BYTES.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_MB * 1024 * 1024
+    content_length = request.headers.get("content-length")
+    # Tolak sebelum membaca body jika Content-Length sudah jelas melewati batas (+ ruang untuk header multipart)
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes * max_files + 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"File terlalu besar (maksimal {max_bytes // (1024 * 1024)}MB)")
+    return await _MultipartIngest(storage_dir, max_bytes, max_files).parse(request)
@@ -0,0 +1,369 @@
+"""
+Antrian job kompresi asinkron.
+
+/compress dan /batch_compress hanya mendaftarkan job lalu langsung mengembalikan 202.
+Worker thread terbatas menjalankan pipeline di background, dan status job
+(queued -> running -> compressed/failed) ditulis ke metadata file supaya /result/{file_id}
+bisa dipantau.
+
+Setiap job diberi estimasi biaya (detik) dari size_before dibagi throughput historis codec-nya,
+lalu dimasukkan ke lane "small" atau "large" yang punya worker sendiri, sehingga file besar
+(MP4 ratusan MB, PDF ratusan halaman) tidak menahan job kecil. Di dalam lane, job diurutkan
+shortest-job-first dengan kunci (waktu masuk + estimasi biaya) supaya job besar tidak kelaparan.
+
+Di setiap lane, job diantrekan per API key (tenant) dan dijadwalkan dengan weighted fair queueing:
+tenant dengan virtual finish time terkecil (biaya kumulatif dibagi bobot TENANT_WEIGHTS) dilayani
+lebih dulu, sehingga satu tenant yang mengirim batch besar tidak menaikkan latensi tenant lain.
+"""
+import os
+import time
+import uuid
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+from fastapi import HTTPException
+
+from backend import db_utils
+from backend import pipeline
+from backend import supervisor
+from backend import retention
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+LARGE_JOB_WORKERS = int(os.environ.get('LARGE_JOB_WORKERS', str(max(1, JOB_WORKERS // 2))))
+# Job dengan estimasi biaya di atas batas ini (detik) masuk lane "large"
+LARGE_JOB_SECONDS = float(os.environ.get('LARGE_JOB_SECONDS', '5'))
+# Job yang sudah selesai dibuang dari memori setelah JOB_TTL detik
+JOB_TTL = int(os.environ.get('JOB_TTL', '3600'))
+
+# Throughput awal (byte/detik) per codec sebelum ada riwayat; diperbarui dengan EWMA tiap job selesai
+DEFAULT_THROUGHPUT = {
+    "copy": 200 * 1024 * 1024,
+    "gzip": 30 * 1024 * 1024,
+    "webp": 10 * 1024 * 1024,
+    "office_optimize": 5 * 1024 * 1024,
+    "pdf_optimize": 1 * 1024 * 1024,
+    "ffmpeg": 512 * 1024,
+}
+THROUGHPUT_ALPHA = 0.2
+_throughput = dict(DEFAULT_THROUGHPUT)
+
+# Bobot per API key untuk weighted fair queueing, format "key1:4,key2:1" (default bobot 1)
+TENANT_WEIGHTS = {
+    k.strip(): float(w) for k, _, w in (
+        pair.partition(':') for pair in os.environ.get('TENANT_WEIGHTS', '').split(',') if ':' in pair
+    )
+}
+# Biaya minimum per job di perhitungan fair queueing, supaya job sangat kecil tetap terhitung
+MIN_FAIR_COST = 0.01
+
+# queues: tenant -> heap job, finish: tenant -> virtual finish time terakhir, vtime: virtual clock lane
+LANES = {
+    "small": {"workers": JOB_WORKERS, "queues": {}, "finish": {}, "vtime": 0.0, "threads": []},
+    "large": {"workers": LARGE_JOB_WORKERS, "queues": {}, "finish": {}, "vtime": 0.0, "threads": []},
+}
+_seq = itertools.count()
+_stopping = False
+
+_jobs = {}
+# Single-flight: (file_id, codec, profile, sensitive_mode) -> job yang sedang queued/running
+_inflight = {}
+_lock = threading.Lock()
+_queue_ready = threading.Condition(_lock)
+
+
+def error_info(e, default_status=500):
+    """Ubah exception menjadi dict error {status_code, detail} untuk response/metadata."""
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "detail": e.detail}
+    return {"status_code": getattr(e, 'status_code', default_status), "detail": str(e)}
+
+
+def _prune():
+    cutoff = time.time() - JOB_TTL
+    with _lock:
+        for job_id in [j for j, job in _jobs.items() if job.get("finished_at") and job["finished_at"] < cutoff]:
+            del _jobs[job_id]
+
+
+def estimate_cost(entry):
+    """Estimasi durasi encode (detik) dari ukuran file dan throughput historis codec-nya."""
+    ext = os.path.splitext(entry.get("original_filename") or "")[1].lower()
+    mime_type = entry.get("mime_type")
+    if not mime_type or mime_type == "application/octet-stream":
+        mime_type = (entry.get("features") or {}).get("format") or mime_type
+    codec = pipeline.lookup_codec(mime_type, ext)
+    name = codec.name if codec else "copy"
+    throughput = _throughput.get(name) or DEFAULT_THROUGHPUT["gzip"]
+    return name, (entry.get("size_before") or 0) / throughput
+
+
+def record_throughput(codec_name, size, seconds):
+    if not codec_name or not size or not seconds or seconds <= 0:
+        return
+    observed = size / seconds
+    with _lock:
+        previous = _throughput.get(codec_name, observed)
+        _throughput[codec_name] = (1 - THROUGHPUT_ALPHA) * previous + THROUGHPUT_ALPHA * observed
+
+
+def tenant_weight(tenant):
+    return max(TENANT_WEIGHTS.get(tenant, 1.0), 0.001)
+
+
+def _dequeue(lane):
+    """
+    Ambil job berikutnya dari lane (dipanggil dengan _lock dipegang), gaya start-time fair queueing:
+    tenant dengan virtual finish terkecil (finish tenant + biaya job terdepan / bobot) dilayani,
+    lalu virtual clock lane maju ke start tag job tersebut.
+    """
+    best = None
+    for tenant, queue in lane["queues"].items():
+        cost = max(queue[0][2][0]["estimated_seconds"], MIN_FAIR_COST)
+        start = lane["finish"].get(tenant, 0.0)
+        finish = start + cost / tenant_weight(tenant)
+        if best is None or finish < best[0]:
+            best = (finish, start, tenant)
+    if best is None:
+        return None
+    finish, start, tenant = best
+    lane["finish"][tenant] = finish
+    lane["vtime"] = max(lane["vtime"], start)
+    queue = lane["queues"][tenant]
+    _, _, task = heapq.heappop(queue)
+    if not queue:
+        del lane["queues"][tenant]
+    return task
+
+
+def _enqueue(lane, tenant, sort_key, task):
+    # Tenant yang baru aktif lagi mulai dari virtual clock sekarang, tanpa "tabungan" dari masa idle
+    if tenant not in lane["queues"]:
+        lane["finish"][tenant] = max(lane["finish"].get(tenant, 0.0), lane["vtime"])
+    heapq.heappush(lane["queues"].setdefault(tenant, []), (sort_key, next(_seq), task))
+
+
+def _worker(lane):
+    while True:
+        with _queue_ready:
+            task = None
+            while not _stopping:
+                task = _dequeue(lane)
+                if task is not None:
+                    break
+                _queue_ready.wait()
+            if _stopping:
+                return
+        try:
+            _run(*task)
+        except Exception as e:
+            # Error saat mencatat hasil job (misal DB) tidak boleh mematikan thread worker lane
+            logging.error(f"JOB WORKER ERROR: job_id={task[0]['job_id']}, file_id={task[0]['file_id']} | Error: {e}")
+
+
+def _ensure_workers():
+    # Dipanggil dengan _lock dipegang
+    for name, lane in LANES.items():
+        lane["threads"] = [t for t in lane["threads"] if t.is_alive()]
+        for i in range(len(lane["threads"]), lane["workers"]):
+            t = threading.Thread(target=_worker, args=(lane,), name=f"compress-job-{name}-{i}", daemon=True)
+            t.start()
+            lane["threads"].append(t)
+
+
+def queue_depth():
+    """Jumlah job yang menunggu di semua lane (belum dijalankan worker)."""
+    with _lock:
+        return sum(len(queue) for lane in LANES.values() for queue in lane["queues"].values())
+
+
+def _run(job, key, method, results_dir, sensitive_mode, profile):
+    try:
+        if job["cancel_event"].is_set():
+            raise supervisor.ToolCancelled("Job dibatalkan sebelum dijalankan")
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        db_utils.update_result_fields(job["file_id"], {"status": "running", "job_id": job["job_id"]})
+        with supervisor.cancel_scope(job["cancel_event"]):
+            entry = pipeline.run(job["file_id"], method, results_dir, sensitive_mode=sensitive_mode, profile=profile)
+        job["result"] = pipeline.build_response(job["file_id"], entry)
+        job["status"] = "done"
+        record_throughput(job["codec"], entry.get("size_before"), (entry.get("timings") or {}).get("encode"))
+        logging.info(f"JOB OK: job_id={job['job_id']}, file_id={job['file_id']}")
+    except Exception as e:
+        job["error"] = error_info(e)
+        job["status"] = "cancelled" if job["cancel_event"].is_set() else "failed"
+        db_utils.update_result_fields(job["file_id"], {"status": job["status"], "error": job["error"]})
+        logging.error(f"JOB {job['status'].upper()}: job_id={job['job_id']}, file_id={job['file_id']}, error={job['error']['detail']}")
+    finally:
+        job["finished_at"] = time.time()
+        with _lock:
+            if _inflight.get(key) is job:
+                del _inflight[key]
+        job["future"].set_result(job.get("result"))
+    return job.get("result")
+
+
+def cancel(job_id):
+    """
+    Batalkan job. Job yang masih antre dilewati worker; job yang berjalan menghentikan
+    proses encoder eksternalnya lewat supervisor. Return job, atau None jika tidak ada.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] in ("queued", "running"):
+            job["cancel_event"].set()
+            for key, inflight_job in list(_inflight.items()):
+                if inflight_job is job:
+                    del _inflight[key]
+    logging.info(f"JOB CANCEL REQUESTED: job_id={job_id}, status={job['status']}")
+    return job
+
+
+def _cached_job(file_id, entry, tenant):
+    """Job yang langsung selesai karena hasilnya diambil dari cache hasil kompresi."""
+    now = time.time()
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "file_id": file_id,
+        "status": "done",
+        "created_at": now,
+        "finished_at": now,
+        "error": None,
+        "lane": None,
+        "tenant_weight": tenant_weight(tenant),
+        "codec": None,
+        "estimated_seconds": 0,
+        "cache_hit": True,
+        "result": pipeline.build_response(file_id, entry),
+        "future": Future(),
+        "cancel_event": threading.Event(),
+    }
+    job["future"].set_result(job["result"])
+    with _lock:
+        _jobs[job["job_id"]] = job
+    db_utils.update_result_fields(file_id, {"job_id": job["job_id"], "error": None})
+    logging.info(f"JOB CACHED: job_id={job['job_id']}, file_id={file_id}")
+    return job
+
+
+def submit(file_id, method, results_dir, sensitive_mode=False, profile='default', tenant=None):
+    """
+    Daftarkan job kompresi untuk file_id. Raise HTTPException 404 jika file tidak ada.
+    Request untuk file, codec, dan profile yang sama yang masih queued/running digabung (alias method
+    seperti ai/auto/gzip berujung di codec yang sama): pemanggil berikutnya mendapat job yang sama
+    sehingga codec tidak dijalankan ulang. Method yang belum diimplementasikan langsung ditolak (501).
+    Jika hasil untuk isi file yang sama sudah ada di cache, job langsung berstatus done tanpa antre.
+    """
+    entry = db_utils.load_result(file_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="File not found")
+    if entry.get("status") in ("uploading", "finalizing"):
+        raise HTTPException(status_code=409, detail="Upload file ini belum selesai")
+    requested = method.value if hasattr(method, 'value') else method
+    if requested in pipeline.UNSUPPORTED_METHODS:
+        raise HTTPException(status_code=501, detail=pipeline.UNSUPPORTED_METHODS[requested])
+    retention.touch(file_id)
+    _prune()
+    if not sensitive_mode:
+        cached_entry = pipeline.lookup_cached(file_id, method, results_dir, profile)
+        if cached_entry is not None:
+            return _cached_job(file_id, cached_entry, tenant)
+    codec_name, cost = estimate_cost(entry)
+    lane = "large" if cost > LARGE_JOB_SECONDS else "small"
+    profile = profile or 'default'
+    # Output ditentukan oleh codec, bukan nama method yang diminta
+    key = (file_id, codec_name, profile, bool(sensitive_mode))
+    with _lock:
+        job = _inflight.get(key)
+        if job is not None:
+            job["coalesced"] = job.get("coalesced", 0) + 1
+            logging.info(f"JOB COALESCED: job_id={job['job_id']}, file_id={file_id}")
+            return job
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "file_id": file_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "error": None,
+            "lane": lane,
+            "tenant_weight": tenant_weight(tenant),
+            "codec": codec_name,
+            "estimated_seconds": round(cost, 3),
+            "future": Future(),
+            "cancel_event": threading.Event(),
+        }
+        _jobs[job["job_id"]] = job
+        _inflight[key] = job
+    db_utils.update_result_fields(file_id, {"status": "queued", "job_id": job["job_id"], "error": None})
+    task = (job, key, method, results_dir, sensitive_mode, profile)
+    with _queue_ready:
+        _ensure_workers()
+        _enqueue(LANES[lane], tenant, job["created_at"] + cost, task)
+        _queue_ready.notify_all()
+    return job
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def job_view(job):
+    """Representasi job yang aman dikirim ke client (tanpa objek Future)."""
+    view = dict(job)
+    view.pop("future", None)
+    view.pop("cancel_event", None)
+    view["result_url"] = f"/result/{job['file_id']}"
+    return view
+
+
+def batch_capacity():
+    """Job yang benar-benar bisa berjalan bersamaan untuk satu batch: jumlah worker lane terbesar."""
+    return max(lane["workers"] for lane in LANES.values())
+
+
+def iter_batch(items, submit_item, concurrency):
+    """
+    Jalankan item batch dengan paling banyak `concurrency` job berjalan bersamaan dan yield
+    hasil tiap item sesuai urutan selesai. submit_item(item) mengembalikan job atau raise
+    jika item ditolak; error tersebut dilaporkan sebagai hasil item itu sendiri.
+    Batch memakai worker lane yang sama dengan job lain, jadi concurrency dibatasi batch_capacity():
+    job di atas jumlah worker hanya menunggu di antrean lane dan menggeser job tenant lain.
+    """
+    concurrency = max(1, min(concurrency, batch_capacity()))
+    pending = {}
+    queue = iter(enumerate(items))
+    while True:
+        for index, item in queue:
+            try:
+                job = submit_item(item)
+            except Exception as e:
+                yield {"index": index, "file_id": item.get("file_id"), "status": "failed", "error": error_info(e, 422)}
+                continue
+            # Item identik digabung ke job yang sama, jadi satu future bisa mewakili beberapa item
+            pending.setdefault(job["future"], []).append((index, job))
+            if sum(len(waiting) for waiting in pending.values()) >= concurrency:
+                break
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            for index, job in pending.pop(future):
+                line = {"index": index, "file_id": job["file_id"], "job_id": job["job_id"], "status": job["status"]}
+                if job["status"] == "done":
+                    line["result"] = job["result"]
+                else:
+                    line["error"] = job["error"]
+                yield line
+
+
+def shutdown():
+    global _stopping
+    with _queue_ready:
+        _stopping = True
+        _queue_ready.notify_all()
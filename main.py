@@ -1,20 +1,30 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Header, Depends, Body
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Form, HTTPException, Request, Header, Depends, Body
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from fastapi.responses import PlainTextResponse
 import logging
 from typing import Optional
 from enum import Enum
+from urllib.parse import quote
 import os
+import json
+import asyncio
+import hashlib
+import mimetypes
 
 # API Key Auth
 API_KEYS = os.environ.get('API_KEYS', 'demo-key-123').split(',')
 def api_key_auth(x_api_key: str = Header(...)):
     if x_api_key not in API_KEYS:
         raise HTTPException(status_code=401, detail="Invalid or missing API Key")
+    return x_api_key
+
+def owner_key(api_key):
+    # Pemilik file dicatat sebagai fingerprint API key, bukan key-nya
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
 
 class CompressionMethod(str, Enum):
     ai = "ai"
@@ -23,18 +33,27 @@ class CompressionMethod(str, Enum):
     brotli = "brotli"
     webp = "webp"
     pdf_optimize = "pdf_optimize"
-import os
-import shutil
-import uuid
-import mimetypes
-import time
-from backend import utils
+
 from backend import db_utils
+from backend import jobs
+from backend import procpool
+from backend import idempotency
+from backend import admission
+from backend import ingest
+from backend import blobstore
+from backend import resumable
+from backend import retention
+from backend import scratch
+from backend import storage
+from backend import integrity
+from backend import migrate_schema
 
 db_utils.init_db()
 
-STORAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../storage'))
+STORAGE_DIR = storage.STORAGE_ROOT
 RESULTS_DIR = os.path.join(STORAGE_DIR, 'results')
+# Batas job paralel per request /batch_compress mode stream
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
 
 os.makedirs(STORAGE_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
@@ -56,6 +75,25 @@ app.state.limiter = limiter
 def rate_limit_handler(request, exc):
     return PlainTextResponse("Rate limit exceeded", status_code=429)
 
+# Admission control: tolak cepat (503 + Retry-After) sebelum body dibaca jika service jenuh.
+# Didaftarkan sebelum CORS supaya response 503 tetap mendapat header CORS.
+ADMISSION_PATHS = ("/upload", "/batch_upload", "/uploads", "/compress", "/batch_compress")
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    # Chunk upload resumable (PATCH /uploads/{file_id}) juga menulis body ke disk, sama seperti /upload
+    upload_chunk = request.method == "PATCH" and request.url.path.startswith("/uploads/")
+    if (request.method == "POST" and request.url.path in ADMISSION_PATHS) or upload_chunk:
+        try:
+            incoming = int(request.headers.get("content-length") or 0)
+        except ValueError:
+            incoming = 0
+        writes_body = upload_chunk or request.url.path in ("/upload", "/batch_upload")
+        reason = admission.check((STORAGE_DIR, RESULTS_DIR), incoming if writes_body else 0)
+        if reason:
+            return JSONResponse(status_code=503, content={"detail": reason}, headers=admission.retry_after(reason))
+    return await call_next(request)
+
 # CORS: hanya izinkan frontend production (bisa diatur via env)
 FRONTEND_ORIGINS = os.environ.get('FRONTEND_ORIGINS', '*').split(',')
 app.add_middleware(
@@ -66,266 +104,178 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-import json
-
-
-
-
-
-
-
-
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {
+                "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                "method": {"type": "string", "description": "Opsional: langsung daftarkan job kompresi untuk setiap file"},
+                "profile": {"type": "string"},
+            },
+            "required": ["files"],
+        }}},
+    }
+}
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', '100'))
 
-@app.post("/upload")
-def upload_file(file: UploadFile = File(...), x_api_key: str = Depends(api_key_auth)):
-    # Generate unique ID
-    file_id = str(uuid.uuid4())
-    file_path = os.path.join(STORAGE_DIR, file_id + '_' + file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    # Validasi ukuran file maksimal 500MB
-    MAX_SIZE_MB = 500
-    if os.path.getsize(file_path) > MAX_SIZE_MB * 1024 * 1024:
-        os.remove(file_path)
-        raise HTTPException(status_code=413, detail=f"File terlalu besar (maksimal {MAX_SIZE_MB}MB)")
-    # Detect MIME type
-    mime_type = mimetypes.guess_type(file.filename)[0] or file.content_type
-    ext = file.filename.lower()
-    # Fallback deteksi MIME berbasis ekstensi
-    if ext.endswith('.rar'):
-        mime_type = 'application/x-rar-compressed'
-    elif ext.endswith('.7z'):
-        mime_type = 'application/x-7z-compressed'
-    elif ext.endswith('.tar'):
-        mime_type = 'application/x-tar'
-    elif ext.endswith('.gz'):
-        mime_type = 'application/gzip'
-    elif ext.endswith('.doc'):
-        mime_type = 'application/msword'
-    elif ext.endswith('.xls'):
-        mime_type = 'application/vnd.ms-excel'
-    elif ext.endswith('.ppt'):
-        mime_type = 'application/vnd.ms-powerpoint'
-    elif ext.endswith('.xlsx'):
-        mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    elif ext.endswith('.pptx'):
-        mime_type = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
-    elif ext.endswith('.gif'):
-        mime_type = 'image/gif'
-    elif ext.endswith('.tiff'):
-        mime_type = 'image/tiff'
-    elif ext.endswith('.bmp'):
-        mime_type = 'image/bmp'
-    elif ext.endswith('.csv'):
-        mime_type = 'text/csv'
-    elif ext.endswith('.json'):
-        mime_type = 'application/json'
-    elif ext.endswith('.xml'):
-        mime_type = 'application/xml'
-    elif ext.endswith('.html'):
-        mime_type = 'text/html'
-    # Simpan metadata ke SQLite
-    db_utils.save_result(file_id, {
-        "file_path": file_path,
-        "original_filename": file.filename,
+def _upload_metadata(upload, owner):
+    """Deteksi MIME dan selesaikan fitur file untuk satu upload, lalu bentuk entry metadata (tanpa file_path)."""
+    mime_type = ingest.detect_mime(upload["filename"], upload["content_type"], upload["head"])
+    return {
+        "original_filename": upload["filename"],
         "mime_type": mime_type,
         "status": "uploaded",
-        "size_before": os.path.getsize(file_path)
-    })
+        "owner_key": owner,
+        "size_before": upload["size"],
+        "content_hash": upload["content_hash"],
+        "hash_algorithm": ingest.HASH_NAME,
+        "checksum": upload["checksum"],
+        # Upload yang di-stream ke backend remote tidak punya file lokal untuk dibaca (jumlah halaman PDF)
+        "features": upload["features"].finish(None if upload["staged"] else upload["file_path"], mime_type, upload["content_hash"])
+    }
+
+def _upload_response(file_id, entry, deduplicated):
     return {
         "file_id": file_id,
-        "filename": file.filename,
-        "mime_type": mime_type
+        "filename": entry["original_filename"],
+        "mime_type": entry["mime_type"],
+        "content_hash": entry["content_hash"],
+        "checksum": entry["checksum"],
+        "deduplicated": deduplicated
     }
 
-@app.post("/compress")
+@app.post("/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_file(request: Request, x_api_key: str = Depends(api_key_auth)):
+    # Body di-stream langsung ke STORAGE_DIR: satu kali tulis, batas ukuran dicek per chunk,
+    # content hash dan byte awal (untuk sniff format) didapat di pass yang sama.
+    files, _ = await ingest.receive_files(request, STORAGE_DIR)
+    try:
+        if not files or files[0]["field"] != "file":
+            raise HTTPException(status_code=422, detail="Field 'file' wajib diisi")
+        upload = files[0]
+        entry = await run_in_threadpool(_upload_metadata, upload, owner_key(x_api_key))
+        # Simpan isi file secara content-addressed: upload duplikat berbagi blob yang sama
+        entry["file_path"], deduplicated = await run_in_threadpool(blobstore.adopt, upload["file_path"], upload["content_hash"], STORAGE_DIR, upload["checksum"], upload["staged"])
+    except BaseException:
+        await run_in_threadpool(ingest.discard, files)
+        raise
+    # Simpan metadata ke SQLite; jika gagal, referensi blob dilepas supaya blob tidak tertinggal tanpa pemilik
+    try:
+        await run_in_threadpool(db_utils.save_result, upload["file_id"], entry)
+    except BaseException:
+        await run_in_threadpool(blobstore.release, upload["content_hash"])
+        raise
+    await run_in_threadpool(retention.touch, upload["file_id"])
+    return _upload_response(upload["file_id"], entry, deduplicated)
+
+@app.post("/batch_upload", openapi_extra=BATCH_UPLOAD_OPENAPI)
 @limiter.limit("30/minute")
-def compress_file(request: Request, file_id: str = Form(...), method: CompressionMethod = Form(...), sensitive_mode: bool = Form(False), profile: str = Form('default'), x_api_key: str = Depends(api_key_auth)):
+async def batch_upload(request: Request, x_api_key: str = Depends(api_key_auth)):
     """
-    Kompres file yang sudah diupload dengan metode tertentu.
-    Pilihan method: ai, auto, gzip, brotli, webp, pdf_optimize, lzma, flif, heic
-    Optional: sensitive_mode (True/False) untuk lossless compression dokumen sensitif.
-    Optional: profile (web, archive, network, default) untuk auto profile kompresi.
+    Upload banyak file dalam satu request multipart (field file boleh berulang, maksimal MAX_BATCH_FILES).
+    Penulisan ke disk berjalan di threadpool bersamaan dengan parsing, analisis tiap file paralel,
+    dan semua baris metadata disimpan dalam satu transaksi. Optional field form "method" (dan "profile")
+    langsung mendaftarkan job kompresi untuk setiap file; hasilnya ada di field "job" tiap file.
     """
-
-    # Validate file_id
-    entry = db_utils.load_result(file_id)
-    if not entry:
-        raise HTTPException(status_code=404, detail="File not found")
-    input_path = entry["file_path"]
-    mime_type = entry.get("mime_type")
-    file_size = entry.get("size_before")
-    # Pilih metode kompresi (AI selector stub jika method==ai, auto_select_compression jika auto)
-    chosen_method = method.value
-    # Use global import for utils
-    if method.value == "ai":
-        chosen_method = utils.ai_selector_stub(mime_type, file_size, entry['original_filename'], profile)
-    elif method.value == "auto":
-        chosen_method = utils.auto_select_compression(mime_type)
-    # Dukungan stub algoritma baru
-    if chosen_method == "lzma":
-        # TODO: Implementasi LZMA kompresi
-        raise HTTPException(status_code=501, detail="LZMA compression not implemented yet.")
-    if chosen_method == "flif":
-        # TODO: Implementasi FLIF kompresi
-        raise HTTPException(status_code=501, detail="FLIF compression not implemented yet.")
-    if chosen_method == "heic":
-        # TODO: Implementasi HEIC kompresi
-        raise HTTPException(status_code=501, detail="HEIC compression not implemented yet.")
-    # Output file: gunakan ekstensi asli
-    original_ext = os.path.splitext(entry['original_filename'])[1]
-    output_filename = f"compressed_{file_id}_{entry['original_filename']}"
-    output_path = os.path.join(RESULTS_DIR, output_filename)
-
-    # Analisis NLP jika sensitive_mode dan file teks
-    sensitive_entities = None
-    if sensitive_mode and (mime_type.startswith("text/") or original_ext.lower() in [".txt", ".csv", ".json", ".xml", ".html"]):
-        from backend import nlp_utils
-        try:
-            with open(input_path, 'r', encoding='utf-8', errors='ignore') as f:
-                text = f.read(100000)
-            sensitive_entities = nlp_utils.detect_sensitive_entities(text)
-        except Exception:
-            sensitive_entities = None
-    # Kompresi sesuai format asli
-    # PDF: use pdf_optimize (now with real optimization)
-    if mime_type == "application/pdf" or original_ext.lower() == ".pdf":
-        from backend import pdf_optimize
-        if not output_path.lower().endswith('.pdf'):
-            output_path += '.pdf'
-        method_used = pdf_optimize.compress_pdf(input_path, output_path)
-        chosen_method = method_used
-    elif mime_type.startswith("image/"):
-        if not output_path.lower().endswith('.webp'):
-            output_path += '.webp'
-        utils.compress_webp(input_path, output_path, quality=80)
-        chosen_method = "webp"
-    elif mime_type == "video/mp4" or original_ext.lower() == ".mp4":
-        try:
-            import subprocess
-            # Pastikan output_path unik dan tidak overwrite
-            if not output_path.lower().endswith('_compressed.mp4'):
-                output_path = output_path.replace('.mp4', '_compressed.mp4')
-            ffmpeg_cmd = [
-                "ffmpeg", "-y", "-i", input_path,
-                "-b:v", "1000k",
-                "-b:a", "128k",
-                output_path
-            ]
-            subprocess.run(ffmpeg_cmd, check=True)
-            chosen_method = "ffmpeg"
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Kompresi MP4 gagal: {e}")
-    elif original_ext.lower() in [".txt", ".csv", ".json", ".xml", ".html"] or mime_type in ["text/plain", "text/csv", "application/json", "application/xml", "text/html"] or mime_type.startswith("text/"):
-        try:
-            if not output_path.lower().endswith('.gz'):
-                output_path += '.gz'
-            utils.compress_gzip(input_path, output_path)
-            chosen_method = "gzip"
-            logging.info(f"Kompresi file text/markup ({entry['original_filename']}) sukses: {output_path}")
-        except Exception as e:
-            logging.error(f"Kompresi file text/markup gagal: {entry['original_filename']} | Error: {e}")
-            raise HTTPException(status_code=500, detail=f"Kompresi file text/markup gagal: {e}")
-    # Images: compress to WebP
-    elif mime_type.startswith("image/"):
-        if not output_path.lower().endswith('.webp'):
-            output_path += '.webp'
-        utils.compress_webp(input_path, output_path, quality=80)
-        chosen_method = "webp"
-    # Office files: compress with brotli
-    elif original_ext.lower() in [".pptx", ".docx", ".xlsx"]:
-        try:
-            from backend.office_optimize import optimize_office_images
-            optimized = optimize_office_images(input_path, output_path, quality=75)
-            chosen_method = "office_optimize"
-            logging.info(f"Optimized Office file: {entry['original_filename']} -> {output_path} (images compressed: {optimized})")
-        except Exception as e:
-            import shutil
-            shutil.copyfile(input_path, output_path)
-            chosen_method = "copy"
-            logging.warning(f"Failed to optimize Office file, fallback to copy: {entry['original_filename']} | Error: {e}")
-    # Archive files: skip recompression, add warning
-    elif original_ext.lower() in [".zip", ".rar", ".7z", ".tar"]:
-        import shutil
-        shutil.copyfile(input_path, output_path)
-        chosen_method = "copy"
-        archive_warning = "File arsip seperti ZIP, RAR, 7z, dan TAR biasanya sudah terkompresi optimal. Tidak dilakukan kompresi ulang."
-        logging.info(f"SKIP recompress archive: {entry['original_filename']} -> {output_path}")
-    # Unsupported file types: return error
-    else:
-        raise HTTPException(status_code=415, detail="Tipe file ini belum didukung untuk kompresi. Hanya gambar, dokumen teks, PDF, dan Office.")
-    # Simpan hasil analisis entitas sensitif ke metadata
-    if sensitive_entities is not None:
-        entry['sensitive_entities'] = sensitive_entities
-        db_utils.save_result(file_id, entry)
-
-    # Proses kompresi
-    start_time = time.time()
-    # Analisis AI selector untuk metadata
-    entropy = None
-    pdf_pages = None
-    img_res = None
+    files, fields = await ingest.receive_files(request, STORAGE_DIR, max_files=MAX_BATCH_FILES)
+    method = fields.get("method")
     try:
-        from utils import file_entropy, pdf_page_count, image_resolution
-        entropy = file_entropy(input_path)
-        if mime_type == "application/pdf":
-            pdf_pages = pdf_page_count(input_path)
-        if mime_type and mime_type.startswith("image/"):
-            img_res = image_resolution(input_path)
-    except Exception as e:
-        print(f"[WARN] Gagal analisis AI selector: {e}")
-    # Kompresi optimal berbasis tipe file
-    if mime_type == "application/pdf":
-        try:
-            import subprocess
-            import sys
-            subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), "pdf_optimize.py"), input_path, output_path], check=True)
-            chosen_method = "pdf_optimize"
-        except Exception as e:
-            print(f"[WARN] Gagal optimasi PDF, fallback ke gzip: {e}")
-            utils.compress_gzip(input_path, output_path)
-            chosen_method = "gzip"
-    elif mime_type and mime_type.startswith("image/"):
-        try:
-            utils.compress_webp(input_path, output_path)
-            chosen_method = "webp"
-        except Exception as e:
-            print(f"[WARN] Gagal kompres gambar ke WebP, fallback ke brotli: {e}")
-            utils.compress_brotli(input_path, output_path)
-            chosen_method = "brotli"
-    # Update hasil kompresi ke DB
-    size_after = os.path.getsize(output_path)
-    entry['output_path'] = output_path
-    entry['size_after'] = size_after
-    entry['compression_method'] = chosen_method
-    entry['status'] = 'compressed'
-    db_utils.save_result(file_id, entry)
-    elapsed = round(time.time() - start_time, 4)
-    entry["elapsed"] = elapsed
-    db_utils.save_result(file_id, entry)
-
-    # Return hasil kompresi
-    return {
-        "status": "ok",
-        "file_id": file_id,
-        "original_filename": entry.get("original_filename"),
-        "compressed_filename": os.path.basename(entry.get("output_path", "")),
-        "mime_type": entry.get("mime_type"),
-        "size_before": entry.get("size_before"),
-        "size_after": entry.get("size_after"),
-        "compression_method": entry.get("compression_method"),
-        "ratio": round(entry["size_after"] / entry["size_before"], 4) if entry.get("size_before") and entry.get("size_after") else None,
-        "elapsed": entry.get("elapsed")
-    }
-
-    entry["elapsed"] = elapsed
-    # Simpan hasil analisis AI selector ke metadata
-    entry["ai_analysis"] = {
-        "entropy": entropy,
-        "pdf_pages": pdf_pages,
-        "img_res": img_res
-    }
+        if not files:
+            raise HTTPException(status_code=422, detail="Minimal satu file wajib diupload")
+        if method and method not in CompressionMethod._value2member_map_:
+            raise HTTPException(status_code=422, detail=f"Method tidak dikenal: {method}")
+        entries = await asyncio.gather(*(run_in_threadpool(_upload_metadata, upload, owner_key(x_api_key)) for upload in files))
+        adopted = await run_in_threadpool(blobstore.adopt_many, [(u["file_path"], u["content_hash"], u["checksum"]) for u in files], STORAGE_DIR,
+                                          any(u["staged"] for u in files))
+    except BaseException:
+        await run_in_threadpool(ingest.discard, files)
+        raise
+    results = []
+    for upload, entry, (file_path, deduplicated) in zip(files, entries, adopted):
+        entry["file_path"] = file_path
+        results.append(_upload_response(upload["file_id"], entry, deduplicated))
+    try:
+        await run_in_threadpool(db_utils.save_results_many, [(u["file_id"], e) for u, e in zip(files, entries)])
+    except BaseException:
+        for upload in files:
+            await run_in_threadpool(blobstore.release, upload["content_hash"])
+        raise
+    await run_in_threadpool(retention.touch, *(u["file_id"] for u in files))
+    logging.info(f"BATCH UPLOAD: {len(files)} files, deduplicated={sum(r['deduplicated'] for r in results)}")
+    if method:
+        profile = fields.get("profile") or 'default'
+        for result in results:
+            try:
+                job = await run_in_threadpool(jobs.submit, result["file_id"], CompressionMethod(method), RESULTS_DIR, profile=profile, tenant=x_api_key)
+                result["job"] = jobs.job_view(job)
+            except Exception as e:
+                result["job"] = {"status": "failed", "error": jobs.error_info(e, 422)}
+    return {"files": results}
+
+# --- Upload resumable (chunked) ---
+
+@app.post("/uploads", status_code=201)
+@limiter.limit("30/minute")
+def create_resumable_upload(request: Request, filename: str = Form(...), size: int = Form(...), content_type: Optional[str] = Form(None), x_api_key: str = Depends(api_key_auth)):
+    """
+    Mulai upload resumable. Kirim isi file lewat PATCH /uploads/{file_id} (header Upload-Offset,
+    body berisi byte chunk mentah; boleh paralel), lalu POST /uploads/{file_id}/finalize.
+    """
+    view = resumable.create(STORAGE_DIR, filename, size, content_type, owner=owner_key(x_api_key))
+    return JSONResponse(status_code=201, content=view, headers={"Location": f"/uploads/{view['file_id']}"})
+
+@app.patch("/uploads/{file_id}")
+@limiter.limit("600/minute")
+async def upload_chunk(request: Request, file_id: str, upload_offset: int = Header(...), x_api_key: str = Depends(api_key_auth)):
+    view = await resumable.write_chunk(file_id, upload_offset, request)
+    return JSONResponse(content=view, headers={"Upload-Offset": str(view["offset"])})
+
+@app.get("/uploads/{file_id}")
+@limiter.limit("600/minute")
+def get_resumable_upload(request: Request, file_id: str, x_api_key: str = Depends(api_key_auth)):
+    """Status upload resumable: rentang byte yang sudah diterima dan offset lanjutan."""
+    view = resumable.status(file_id)
+    return JSONResponse(content=view, headers={"Upload-Offset": str(view["offset"] or 0)})
+
+@app.post("/uploads/{file_id}/finalize")
+@limiter.limit("30/minute")
+def finalize_resumable_upload(request: Request, file_id: str, checksum: Optional[str] = Form(None), x_api_key: str = Depends(api_key_auth)):
+    """Selesaikan upload resumable. Optional checksum (BLAKE2b-256 hex) dicocokkan dengan isi file."""
+    view, deduplicated = resumable.finalize(file_id, STORAGE_DIR, checksum)
+    return dict(view, deduplicated=deduplicated)
 
+@app.get("/files")
+@limiter.limit("30/minute")
+def list_files(request: Request, status: Optional[str] = None, mime_type: Optional[str] = None, method: Optional[str] = None,
+               since: Optional[float] = None, limit: int = 100, x_api_key: str = Depends(api_key_auth)):
+    """Daftar file milik API key ini, terbaru dulu. Filter opsional: status, mime_type, method (metode kompresi), since (epoch detik)."""
+    rows = db_utils.find_results(status=status, mime_type=mime_type, compression_method=method, owner_key=owner_key(x_api_key),
+                                 created_after=since, limit=max(1, min(limit, 1000)))
+    return {"files": [
+        {
+            "file_id": file_id,
+            "filename": entry.get("original_filename"),
+            "status": entry.get("status"),
+            "mime_type": entry.get("mime_type"),
+            "size_before": entry.get("size_before"),
+            "size_after": entry.get("size_after"),
+            "compression_method": entry.get("compression_method"),
+            "created_at": entry.get("created_at"),
+        }
+        for file_id, entry in rows
+    ]}
 
 @app.get("/result/{file_id}")
 @limiter.limit("30/minute")
@@ -334,14 +284,20 @@ def get_result(request: Request, file_id: str, x_api_key: str = Depends(api_key_
     if not entry:
         logging.warning(f"RESULT FAIL: file_id={file_id} not found")
         raise HTTPException(status_code=404, detail="File not found")
+    if entry.get("status") in ("failed", "cancelled"):
+        error = entry.get("error") or {}
+        logging.info(f"RESULT FAILED: file_id={file_id}, job_id={entry.get('job_id')}")
+        return JSONResponse(status_code=error.get("status_code", 500), content={"status": entry["status"], "job_id": entry.get("job_id"), "detail": error.get("detail")})
     if entry.get("status") != "compressed":
         logging.info(f"RESULT PENDING: file_id={file_id}, status={entry.get('status')}")
-        return JSONResponse(status_code=202, content={"status": entry.get("status", "pending")})
+        return JSONResponse(status_code=202, content={"status": entry.get("status", "pending"), "job_id": entry.get("job_id")})
     ratio = round(entry["size_after"] / entry["size_before"], 4) if entry["size_before"] else None
-    output_filename = os.path.basename(entry["output_path"])
+    output_filename = entry.get("compressed_filename") or os.path.basename(entry["output_path"])
     logging.info(f"RESULT OK: file_id={file_id}, size_before={entry['size_before']}, size_after={entry['size_after']}")
     return {
         "id": file_id,
+        "status": "done",
+        "job_id": entry.get("job_id"),
         "original_filename": entry["original_filename"],
         "compressed_filename": output_filename,
         "mime_type": entry["mime_type"],
@@ -350,14 +306,31 @@ def get_result(request: Request, file_id: str, x_api_key: str = Depends(api_key_
         "compression_method": entry["compression_method"],
         "ratio": ratio,
         "elapsed": entry.get("elapsed"),
+        "timings": entry.get("timings"),
+        "cache_hit": entry.get("cache_hit", False),
+        "checksum": entry.get("result_checksum"),
         "download_url": f"/download/{file_id}"
     }
 
-from typing import Optional, Union
-import os
-
-
-
+@app.get("/dedup/{file_id}")
+@limiter.limit("30/minute")
+def get_dedup_stats(request: Request, file_id: str, x_api_key: str = Depends(api_key_auth)):
+    entry = db_utils.load_result(file_id)
+    if not entry or not entry.get("content_hash"):
+        logging.warning(f"DEDUP FAIL: file_id={file_id} not found")
+        raise HTTPException(status_code=404, detail="File not found")
+    original = blobstore.dedup_stats(entry["content_hash"])
+    if original is None:
+        raise HTTPException(status_code=404, detail="Original file not found")
+    result = blobstore.dedup_stats(entry.get("result_hash"))
+    return {
+        "id": file_id,
+        "original_filename": entry["original_filename"],
+        "size_before": entry["size_before"],
+        "content_hash": entry["content_hash"],
+        "original": original,
+        "result": result,
+    }
 
 @app.get("/health")
 def healthcheck():
@@ -371,173 +344,154 @@ def info():
     }
 
 
-def compress_file_internal(file_id, method, sensitive_mode=False, profile='default', convert_to=None):
-    """
-    Kompres file yang sudah diupload dengan metode tertentu, tanpa membutuhkan FastAPI Request object.
-    Digunakan oleh endpoint /compress dan /batch_compress.
-    """
-    entry = db_utils.load_result(file_id)
-    if not entry:
-        raise HTTPException(status_code=404, detail="File not found")
-    input_path = entry["file_path"]
-    mime_type = entry.get("mime_type")
-    file_size = entry.get("size_before")
-    chosen_method = method.value if hasattr(method, 'value') else method
-    profile = profile or 'default'
-    if chosen_method == "ai":
-        chosen_method = utils.ai_selector_stub(mime_type, file_size, entry['original_filename'], profile)
-    elif chosen_method == "auto":
-        chosen_method = utils.auto_select_compression(mime_type)
-    if chosen_method == "lzma":
-        raise HTTPException(status_code=501, detail="LZMA compression not implemented yet.")
-    if chosen_method == "flif":
-        raise HTTPException(status_code=501, detail="FLIF compression not implemented yet.")
-    if chosen_method == "heic":
-        raise HTTPException(status_code=501, detail="HEIC compression not implemented yet.")
-    original_ext = os.path.splitext(entry['original_filename'])[1]
-    output_filename = f"compressed_{file_id}_{entry['original_filename']}"
-    output_path = os.path.join(RESULTS_DIR, output_filename)
-    sensitive_entities = None
-    if sensitive_mode and (mime_type.startswith("text/") or original_ext.lower() in [".txt", ".csv", ".json", ".xml", ".html"]):
-        from backend import nlp_utils
-        try:
-            with open(input_path, 'r', encoding='utf-8', errors='ignore') as f:
-                text = f.read(100000)
-            sensitive_entities = nlp_utils.detect_sensitive_entities(text)
-        except Exception:
-            sensitive_entities = None
-    # Kompresi sesuai format asli
-    if mime_type == "application/pdf" or original_ext.lower() == ".pdf":
-        from backend import pdf_optimize
-        if not output_path.lower().endswith('.pdf'):
-            output_path += '.pdf'
-        method_used = pdf_optimize.compress_pdf(input_path, output_path)
-        chosen_method = method_used
-    elif mime_type.startswith("image/"):
-        if not output_path.lower().endswith('.webp'):
-            output_path += '.webp'
-        utils.compress_webp(input_path, output_path, quality=80)
-        chosen_method = "webp"
-    elif mime_type == "video/mp4" or original_ext.lower() == ".mp4":
-        try:
-            import subprocess
-            if not output_path.lower().endswith('_compressed.mp4'):
-                output_path = output_path.replace('.mp4', '_compressed.mp4')
-            ffmpeg_cmd = [
-                "ffmpeg", "-y", "-i", input_path,
-                "-b:v", "1000k",
-                "-b:a", "128k",
-                output_path
-            ]
-            subprocess.run(ffmpeg_cmd, check=True)
-            chosen_method = "ffmpeg"
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Kompresi MP4 gagal: {e}")
-    elif original_ext.lower() in [".txt", ".csv", ".json", ".xml", ".html"] or mime_type in ["text/plain", "text/csv", "application/json", "application/xml", "text/html"] or mime_type.startswith("text/"):
-        try:
-            if not output_path.lower().endswith('.gz'):
-                output_path += '.gz'
-            utils.compress_gzip(input_path, output_path)
-            chosen_method = "gzip"
-            logging.info(f"Kompresi file text/markup ({entry['original_filename']}) sukses: {output_path}")
-        except Exception as e:
-            logging.error(f"Kompresi file text/markup gagal: {entry['original_filename']} | Error: {e}")
-            raise HTTPException(status_code=500, detail=f"Kompresi file text/markup gagal: {e}")
-    elif mime_type.startswith("image/"):
-        if not output_path.lower().endswith('.webp'):
-            output_path += '.webp'
-        utils.compress_webp(input_path, output_path, quality=80)
-        chosen_method = "webp"
-    elif original_ext.lower() in [".pptx", ".docx", ".xlsx"]:
-        try:
-            from backend.office_optimize import optimize_office_images
-            optimized = optimize_office_images(input_path, output_path, quality=75)
-            chosen_method = "office_optimize"
-            logging.info(f"Optimized Office file: {entry['original_filename']} -> {output_path} (images compressed: {optimized})")
-        except Exception as e:
-            import shutil
-            shutil.copyfile(input_path, output_path)
-            chosen_method = "copy"
-            logging.warning(f"Failed to optimize Office file, fallback to copy: {entry['original_filename']} | Error: {e}")
-    elif original_ext.lower() in [".zip", ".rar", ".7z", ".tar"]:
-        import shutil
-        shutil.copyfile(input_path, output_path)
-        chosen_method = "copy"
-        archive_warning = "File arsip seperti ZIP, RAR, 7z, dan TAR biasanya sudah terkompresi optimal. Tidak dilakukan kompresi ulang."
-        logging.info(f"SKIP recompress archive: {entry['original_filename']} -> {output_path}")
-    else:
-        raise HTTPException(status_code=415, detail="Tipe file ini belum didukung untuk kompresi. Hanya gambar, dokumen teks, PDF, dan Office.")
-    # Simpan hasil analisis entitas sensitif ke metadata
-    if sensitive_entities is not None:
-        entry['sensitive_entities'] = sensitive_entities
-        db_utils.save_result(file_id, entry)
-    # Analisis AI selector untuk metadata
-    entropy = None
-    pdf_pages = None
-    img_res = None
-    try:
-        from utils import file_entropy, pdf_page_count, image_resolution
-        entropy = file_entropy(input_path)
-        if mime_type == "application/pdf":
-            pdf_pages = pdf_page_count(input_path)
-        if mime_type and mime_type.startswith("image/"):
-            img_res = image_resolution(input_path)
-    except Exception as e:
-        print(f"[WARN] Gagal analisis AI selector: {e}")
-    # Update hasil kompresi ke DB
-    size_after = os.path.getsize(output_path)
-    entry['output_path'] = output_path
-    entry['size_after'] = size_after
-    entry['compression_method'] = chosen_method
-    entry['status'] = 'compressed'
-    db_utils.save_result(file_id, entry)
-    ratio = round(size_after / entry['size_before'], 3) if entry['size_before'] else None
-    elapsed = None
-    return {
-        "file_id": file_id,
-        "original_filename": entry["original_filename"],
-        "compressed_filename": output_filename,
-        "mime_type": mime_type,
-        "size_before": entry["size_before"],
-        "size_after": size_after,
-        "compression_method": chosen_method,
-        "ratio": ratio,
-        "elapsed": elapsed,
-        "download_url": f"/download/{file_id}"
-    }
-
 @app.post("/batch_compress")
 @limiter.limit("30/minute")
-def batch_compress(request: Request, batch: dict = Body(...), x_api_key: str = Depends(api_key_auth)):
+def batch_compress(request: Request, batch: dict = Body(...), x_api_key: str = Depends(api_key_auth), idempotency_key: Optional[str] = Header(None)):
     """
     Kompresi banyak file sekaligus. Body: {"items": [{"file_id":..., "method":..., "convert_to":...}]}
+    Default: setiap item didaftarkan sebagai job; response 202 berisi job_id per item (atau error jika item ditolak).
+    Jika body berisi "stream": true atau header Accept: application/x-ndjson, item dijalankan paralel
+    (maksimal "concurrency", dibatasi BATCH_CONCURRENCY dan jumlah worker lane job) dan hasil tiap item di-stream sebagai NDJSON
+    sesuai urutan selesai, lengkap dengan error per item.
+    Optional header Idempotency-Key: request ulang dengan key yang sama mendapat response yang tersimpan.
     """
+    def submit_item(item):
+        return jobs.submit(
+            item["file_id"],
+            CompressionMethod(item["method"]),
+            RESULTS_DIR,
+            sensitive_mode=item.get("sensitive_mode", False),
+            profile=item.get("profile", 'default'),
+            tenant=x_api_key
+        )
+
+    items = batch.get("items", [])
+    stream = bool(batch.get("stream") or "application/x-ndjson" in request.headers.get("accept", ""))
+    idem_key = None
+    if idempotency_key:
+        idem_key = idempotency.scoped_key(owner_key(x_api_key), "batch_compress", idempotency_key)
+        replay = idempotency.begin(idem_key, {"batch": batch, "stream": stream})
+        if replay is not None:
+            logging.info(f"BATCH_COMPRESS REPLAY: idempotency_key={idempotency_key}")
+            return replay
+
+    if stream:
+        concurrency = max(1, min(int(batch.get("concurrency") or BATCH_CONCURRENCY), BATCH_CONCURRENCY))
+
+        def ndjson_lines():
+            lines = []
+            completed = False
+            try:
+                for line in jobs.iter_batch(items, submit_item, concurrency):
+                    if line["status"] == "failed":
+                        logging.error(f"BATCH_COMPRESS ERROR: file_id={line.get('file_id')}, error={line['error']['detail']}")
+                    lines.append(json.dumps(line) + "\n")
+                    yield lines[-1]
+                completed = True
+            finally:
+                if idem_key and completed:
+                    idempotency.complete(idem_key, 200, "".join(lines), "application/x-ndjson")
+                elif idem_key:
+                    idempotency.release(idem_key)
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
     results = []
-    for item in batch.get("items", []):
-        try:
-            resp = compress_file_internal(
-                file_id=item["file_id"],
-                method=CompressionMethod(item["method"]),
-                sensitive_mode=item.get("sensitive_mode", False),
-                profile=item.get("profile", 'default'),
-                convert_to=item.get("convert_to")
-            )
-            results.append({"file_id": item["file_id"], "result": resp})
-        except Exception as e:
-            logging.error(f"BATCH_COMPRESS ERROR: file_id={item.get('file_id')}, error={str(e)}")
-    return results
+    try:
+        for item in items:
+            try:
+                job = submit_item(item)
+                results.append({"file_id": item["file_id"], "job_id": job["job_id"], "status": job["status"]})
+            except Exception as e:
+                error = jobs.error_info(e, 422)
+                logging.error(f"BATCH_COMPRESS ERROR: file_id={item.get('file_id')}, error={error['detail']}")
+                results.append({"file_id": item.get("file_id"), "status": "failed", "error": error})
+    except Exception:
+        if idem_key:
+            idempotency.release(idem_key)
+        raise
+    if idem_key:
+        idempotency.complete(idem_key, 202, json.dumps(results))
+    return JSONResponse(status_code=202, content=results)
 
 @app.post("/compress")
 @limiter.limit("30/minute")
-def compress_file(request: Request, file_id: str = Form(...), method: CompressionMethod = Form(...), sensitive_mode: bool = Form(False), profile: str = Form('default'), x_api_key: str = Depends(api_key_auth)):
+def compress_file(request: Request, file_id: str = Form(...), method: CompressionMethod = Form(...), sensitive_mode: bool = Form(False), profile: str = Form('default'), x_api_key: str = Depends(api_key_auth), idempotency_key: Optional[str] = Header(None)):
     """
-    Kompres file yang sudah diupload dengan metode tertentu.
+    Daftarkan job kompresi untuk file yang sudah diupload, langsung kembali dengan 202 + job_id.
+    Jika hasil untuk isi file, codec, dan profile yang sama sudah ada, langsung kembali 200 dengan hasilnya.
     Pilihan method: ai, auto, gzip, brotli, webp, pdf_optimize, lzma, flif, heic
     Optional: sensitive_mode (True/False) untuk lossless compression dokumen sensitif.
     Optional: profile (web, archive, network, default) untuk auto profile kompresi.
+    Optional header Idempotency-Key: request ulang dengan key yang sama mendapat response yang tersimpan.
+    Pantau progres lewat /result/{file_id} atau /jobs/{job_id}.
     """
-    return compress_file_internal(file_id, method, sensitive_mode, profile)
+    idem_key = None
+    if idempotency_key:
+        idem_key = idempotency.scoped_key(owner_key(x_api_key), "compress", idempotency_key)
+        replay = idempotency.begin(idem_key, {"file_id": file_id, "method": method.value, "sensitive_mode": sensitive_mode, "profile": profile})
+        if replay is not None:
+            logging.info(f"COMPRESS REPLAY: file_id={file_id}, idempotency_key={idempotency_key}")
+            return replay
+    try:
+        job = jobs.submit(file_id, method, RESULTS_DIR, sensitive_mode=sensitive_mode, profile=profile, tenant=x_api_key)
+    except Exception:
+        if idem_key:
+            idempotency.release(idem_key)
+        raise
+    if job.get("cache_hit"):
+        # Hasil untuk isi file yang sama sudah ada: kembalikan langsung tanpa encode ulang
+        content = dict(job["result"], job_id=job["job_id"])
+        if idem_key:
+            idempotency.complete(idem_key, 200, json.dumps(content))
+        logging.info(f"COMPRESS CACHED: file_id={file_id}, job_id={job['job_id']}")
+        return JSONResponse(status_code=200, content=content)
+    content = jobs.job_view(job)
+    headers = {"Location": f"/jobs/{job['job_id']}"}
+    if idem_key:
+        idempotency.complete(idem_key, 202, json.dumps(content), headers=headers)
+    logging.info(f"COMPRESS QUEUED: file_id={file_id}, job_id={job['job_id']}")
+    return JSONResponse(status_code=202, content=content, headers=headers)
+
+@app.get("/jobs/{job_id}")
+@limiter.limit("30/minute")
+def get_job(request: Request, job_id: str, x_api_key: str = Depends(api_key_auth)):
+    job = jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.job_view(job)
 
+@app.delete("/jobs/{job_id}")
+@limiter.limit("30/minute")
+def cancel_job(request: Request, job_id: str, x_api_key: str = Depends(api_key_auth)):
+    """Batalkan job kompresi yang masih antre atau berjalan (proses ffmpeg/Ghostscript ikut dihentikan)."""
+    job = jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(status_code=202, content=jobs.job_view(job))
+
+@app.on_event("startup")
+def start_workers():
+    scratch.sweep()
+    procpool.start()
+    migrate_schema.start()
+    retention.start()
+    integrity.start()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    retention.shutdown()
+    integrity.shutdown()
+    jobs.shutdown()
+    procpool.shutdown()
+
+
+def _track_patch(file_id, path):
+    def add(data):
+        patches = data.setdefault("patches", [])
+        if path not in patches:
+            patches.append(path)
+    db_utils.modify_result(file_id, add)
 
 
 @app.post("/diff_compress")
@@ -554,7 +508,6 @@ def diff_compress(request: Request,
     - method=patch: hasilkan file patch (delta) antara base_file_id dan file_id
     - method=restore: hasilkan file baru dengan menerapkan patch_file_id ke base_file_id
     """
-    import hashlib
     from backend import diff_utils
     entry = db_utils.load_result(file_id)
     base_entry = db_utils.load_result(base_file_id)
@@ -565,18 +518,30 @@ def diff_compress(request: Request,
     input_path = entry["file_path"]
     if method == 'patch':
         patch_name = f"patch_{base_file_id}_{file_id}"
-        patch_path = os.path.join(RESULTS_DIR, patch_name)
-        diff_utils.create_binary_patch(base_path, input_path, patch_path)
+        patch_path = blobstore.named_path(RESULTS_DIR, patch_name)
+        os.makedirs(os.path.dirname(patch_path), exist_ok=True)
+        with blobstore.raw_path(base_path, base_entry.get("content_hash")) as base_raw, \
+                blobstore.raw_path(input_path, entry.get("content_hash")) as input_raw:
+            procpool.run(diff_utils.create_binary_diff, base_raw, input_raw, patch_path)
+        # Patch ikut dihapus GC saat salah satu file sumbernya dihapus
+        for owner in (file_id, base_file_id):
+            _track_patch(owner, patch_path)
         logging.info(f"DIFF_COMPRESS PATCH OK: base={base_file_id}, file={file_id}, patch={patch_name}")
         return {"patch_file": patch_name, "patch_path": patch_path}
     elif method == 'restore':
         if not patch_file_id:
             logging.warning(f"DIFF_COMPRESS RESTORE FAIL: patch_file_id missing for base={base_file_id}")
             raise HTTPException(status_code=400, detail="patch_file_id is required for restore method")
-        patch_path = os.path.join(RESULTS_DIR, patch_file_id)
+        patch_file_id = os.path.basename(patch_file_id)
+        patch_path = blobstore.named_path(RESULTS_DIR, patch_file_id)
+        if not os.path.exists(patch_path):
+            raise HTTPException(status_code=404, detail="Patch file not found")
         restored_name = f"restored_{base_file_id}_{patch_file_id}"
-        restored_path = os.path.join(RESULTS_DIR, restored_name)
-        diff_utils.apply_binary_patch(base_path, patch_path, restored_path)
+        restored_path = blobstore.named_path(RESULTS_DIR, restored_name)
+        os.makedirs(os.path.dirname(restored_path), exist_ok=True)
+        with blobstore.raw_path(base_path, base_entry.get("content_hash")) as base_raw:
+            procpool.run(diff_utils.apply_binary_patch, base_raw, patch_path, restored_path)
+        _track_patch(base_file_id, restored_path)
         logging.info(f"DIFF_COMPRESS RESTORE OK: base={base_file_id}, patch={patch_file_id}, restored={restored_name}")
         return {"restored_file": restored_name, "restored_path": restored_path}
     else:
@@ -598,7 +563,70 @@ def get_compression_methods():
         {"value": "pdf_optimize", "label": "PDF Optimizer (PDF)", "desc": "Optimasi khusus PDF, mengurangi ukuran dengan kompresi konten internal."}
     ]
 
-from typing import Optional, Union
+def _iter_raw(path, content_hash):
+    with blobstore.open_raw(path, content_hash) as f:
+        for block in iter(lambda: f.read(ingest.WRITE_BLOCK), b""):
+            yield block
+
+def _byte_range(header, size):
+    # Satu range "bytes=a-b", "bytes=a-", atau "bytes=-n"; None jika tidak ada header Range
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    start, sep, end = spec.strip().partition("-")
+    try:
+        if unit.strip() != "bytes" or not sep or "," in spec:
+            raise ValueError
+        if start:
+            first, last = int(start), min(int(end), size - 1) if end else size - 1
+        else:
+            first, last = max(0, size - int(end)), size - 1
+        if first > last:
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range tidak valid", headers={"Content-Range": f"bytes */{size}"})
+    return first, last
+
+def _blob_response(request, path, content_hash, size, filename, media_type):
+    """
+    Response download untuk blob: file lokal langsung, selain itu di-stream dari backend tanpa staging lokal.
+    ETag = content hash; download penuh diverifikasi terhadap checksum tersimpan (VERIFY_DOWNLOADS).
+    """
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    if blob and blob["corrupt"]:
+        logging.error(f"DOWNLOAD FAIL: blob {content_hash} ditandai rusak")
+        raise HTTPException(status_code=500, detail="File rusak (checksum tidak cocok), upload atau kompres ulang")
+    etag_headers = {"ETag": f'"{content_hash}"'} if content_hash else {}
+    if etag_headers and etag_headers["ETag"] in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=etag_headers)
+    byte_range = request.headers.get("range")
+    expected = integrity.expected_checksum(blob) if integrity.VERIFY_DOWNLOADS and not byte_range else None
+    if blobstore.is_plain_file(content_hash) and not expected:
+        return FileResponse(path, filename=filename, headers=etag_headers)
+    headers = dict(_attachment_headers(filename), **etag_headers)
+    if blobstore.is_object(content_hash):
+        # Objek mentah: dukung Range supaya client bisa melanjutkan/memotong download
+        headers["Accept-Ranges"] = "bytes"
+        byte_range = _byte_range(byte_range, size)
+        if byte_range:
+            first, last = byte_range
+            headers.update({"Content-Range": f"bytes {first}-{last}/{size}", "Content-Length": str(last - first + 1)})
+            return StreamingResponse(storage.backend.iter_range(path, first, last + 1), status_code=206,
+                                     media_type=media_type, headers=headers)
+    # Blob terkompresi, ber-chunk, atau di packfile: baca/dekompresi streaming langsung ke response, tanpa file sementara
+    headers["Content-Length"] = str(size)
+    blocks = _iter_raw(path, content_hash)
+    if expected:
+        # Checksum tidak cocok memutus stream di akhir: klien tidak menerima file rusak yang tampak lengkap
+        blocks = integrity.verified_stream(blocks, content_hash, expected)
+    return StreamingResponse(blocks, media_type=media_type, headers=headers)
+
+def _attachment_headers(filename):
+    # Sama seperti FileResponse: filename non-ASCII dikirim lewat filename* (RFC 5987)
+    quoted = quote(filename)
+    if quoted != filename:
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
 
 @app.get("/download/{file_id}")
 @limiter.limit("30/minute")
@@ -618,21 +646,24 @@ def download_file(request: Request, file_id: str, x_api_key: str = Depends(api_k
     if not entry:
         logging.warning(f"DOWNLOAD FAIL: file_id={file_id} not found")
         raise HTTPException(status_code=404, detail="File not found")
+    retention.touch(file_id)
     if mode_val == "original":
         orig_path = entry.get("file_path")
-        if not orig_path or not os.path.exists(orig_path):
+        if not orig_path or not blobstore.exists(orig_path, entry.get("content_hash")):
             logging.warning(f"DOWNLOAD FAIL: original file_id={file_id} not found")
             raise HTTPException(status_code=404, detail="Original file not found")
         orig_filename = entry.get("original_filename")
         logging.info(f"DOWNLOAD OK: original file_id={file_id}, filename={orig_filename}")
-        return FileResponse(orig_path, filename=orig_filename)
+        return _blob_response(request, orig_path, entry.get("content_hash"), entry["size_before"], orig_filename,
+                              entry.get("mime_type") or "application/octet-stream")
     else:
         output_path = entry.get("output_path")
-        if not output_path or not os.path.exists(output_path):
+        if not output_path or not blobstore.exists(output_path, entry.get("result_hash")):
             logging.warning(f"DOWNLOAD FAIL: compressed file_id={file_id} not found")
             raise HTTPException(status_code=404, detail="File not compressed yet")
-        compressed_filename = os.path.basename(output_path)
+        compressed_filename = entry.get("compressed_filename") or os.path.basename(output_path)
         logging.info(f"DOWNLOAD OK: compressed file_id={file_id}, filename={compressed_filename}")
-        return FileResponse(output_path, filename=compressed_filename)
+        return _blob_response(request, output_path, entry.get("result_hash"), entry["size_after"], compressed_filename,
+                              mimetypes.guess_type(compressed_filename)[0] or "application/octet-stream")
 
 
@@ -0,0 +1,159 @@
+"""
+Migrasi file ke layout storage ter-shard.
+
+- Blob di layout lama (``blobs/<hash>`` atau konfigurasi SHARD_DEPTH berbeda) dipindah ke path shard saat ini.
+- File lama yang masih datar (``{uuid}_{filename}`` di STORAGE_DIR, ``compressed_*`` di RESULTS_DIR)
+  di-hash lalu dipindah ke blob store, dan metadata-nya dilengkapi (content_hash, result_hash).
+- Chunk CDC (``chunks/<shard>/<hash>``) dipindah ke path shard saat ini.
+- Patch/restore diff datar di RESULTS_DIR dipindah ke ``files/<shard>/<nama>``.
+Kolom file_path/output_path di DB diperbarui. Aman dijalankan ulang: entry yang sudah di layout baru dilewati.
+
+Usage: python -m backend.migrate_layout [--dry-run] [--storage-dir DIR] [--results-dir DIR]
+"""
+import os
+import sys
+import argparse
+import logging
+
+from backend import db_utils
+from backend import blobstore
+from backend import ingest
+from backend import packfile
+from backend import storage
+
+SAVE_BATCH = 500
+
+
+def _root_of(path):
+    marker = os.sep + blobstore.BLOB_DIRNAME + os.sep
+    return path[:path.rindex(marker)] if marker in path else None
+
+
+def migrate_blobs(dry_run=False):
+    """Pindahkan blob ke path shard saat ini. Return mapping path lama -> path baru."""
+    moved = {}
+    updates = []
+    for content_hash, path in db_utils.list_blobs():
+        root = _root_of(path)
+        if root is None:
+            continue
+        target = blobstore.blob_path(root, content_hash)
+        if target == path:
+            continue
+        moved[path] = target
+        updates.append((content_hash, target))
+        if not dry_run and os.path.exists(path):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+    if updates and not dry_run:
+        db_utils.update_blob_paths(updates)
+    return moved
+
+
+def migrate_chunks(dry_run=False):
+    """Pindahkan chunk CDC ke path shard saat ini. Return jumlah chunk yang dipindah."""
+    updates = []
+    for chunk_hash, path in db_utils.list_chunks():
+        marker = os.sep + blobstore.CHUNK_DIRNAME + os.sep
+        if marker not in path:
+            continue
+        target = blobstore.chunk_path(path[:path.rindex(marker)], chunk_hash)
+        if target == path:
+            continue
+        updates.append((chunk_hash, target))
+        if not dry_run and os.path.exists(path):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+    if updates and not dry_run:
+        db_utils.update_chunk_paths(updates)
+    return len(updates)
+
+
+def _is_blob(path, root):
+    # Blob file sendiri atau segment packfile: keduanya sudah di layout baru
+    return path.startswith((os.path.join(root, blobstore.BLOB_DIRNAME) + os.sep,
+                            os.path.join(root, packfile.PACK_DIRNAME) + os.sep))
+
+
+def migrate_entry(entry, moved, storage_dir, results_dir, dry_run=False):
+    """Perbarui path satu entry. Return True jika entry berubah."""
+    changed = False
+    file_path = entry.get("file_path")
+    if file_path in moved:
+        entry["file_path"] = moved[file_path]
+        changed = True
+    elif file_path and os.path.isfile(file_path) and not _is_blob(file_path, storage_dir):
+        content_hash = entry.get("content_hash") or blobstore.hash_file(file_path)
+        if not dry_run:
+            entry["file_path"], _ = blobstore.adopt(file_path, content_hash, storage_dir)
+        entry["content_hash"] = content_hash
+        entry["hash_algorithm"] = ingest.HASH_NAME
+        changed = True
+    output_path = entry.get("output_path")
+    if output_path in moved:
+        entry["output_path"] = moved[output_path]
+        changed = True
+    elif output_path and os.path.isfile(output_path) and not _is_blob(output_path, results_dir):
+        result_hash, result_checksum = blobstore.digest_file(output_path)
+        entry.setdefault("compressed_filename", os.path.basename(output_path))
+        if not dry_run:
+            entry["output_path"], _ = blobstore.adopt(output_path, result_hash, results_dir, result_checksum)
+        entry["result_hash"] = result_hash
+        entry["result_checksum"] = result_checksum
+        changed = True
+    return changed
+
+
+def migrate_named(results_dir, dry_run=False):
+    """Pindahkan patch/restore diff dari RESULTS_DIR datar (satu kali listing, hanya saat migrasi)."""
+    count = 0
+    for name in os.listdir(results_dir):
+        path = os.path.join(results_dir, name)
+        if not name.startswith(("patch_", "restored_")) or not os.path.isfile(path):
+            continue
+        count += 1
+        if not dry_run:
+            target = blobstore.named_path(results_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+    return count
+
+
+def migrate(storage_dir, results_dir, dry_run=False):
+    moved = migrate_blobs(dry_run)
+    chunks = migrate_chunks(dry_run)
+    entries = 0
+    after = ''
+    # Entry dibaca per halaman SAVE_BATCH (keyset pada file_id) dan disimpan per halaman, jadi tabel
+    # results yang besar tidak dimuat sekaligus dan migrasi yang terhenti tidak mengulang halaman tersimpan
+    while True:
+        page = db_utils.load_results_page(after, SAVE_BATCH)
+        if not page:
+            break
+        pending = [(file_id, entry) for file_id, entry in page
+                   if migrate_entry(entry, moved, storage_dir, results_dir, dry_run)]
+        entries += len(pending)
+        if pending and not dry_run:
+            db_utils.save_results_many(pending)
+        after = page[-1][0]
+    named = migrate_named(results_dir, dry_run) if os.path.isdir(results_dir) else 0
+    logging.info(f"MIGRATE LAYOUT: blobs={len(moved)}, chunks={chunks}, entries={entries}, named={named}, dry_run={dry_run}")
+    return {"blobs": len(moved), "chunks": chunks, "entries": entries, "named": named}
+
+
+def main(argv=None):
+    from backend.main import STORAGE_DIR, RESULTS_DIR
+    parser = argparse.ArgumentParser(description="Migrasi storage ke layout ter-shard")
+    parser.add_argument("--storage-dir", default=STORAGE_DIR)
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="Hanya hitung yang akan dipindah")
+    args = parser.parse_args(argv)
+    if not storage.backend.local:
+        parser.error("migrasi layout hanya untuk STORAGE_BACKEND=fs")
+    logging.basicConfig(level=logging.INFO)
+    db_utils.init_db()
+    print(migrate(os.path.abspath(args.storage_dir), os.path.abspath(args.results_dir), args.dry_run))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
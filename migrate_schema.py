@@ -0,0 +1,68 @@
+"""
+Migrasi online tabel results ke skema bertipe.
+
+Format lama menyimpan seluruh entry sebagai JSON di kolom ``data``. init_db hanya menambah kolom bertipe
+(status, mime_type, size_before, size_after, compression_method, created_at, content_hash, owner_key),
+kolom ``extra`` (JSON sisa field), dan index-nya; ALTER TABLE ADD COLUMN tidak menulis ulang tabel, jadi
+service bisa langsung jalan. Baris lama tetap terbaca lewat kolom data, dan setiap baris yang ditulis ulang
+otomatis pindah ke format baru. Sisanya dipindah per batch oleh thread background saat startup (transaksi
+pendek, request tetap dilayani di sela batch) atau manual dengan perintah di bawah. Aman dijalankan ulang.
+Baris lama tidak punya created_at: diisi mtime file upload/hasilnya (NULL jika tidak ada), bukan waktu migrasi.
+
+Usage: python -m backend.migrate_schema [--batch N]
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+import threading
+
+from backend import db_utils
+
+MIGRATE_BATCH = int(os.environ.get('SCHEMA_MIGRATE_BATCH', '500'))
+# Jeda antar batch di service supaya penulis lain mendapat lock
+MIGRATE_PAUSE = 0.05
+
+_thread = None
+
+
+def run(batch=MIGRATE_BATCH, pause=0.0):
+    """Migrasikan semua baris format lama. Return jumlah baris yang dipindah."""
+    total = 0
+    while True:
+        moved = db_utils.migrate_legacy_results(batch)
+        total += moved
+        if moved < batch:
+            break
+        time.sleep(pause)
+    if total:
+        logging.info(f"SCHEMA MIGRATION: {total} entry dipindah ke kolom bertipe")
+    return total
+
+
+def _run_quietly():
+    try:
+        run(pause=MIGRATE_PAUSE)
+    except Exception as e:
+        logging.error(f"SCHEMA MIGRATION gagal: {e}")
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run_quietly, name="schema-migration", daemon=True)
+        _thread.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrasi tabel results ke kolom bertipe")
+    parser.add_argument("--batch", type=int, default=MIGRATE_BATCH)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    db_utils.init_db()
+    print(run(args.batch))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
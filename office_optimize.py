@@ -3,32 +3,49 @@ import os
 import shutil
 from PIL import Image
 
-def optimize_office_images(input_path, output_path, quality=75):
+from backend import scratch
+
+def optimize_office_images(input_path, output_path, quality=75, ext=None):
     """
     Optimizes images inside .docx, .pptx, or .xlsx files by recompressing images in the media folder.
     Args:
         input_path: Path to the input Office file
         output_path: Path to save the optimized Office file
         quality: JPEG/WebP quality for recompression (default: 75)
+        ext: Office extension (e.g. '.docx') when input_path has none (default: taken from input_path)
     """
     ext_map = {
         '.docx': ('word/media',),
         '.pptx': ('ppt/media',),
         '.xlsx': ('xl/media',)
     }
-    ext = os.path.splitext(input_path)[1].lower()
+    ext = (ext or os.path.splitext(input_path)[1]).lower()
     if ext not in ext_map:
         raise ValueError('Unsupported Office format for optimization')
-    temp_dir = f"_office_opt_temp_{os.getpid()}"
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-    os.makedirs(temp_dir)
-    # Extract all
-    with zipfile.ZipFile(input_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
+    # Workspace unik per panggilan: job Office yang berjalan bersamaan tidak berbagi direktori
+    with scratch.workspace('office') as ws:
+        temp_dir = ws.file('extracted')
+        # Extract all (ukuran hasil ekstraksi dipesan dulu supaya zip bomb tidak memenuhi scratch)
+        with zipfile.ZipFile(input_path, 'r') as zip_ref:
+            ws.reserve(sum(info.file_size for info in zip_ref.infolist()))
+            zip_ref.extractall(temp_dir)
+        optimized = _optimize_media(temp_dir, ext_map[ext], quality)
+        ws.check()
+        # Repack zip (ditulis langsung, tanpa make_archive yang mengganti cwd proses)
+        packed_path = ws.file('repacked.zip')
+        with zipfile.ZipFile(packed_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+            for dirpath, _, filenames in os.walk(temp_dir):
+                for fname in filenames:
+                    fpath = os.path.join(dirpath, fname)
+                    zip_out.write(fpath, os.path.relpath(fpath, temp_dir))
+        shutil.move(packed_path, output_path)
+    return optimized
+
+
+def _optimize_media(temp_dir, media_folders, quality):
     # Optimize images in media folder(s)
     optimized = False
-    for media_folder in ext_map[ext]:
+    for media_folder in media_folders:
         media_path = os.path.join(temp_dir, media_folder)
         if os.path.exists(media_path):
             for fname in os.listdir(media_path):
@@ -50,8 +67,4 @@ def optimize_office_images(input_path, output_path, quality=75):
                         optimized = True
                 except Exception:
                     continue
-    # Repack zip
-    shutil.make_archive(temp_dir, 'zip', temp_dir)
-    shutil.move(f"{temp_dir}.zip", output_path)
-    shutil.rmtree(temp_dir)
     return optimized
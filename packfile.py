@@ -0,0 +1,193 @@
+"""
+Packfile untuk blob kecil.
+
+Blob yang ukurannya tidak lebih dari PACK_MAX_KB tidak disimpan sebagai file sendiri, melainkan
+ditambahkan (append) ke segment besar ``<root>/packs/<id>.pack``. Posisi blob (path segment, offset,
+size) dicatat di tabel ``blobs`` (kolom pack_offset), dan dibaca dengan ``os.pread`` tanpa seek.
+Byte blob yang refcount-nya habis dicatat sebagai ``dead`` di tabel ``pack_segments``; compaction menulis
+ulang segment yang dead ratio-nya di atas PACK_COMPACT_RATIO hanya berisi blob yang masih hidup.
+
+Path segment tidak pernah berubah (compaction menulis ke file sementara lalu rename ke path yang sama),
+jadi path yang tersimpan di metadata file tetap valid; hanya offset di tabel blobs yang diperbarui.
+Append dan compaction dipanggil dengan lock blobstore; lock modul ini menjaga pembaca tidak mengambil
+offset baru dengan file lama (atau sebaliknya) saat segment diganti.
+
+Antar proses (beberapa worker uvicorn, cleanup.py): segment hanya di-append oleh proses pembuatnya, yang
+memegang flock eksklusif atas segment itu selama segment masih aktif. Proses lain hanya meng-compact segment
+yang flock-nya bebas (sudah ditutup karena penuh, atau prosesnya sudah mati), sehingga byte yang baru
+di-append tidak pernah jatuh ke inode lama yang sudah diganti compaction.
+"""
+import os
+import uuid
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: tanpa lock antar proses
+    fcntl = None
+
+from backend import db_utils
+
+PACK_DIRNAME = 'packs'
+# Blob <= PACK_MAX_KB disimpan di packfile; 0 = nonaktif (setiap blob file sendiri)
+PACK_MAX_KB = int(os.environ.get('PACK_MAX_KB', '0'))
+PACK_SEGMENT_MB = int(os.environ.get('PACK_SEGMENT_MB', '64'))
+# Segment di-compact jika byte mati >= ratio ini dari ukuran segment
+PACK_COMPACT_RATIO = float(os.environ.get('PACK_COMPACT_RATIO', '0.5'))
+
+_lock = threading.Lock()
+# Segment aktif per root: root -> (path, size, fd yang memegang flock). Segment baru dibuat per proses,
+# jadi tidak ada dua penulis
+_active = {}
+
+
+def accepts(size):
+    return PACK_MAX_KB > 0 and size <= PACK_MAX_KB * 1024
+
+
+def is_segment(path):
+    return os.path.basename(os.path.dirname(path)) == PACK_DIRNAME
+
+
+def _lock_segment(path, flags=os.O_RDWR, blocking=True):
+    """Buka path dan ambil flock eksklusif. Return fd, atau None jika segment sedang dipegang proses lain."""
+    fd = os.open(path, flags, 0o644)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            os.close(fd)
+            return None
+    return fd
+
+
+def _new_segment(root):
+    pack_dir = os.path.join(root, PACK_DIRNAME)
+    os.makedirs(pack_dir, exist_ok=True)
+    path = os.path.join(pack_dir, f"{uuid.uuid4().hex}.pack")
+    return path, 0, _lock_segment(path, os.O_RDWR | os.O_CREAT | os.O_EXCL)
+
+
+def _seal(root):
+    # Segment tidak lagi di-append proses ini; flock dilepas supaya proses lain boleh meng-compact-nya
+    _, _, fd = _active.pop(root)
+    os.close(fd)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def append(root, src_path):
+    """Tambahkan isi src_path ke segment aktif root. Return (segment_path, offset). Dipanggil dengan lock blobstore."""
+    with open(src_path, 'rb') as f:
+        data = f.read()
+    active = _active.get(root)
+    if active and active[1] and active[1] + len(data) > PACK_SEGMENT_MB * 1024 * 1024:
+        _seal(root)
+    if root not in _active:
+        _active[root] = _new_segment(root)
+    segment, size, fd = _active[root]
+    # Tulis di offset yang tercatat, bukan di akhir file: sisa append yang gagal sebelumnya ikut tertimpa
+    os.lseek(fd, size, os.SEEK_SET)
+    _write_all(fd, data)
+    os.ftruncate(fd, size + len(data))
+    db_utils.save_pack_segment(segment, root, size + len(data))
+    _active[root] = (segment, size + len(data), fd)
+    return segment, size
+
+
+def _pread_all(fd, size, offset):
+    chunks = []
+    while size > 0:
+        chunk = os.pread(fd, size, offset)
+        if not chunk:
+            raise OSError(f"Segment terpotong di offset {offset}")
+        chunks.append(chunk)
+        size -= len(chunk)
+        offset += len(chunk)
+    return b"".join(chunks)
+
+
+def read(content_hash):
+    """Baca isi blob yang tersimpan di packfile. Return bytes, atau None jika blob tidak ada di packfile."""
+    with _lock:
+        blob = db_utils.get_blob(content_hash)
+        if not blob or blob["pack_offset"] is None:
+            return None
+        fd = os.open(blob["path"], os.O_RDONLY)
+    try:
+        return _pread_all(fd, blob["size"], blob["pack_offset"])
+    finally:
+        os.close(fd)
+
+
+def compact(segment):
+    """
+    Tulis ulang segment hanya dengan blob yang masih hidup. Segment tanpa blob hidup dihapus.
+    Return jumlah byte yang dibebaskan. Dipanggil dengan lock blobstore (tidak ada append/release bersamaan
+    di proses ini). Segment yang masih aktif di proses lain dilewati (return 0).
+    """
+    root = next((r for r, (path, _, _) in _active.items() if path == segment), None)
+    lock_fd = None
+    if root is None:
+        try:
+            lock_fd = _lock_segment(segment, os.O_RDONLY, blocking=False)
+        except FileNotFoundError:
+            lock_fd = None
+            if db_utils.pack_blobs(segment):
+                raise
+        else:
+            if lock_fd is None:
+                logging.info(f"PACK COMPACTION DILEWATI: {segment} masih di-append proses lain")
+                return 0
+    try:
+        return _compact_locked(segment, root)
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)
+
+
+def _compact_locked(segment, root):
+    # Dipanggil dengan flock segment dipegang (fd aktif proses ini, atau lock_fd di compact)
+    live = db_utils.pack_blobs(segment)
+    old_size = os.path.getsize(segment) if os.path.exists(segment) else 0
+    if not live:
+        with _lock:
+            db_utils.delete_pack_segment(segment)
+            if os.path.exists(segment):
+                os.remove(segment)
+        if root is not None:
+            _seal(root)
+        return old_size
+    tmp_path = f"{segment}.compact-{os.getpid()}"
+    offsets = []
+    new_size = 0
+    src = os.open(segment, os.O_RDONLY)
+    # File baru sudah di-flock sebelum rename, jadi tidak ada saat path segment tanpa lock
+    dst = _lock_segment(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+    try:
+        for content_hash, offset, size in live:
+            _write_all(dst, _pread_all(src, size, offset))
+            offsets.append((content_hash, new_size))
+            new_size += size
+    except OSError:
+        os.close(dst)
+        os.remove(tmp_path)
+        raise
+    finally:
+        os.close(src)
+    with _lock:
+        os.replace(tmp_path, segment)
+        db_utils.replace_pack_segment(segment, offsets, new_size)
+    if root is not None:
+        # Segment aktif proses ini: append berikutnya lewat fd file baru
+        os.close(_active[root][2])
+        _active[root] = (segment, new_size, dst)
+    else:
+        os.close(dst)
+    logging.info(f"PACK COMPACTED: {segment} ({old_size} -> {new_size} bytes, {len(live)} blob)")
+    return old_size - new_size
@@ -3,18 +3,24 @@ import sys
 import os
 import shutil
 import subprocess
-import tempfile
+
+from backend import scratch
+
 
 def compress_pdf(input_path, output_path):
     import shutil
     import subprocess
-    import tempfile
     import os
     gs_path = shutil.which('gswin64c') or shutil.which('gswin32c') or shutil.which('gs')
     if not gs_path:
         raise RuntimeError('Ghostscript (gs) not found in PATH')
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix='.pdf')
-    os.close(tmp_fd)
+    with scratch.workspace('pdf') as ws:
+        return _run_gs(gs_path, input_path, output_path, ws)
+
+
+def _run_gs(gs_path, input_path, output_path, ws):
+    # Output dan file sementara Ghostscript (TMPDIR) ada di workspace; dihapus bersama workspace
+    tmp_path = ws.file('output.pdf')
     cmd = [
         gs_path,
         '-sDEVICE=pdfwrite',
@@ -26,21 +32,30 @@ def compress_pdf(input_path, output_path):
         f'-sOutputFile={tmp_path}',
         input_path
     ]
+    from backend import supervisor
+    # Ukuran output dibatasi sisa kuota workspace selama Ghostscript menulis (RLIMIT_FSIZE)
+    limit = ws.file_limit()
     try:
-        subprocess.run(cmd, check=True)
+        try:
+            supervisor.run_tool('gs', cmd, env=ws.tool_env(), max_file_bytes=limit)
+        except supervisor.ToolError:
+            ws.check_truncated(tmp_path, limit)
+            raise
         if os.path.exists(tmp_path):
+            ws.check()
             shutil.move(tmp_path, output_path)
             return "gs"
         else:
             raise RuntimeError('Ghostscript did not produce output')
+    except (supervisor.ToolError, scratch.ScratchQuotaExceeded):
+        # Timeout/pembatalan/kuota diteruskan apa adanya supaya status code-nya tidak hilang
+        raise
     except Exception as e:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
         raise RuntimeError(f'Ghostscript PDF compression failed: {e}')
 
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
-        print("Usage: python pdf_optimize.py input.pdf output.pdf")
+        print("Usage: python -m backend.pdf_optimize input.pdf output.pdf")
         sys.exit(1)
     compress_pdf(sys.argv[1], sys.argv[2])
@@ -0,0 +1,410 @@
+"""
+Pipeline kompresi bertahap: sniff -> (cache) -> analyze -> encode -> persist.
+
+Setiap tahap dijalankan tepat satu kali per file. Codec dicari lewat registry
+berdasarkan MIME type (exact), ekstensi, lalu keluarga MIME (misal ``image/*``).
+Durasi tiap tahap disimpan ke metadata di field ``timings``.
+"""
+import io
+import os
+import time
+import uuid
+import shutil
+import logging
+from collections import namedtuple
+
+from fastapi import HTTPException
+
+from backend import utils
+from backend import ingest
+from backend import db_utils
+from backend import procpool
+from backend import supervisor
+from backend import blobstore
+from backend import features
+
+TEXT_EXTENSIONS = [".txt", ".csv", ".json", ".xml", ".html"]
+UNSUPPORTED_METHODS = {
+    "lzma": "LZMA compression not implemented yet.",
+    "flif": "FLIF compression not implemented yet.",
+    "heic": "HEIC compression not implemented yet.",
+}
+ARCHIVE_WARNING = "File arsip seperti ZIP, RAR, 7z, dan TAR biasanya sudah terkompresi optimal. Tidak dilakukan kompresi ulang."
+WEBP_QUALITY = 80
+OFFICE_IMAGE_QUALITY = 75
+VIDEO_BITRATE = "1000k"
+AUDIO_BITRATE = "128k"
+# Entropi (bit/byte) di atas batas ini dianggap tidak bisa dikompresi lagi
+HIGH_ENTROPY = 7.5
+GZIP_FAST_LEVEL = 1
+
+# name: nama codec, encode: fungsi (input_path, output_path, features) -> metode yang dipakai, atau
+# (metode, (content_hash, checksum)) jika codec menulis output lewat blobstore.DigestWriter,
+# features: fitur file dari metadata (entropy, img_res, pdf_pages, format) supaya codec tidak membaca ulang file,
+# suffix: akhiran file output, strip_ext: buang ekstensi asli sebelum menambah suffix,
+# warning: catatan yang disimpan ke metadata setelah encode,
+# params: parameter encoding yang ikut menentukan cache key hasil kompresi,
+# lossless: nama encoding (lihat blobstore.DECODERS) jika output bisa didekompresi kembali menjadi original persis
+Codec = namedtuple('Codec', ['name', 'encode', 'suffix', 'strip_ext', 'warning', 'params', 'lossless'],
+                   defaults=('', False, None, None, None))
+
+CODECS = {}
+MIME_CODECS = {}
+EXT_CODECS = {}
+
+
+def register_codec(name, encode, mime_types=(), extensions=(), **options):
+    """Daftarkan codec dan petakan MIME type/ekstensi ke codec tersebut."""
+    codec = Codec(name, encode, **options)
+    CODECS[name] = codec
+    for mime_type in mime_types:
+        MIME_CODECS[mime_type] = name
+    for ext in extensions:
+        EXT_CODECS[ext.lower()] = name
+    return codec
+
+
+def lookup_codec(mime_type, ext):
+    """Cari codec: MIME exact, lalu ekstensi, lalu wildcard keluarga MIME (``image/*``)."""
+    mime_type = mime_type or ""
+    name = MIME_CODECS.get(mime_type) or EXT_CODECS.get((ext or "").lower())
+    if not name and "/" in mime_type:
+        name = MIME_CODECS.get(mime_type.split("/")[0] + "/*")
+    return CODECS.get(name) if name else None
+
+
+def output_path_for(codec, results_dir, file_id, filename):
+    output_path = os.path.join(results_dir, f"compressed_{file_id}_{filename}")
+    if not codec.suffix or output_path.lower().endswith(codec.suffix):
+        return output_path
+    if codec.strip_ext:
+        output_path = os.path.splitext(output_path)[0]
+    return output_path + codec.suffix
+
+
+# --- Codec ---
+
+def _encode_pdf(input_path, output_path, file_features):
+    from backend import pdf_optimize
+    return pdf_optimize.compress_pdf(input_path, output_path)
+
+
+def _encode_webp(input_path, output_path, file_features):
+    procpool.run(utils.compress_webp, input_path, output_path, quality=WEBP_QUALITY)
+    return "webp"
+
+
+def _encode_mp4(input_path, output_path, file_features):
+    ffmpeg_cmd = [
+        "ffmpeg", "-y", "-nostats", "-loglevel", "error", "-i", input_path,
+        "-b:v", VIDEO_BITRATE,
+        "-b:a", AUDIO_BITRATE,
+        output_path
+    ]
+    supervisor.run_tool("ffmpeg", ffmpeg_cmd)
+    return "ffmpeg"
+
+
+def _encode_gzip(input_path, output_path, file_features):
+    # Data berentropi tinggi (sudah terkompresi/acak) hampir tidak mengecil; pakai level cepat
+    entropy = (file_features or {}).get("entropy")
+    level = GZIP_FAST_LEVEL if entropy is not None and entropy >= HIGH_ENTROPY else 9
+    with blobstore.DigestWriter(output_path) as out:
+        utils.compress_gzip(input_path, out, compresslevel=level)
+    return "gzip", out.digest()
+
+
+def _encode_office(input_path, output_path, file_features):
+    from backend.office_optimize import optimize_office_images
+    # Blob input tidak berekstensi; format Office diambil dari nama output (ekstensi asli dipertahankan)
+    ext = os.path.splitext(output_path)[1].lower()
+    try:
+        optimized = procpool.run(optimize_office_images, input_path, output_path, quality=OFFICE_IMAGE_QUALITY, ext=ext)
+        logging.info(f"Optimized Office file: {input_path} -> {output_path} (images compressed: {optimized})")
+        return "office_optimize"
+    except Exception as e:
+        logging.warning(f"Failed to optimize Office file, fallback to copy: {input_path} | Error: {e}")
+        shutil.copyfile(input_path, output_path)
+        return "copy"
+
+
+def _encode_copy(input_path, output_path, file_features):
+    with open(input_path, 'rb') as src, blobstore.DigestWriter(output_path) as out:
+        shutil.copyfileobj(src, out, ingest.WRITE_BLOCK)
+    return "copy", out.digest()
+
+
+register_codec("pdf_optimize", _encode_pdf, mime_types=["application/pdf"], extensions=[".pdf"], suffix=".pdf")
+register_codec("webp", _encode_webp, mime_types=["image/*"], suffix=".webp", params={"quality": WEBP_QUALITY})
+register_codec("ffmpeg", _encode_mp4, mime_types=["video/mp4"], extensions=[".mp4"], suffix="_compressed.mp4", strip_ext=True,
+               params={"video_bitrate": VIDEO_BITRATE, "audio_bitrate": AUDIO_BITRATE})
+register_codec("gzip", _encode_gzip,
+               mime_types=["text/*", "text/plain", "text/csv", "application/json", "application/xml", "text/html"],
+               extensions=TEXT_EXTENSIONS, suffix=".gz", lossless="gzip")
+register_codec("office_optimize", _encode_office, extensions=[".pptx", ".docx", ".xlsx"], params={"quality": OFFICE_IMAGE_QUALITY})
+register_codec("copy", _encode_copy,
+               mime_types=["application/zip", "application/x-rar-compressed", "application/x-7z-compressed", "application/x-tar"],
+               extensions=[".zip", ".rar", ".7z", ".tar"], warning=ARCHIVE_WARNING)
+
+
+# --- Tahapan pipeline ---
+
+def sniff(entry):
+    """Tentukan format file (MIME + ekstensi) dan codec yang akan dipakai."""
+    ext = os.path.splitext(entry["original_filename"])[1].lower()
+    mime_type = entry.get("mime_type")
+    if not mime_type or mime_type == "application/octet-stream":
+        if entry.get("features"):
+            mime_type = entry["features"].get("format") or mime_type
+        else:
+            with blobstore.open_raw(entry["file_path"], entry.get("content_hash")) as f:
+                mime_type = utils.sniff_mime(f.read(utils.SNIFF_BYTES)) or mime_type
+    codec = lookup_codec(mime_type, ext)
+    if codec is None:
+        raise HTTPException(status_code=415, detail="Tipe file ini belum didukung untuk kompresi. Hanya gambar, dokumen teks, PDF, dan Office.")
+    return mime_type or "", ext, codec
+
+
+def select_method(entry, mime_type, method, profile):
+    """Tentukan metode untuk ai/auto; raise 501 untuk metode yang belum diimplementasikan."""
+    chosen_method = method.value if hasattr(method, 'value') else method
+    if chosen_method == "ai":
+        chosen_method = utils.ai_selector_stub(mime_type, entry.get("size_before"), entry['original_filename'], profile,
+                                               features=entry.get("features"))
+    elif chosen_method == "auto":
+        chosen_method = utils.auto_select_compression(mime_type)
+    if chosen_method in UNSUPPORTED_METHODS:
+        raise HTTPException(status_code=501, detail=UNSUPPORTED_METHODS[chosen_method])
+    return chosen_method
+
+
+def stored_features(entry, mime_type=None):
+    """
+    Fitur file dari metadata (dihitung saat ingest). Entry lama tanpa fitur dihitung sekali di sini
+    dari sampel awal file lalu disimpan ke entry, supaya tahap berikutnya tidak membaca file lagi.
+    """
+    if not entry.get("features"):
+        try:
+            with blobstore.raw_path(entry["file_path"], entry.get("content_hash")) as path:
+                entry["features"] = features.extract_file(path, mime_type, entry.get("content_hash"))
+        except Exception as e:
+            logging.warning(f"Gagal ekstraksi fitur: {entry['original_filename']} | Error: {e}")
+            entry["features"] = {}
+    return entry["features"]
+
+
+def analyze(entry, mime_type, ext, method, sensitive_mode, profile):
+    """Pilih metode (ai/auto) dan deteksi entitas sensitif, memakai fitur file yang tersimpan di metadata."""
+    input_path = entry["file_path"]
+    stored = stored_features(entry, mime_type)
+    chosen_method = select_method(entry, mime_type, method, profile)
+    # Analisis NLP jika sensitive_mode dan file teks
+    if sensitive_mode and (mime_type.startswith("text/") or ext in TEXT_EXTENSIONS):
+        from backend import nlp_utils
+        try:
+            with io.TextIOWrapper(blobstore.open_raw(input_path, entry.get("content_hash")), encoding='utf-8', errors='ignore') as f:
+                text = f.read(100000)
+            entry['sensitive_entities'] = nlp_utils.detect_sensitive_entities(text)
+        except Exception:
+            pass
+    # Ringkasan untuk AI selector di metadata (format lama, diambil dari fitur tersimpan)
+    entry["ai_analysis"] = {key: stored.get(key) for key in ("entropy", "pdf_pages", "img_res")}
+    return chosen_method
+
+
+def encode(codec, input_path, output_path, filename, file_features=None):
+    """
+    Jalankan codec ke output_path. Return (metode yang dipakai, digest), digest berisi (content_hash, checksum)
+    jika codec sudah menghitungnya saat menulis, selain itu None (dihitung persist).
+    """
+    # Tulis ke file sementara di folder yang sama lalu rename atomik, supaya pembaca tidak pernah
+    # melihat output setengah jadi. Prefix (bukan suffix) agar ekstensi tetap dikenali ffmpeg/Pillow.
+    out_dir, out_name = os.path.split(output_path)
+    tmp_path = os.path.join(out_dir, f".tmp-{uuid.uuid4().hex}-{out_name}")
+    try:
+        method_used = codec.encode(input_path, tmp_path, file_features)
+        digest = None
+        if isinstance(method_used, tuple):
+            method_used, digest = method_used
+        # Tool yang crash bisa meninggalkan output kosong tanpa exit code error
+        if not os.path.getsize(tmp_path) and os.path.getsize(input_path):
+            raise RuntimeError("output kosong")
+        os.replace(tmp_path, output_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        logging.error(f"Kompresi {codec.name} gagal: {filename} | Error: {e}")
+        raise HTTPException(status_code=getattr(e, 'status_code', 500), detail=f"Kompresi {codec.name} gagal: {e}")
+    logging.info(f"Kompresi {codec.name} sukses: {filename} -> {output_path}")
+    return method_used or codec.name, digest
+
+
+def _set_result(entry, output_path, result_hash, compressed_filename):
+    # Return hash hasil lama: referensinya baru dilepas setelah entry baru tersimpan, jadi jika tulis DB
+    # gagal entry di DB tetap menunjuk blob yang masih ada
+    previous = entry.get('result_hash')
+    entry['output_path'] = output_path
+    entry['result_hash'] = result_hash
+    entry['compressed_filename'] = compressed_filename
+    return previous
+
+
+def persist(file_id, entry, output_path, method_used, codec, timings, cache_key=None, compressed_filename=None, digest=None):
+    # Durasi persist dihitung sampai sebelum tulis DB, karena timings ikut disimpan di tulisan yang sama
+    start = time.perf_counter()
+    compressed_filename = compressed_filename or os.path.basename(output_path)
+    # Content hash dan checksum integritas: dari codec (dihitung saat menulis) atau satu baca sebelum masuk blob store
+    result_hash, result_checksum = digest or blobstore.digest_file(output_path)
+    entry['result_checksum'] = result_checksum
+    # Ukuran diambil sebelum adopt: hasil kecil bisa masuk packfile sehingga path-nya adalah segment
+    entry['size_after'] = os.path.getsize(output_path)
+    blob_path, _ = blobstore.adopt(output_path, result_hash, os.path.dirname(output_path), result_checksum)
+    try:
+        previous = _set_result(entry, blob_path, result_hash, compressed_filename)
+        entry['compression_method'] = method_used
+        entry['status'] = 'compressed'
+        entry['cache_hit'] = False
+        if codec.warning:
+            entry['warning'] = codec.warning
+        if cache_key:
+            blobstore.store_result(cache_key, entry.get('content_hash'), codec.name, result_hash,
+                                   entry['size_after'], method_used, codec.warning, result_checksum)
+        # Original cukup disimpan dalam bentuk hasil lossless-nya (method_used bisa berbeda jika codec fallback)
+        if blobstore.STORE_ORIGINALS_COMPRESSED and codec.lossless and method_used == codec.name and entry.get('content_hash'):
+            blobstore.pack_original(entry['content_hash'], blob_path, codec.lossless, entry.get('size_before') or 0)
+        timings['persist'] = round(time.perf_counter() - start, 4)
+        entry['timings'] = timings
+        entry['elapsed'] = round(sum(timings.values()), 4)
+        db_utils.save_result(file_id, entry)
+    except Exception:
+        # Referensi dari adopt tidak tercatat di entry mana pun
+        blobstore.release(result_hash)
+        raise
+    blobstore.release(previous)
+
+
+def result_cache_key(entry, codec, profile):
+    if not entry.get('content_hash'):
+        return None
+    return blobstore.cache_key(entry['content_hash'], codec, profile)
+
+
+def reuse(file_id, entry, codec, cached, results_dir, timings):
+    """Pakai hasil kompresi tersimpan (cache hit) untuk entry ini tanpa encode ulang."""
+    compressed_filename = os.path.basename(output_path_for(codec, results_dir, file_id, entry['original_filename']))
+    previous = _set_result(entry, cached['output_path'], cached['result_hash'], compressed_filename)
+    entry['size_after'] = cached['size_after']
+    entry['result_checksum'] = cached.get('checksum')
+    entry['compression_method'] = cached['compression_method']
+    entry['status'] = 'compressed'
+    entry['cache_hit'] = True
+    if cached.get('warning'):
+        entry['warning'] = cached['warning']
+    entry['timings'] = timings
+    entry['elapsed'] = round(sum(timings.values()), 4)
+    try:
+        db_utils.save_result(file_id, entry)
+    except Exception:
+        # Referensi yang diambil lookup_result tidak tercatat di entry mana pun
+        blobstore.release(cached['result_hash'])
+        raise
+    blobstore.release(previous)
+    logging.info(f"RESULT CACHE HIT: file_id={file_id}, codec={codec.name}")
+    return entry
+
+
+def lookup_cached(file_id, method, results_dir, profile='default'):
+    """
+    Cek cache hasil untuk file_id tanpa menjalankan encoder. Return entry terbaru jika hasil
+    untuk (content hash, codec, profile, parameter) sudah ada, atau None jika perlu di-encode.
+    """
+    entry = db_utils.load_result(file_id)
+    if not entry or not entry.get('content_hash'):
+        return None
+    profile = profile or 'default'
+    start = time.perf_counter()
+    try:
+        mime_type, ext, codec = sniff(entry)
+        select_method(entry, mime_type, method, profile)
+    except HTTPException:
+        # Error dilaporkan lewat job biasa supaya perilakunya sama dengan jalur encode
+        return None
+    cached = blobstore.lookup_result(result_cache_key(entry, codec, profile))
+    if not cached:
+        return None
+    return reuse(file_id, entry, codec, cached, results_dir, {'cache': round(time.perf_counter() - start, 4)})
+
+
+def run(file_id, method, results_dir, sensitive_mode=False, profile='default'):
+    """
+    Jalankan pipeline untuk satu file yang sudah diupload dan kembalikan entry metadata terbaru.
+    Hasil yang sudah ada di cache (isi file, codec, profile, dan parameter sama) dipakai ulang,
+    kecuali sensitive_mode yang selalu menjalankan analisis dan hasilnya tidak disimpan ke cache.
+    Raise HTTPException (404/415/501/500) jika gagal.
+    """
+    entry = db_utils.load_result(file_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="File not found")
+    profile = profile or 'default'
+    timings = {}
+
+    start = time.perf_counter()
+    mime_type, ext, codec = sniff(entry)
+    timings['sniff'] = round(time.perf_counter() - start, 4)
+
+    # Hasil sensitive_mode tidak dibaca dari maupun ditulis ke cache hasil
+    key = None if sensitive_mode else result_cache_key(entry, codec, profile)
+    if key:
+        start = time.perf_counter()
+        select_method(entry, mime_type, method, profile)
+        cached = blobstore.lookup_result(key)
+        timings['cache'] = round(time.perf_counter() - start, 4)
+        if cached:
+            if mime_type:
+                entry['mime_type'] = mime_type
+            return reuse(file_id, entry, codec, cached, results_dir, timings)
+
+    start = time.perf_counter()
+    analyze(entry, mime_type, ext, method, sensitive_mode, profile)
+    timings['analyze'] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    compressed_filename = os.path.basename(output_path_for(codec, results_dir, file_id, entry['original_filename']))
+    # Path output unik per job: job lain untuk file yang sama (misal dengan sensitive_mode) tidak
+    # menimpa atau memindahkan output ini sebelum masuk blob store
+    output_path = os.path.join(results_dir, f".job-{uuid.uuid4().hex}-{compressed_filename}")
+    with blobstore.raw_path(entry["file_path"], entry.get("content_hash")) as input_path:
+        method_used, digest = encode(codec, input_path, output_path, entry['original_filename'], entry.get("features"))
+    timings['encode'] = round(time.perf_counter() - start, 4)
+
+    if mime_type:
+        entry['mime_type'] = mime_type
+    try:
+        persist(file_id, entry, output_path, method_used, codec, timings, key, compressed_filename, digest)
+    finally:
+        # Sudah dipindah ke blob store jika sukses
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    return entry
+
+
+def build_response(file_id, entry):
+    """Bentuk response standar untuk file yang sudah dikompresi."""
+    size_before = entry.get("size_before")
+    size_after = entry.get("size_after")
+    return {
+        "status": "ok",
+        "file_id": file_id,
+        "original_filename": entry.get("original_filename"),
+        "compressed_filename": entry.get("compressed_filename") or os.path.basename(entry.get("output_path") or ""),
+        "mime_type": entry.get("mime_type"),
+        "size_before": size_before,
+        "size_after": size_after,
+        "compression_method": entry.get("compression_method"),
+        "ratio": round(size_after / size_before, 4) if size_before and size_after else None,
+        "elapsed": entry.get("elapsed"),
+        "timings": entry.get("timings"),
+        "cache_hit": entry.get("cache_hit", False),
+        "checksum": entry.get("result_checksum"),
+        "download_url": f"/download/{file_id}"
+    }
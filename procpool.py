@@ -0,0 +1,107 @@
+"""
+Process pool yang sudah dipanaskan untuk codec CPU-bound (WebP, Brotli, optimasi gambar Office, bsdiff4).
+
+Codec ini berjalan di proses terpisah supaya tidak rebutan GIL dengan thread request/job.
+Worker mengimpor Pillow, pikepdf, brotli, dan bsdiff4 sekali saat start. Ukuran pool
+mengikuti kuota CPU cgroup container (bisa dioverride dengan CODEC_WORKERS).
+Argumen yang dikirim ke worker berupa path file, bukan isi file.
+"""
+import os
+import math
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_pool = None
+_lock = threading.Lock()
+
+
+def cgroup_cpu_limit():
+    """Kuota CPU dari cgroup v2 (cpu.max) atau v1 (cfs_quota_us), dibulatkan ke atas. None jika tidak dibatasi."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def pool_size():
+    if os.environ.get('CODEC_WORKERS'):
+        return max(1, int(os.environ['CODEC_WORKERS']))
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(available, limit) if limit else available
+
+
+def _warm_worker():
+    # Impor library berat sekali per worker, bukan per job
+    from PIL import Image
+    import pikepdf  # noqa: F401
+    import brotli  # noqa: F401
+    import bsdiff4  # noqa: F401
+    Image.init()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _mp_context():
+    # Hindari fork dari server yang sudah multi-thread
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def start():
+    """Buat pool dan spawn semua worker sekarang supaya job pertama tidak menanggung biaya start."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            return _pool
+        size = pool_size()
+        _pool = ProcessPoolExecutor(max_workers=size, mp_context=_mp_context(), initializer=_warm_worker)
+        pids = {f.result() for f in [_pool.submit(_ping) for _ in range(size)]}
+        logging.info(f"CODEC POOL READY: workers={size}, pids={sorted(pids)}")
+        return _pool
+
+
+def run(fn, *args, **kwargs):
+    """Jalankan fn(*args) di process pool dan tunggu hasilnya. fn harus fungsi level modul."""
+    global _pool
+    pool = _pool or start()
+    try:
+        return pool.submit(fn, *args, **kwargs).result()
+    except BrokenProcessPool:
+        # Worker mati (misal crash di library C); buat ulang pool untuk job berikutnya
+        logging.error(f"CODEC POOL BROKEN while running {getattr(fn, '__name__', fn)}, restarting")
+        with _lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False)
+        raise
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
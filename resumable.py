@@ -0,0 +1,244 @@
+"""
+Upload resumable berbasis chunk untuk file besar.
+
+Alur: create (POST /uploads) -> PATCH /uploads/{file_id} dengan header Upload-Offset per chunk
+-> finalize (POST /uploads/{file_id}/finalize). Chunk ditulis langsung ke posisinya di file
+parsial dengan pwrite, sehingga client boleh mengirim beberapa chunk paralel dan urutannya bebas.
+Rentang byte yang sudah diterima disimpan di metadata (db_utils) dan diperbarui secara atomik;
+client yang terputus cukup membaca GET /uploads/{file_id} lalu melanjutkan dari rentang yang belum ada.
+
+Chunk ditulis sambil memegang flock bersama atas file parsial (status dicek ulang setelah lock didapat),
+sedangkan finalize mengubah status ke finalizing dengan flock eksklusif. Jadi tidak ada byte yang ditulis
+setelah finalize mulai meng-hash file, juga dari worker proses lain.
+"""
+import os
+import uuid
+import shutil
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: tanpa lock antar proses
+    fcntl = None
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from backend import db_utils
+from backend import ingest
+from backend import blobstore
+from backend import utils
+from backend import features
+from backend import retention
+
+UPLOADING_STATUSES = ("uploading", "finalizing")
+
+
+def _merge_range(ranges, start, end):
+    """Gabungkan [start, end) ke daftar rentang terurut yang tidak saling tumpang tindih."""
+    merged = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def contiguous_offset(ranges):
+    """Offset pertama yang belum diterima (akhir rentang yang dimulai dari 0)."""
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def session_view(file_id, entry):
+    received = entry.get("received") or []
+    return {
+        "file_id": file_id,
+        "filename": entry.get("original_filename"),
+        "mime_type": entry.get("mime_type"),
+        "status": entry.get("status"),
+        "size": entry.get("upload_size") or entry.get("size_before"),
+        "received": received,
+        "offset": contiguous_offset(received) if entry.get("status") in UPLOADING_STATUSES else entry.get("size_before"),
+        "content_hash": entry.get("content_hash"),
+    }
+
+
+def _load_session(file_id):
+    entry = db_utils.load_result(file_id)
+    if not entry or "upload_size" not in entry:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return entry
+
+
+def create(storage_dir, filename, size, content_type=None, owner=None):
+    """Buat sesi upload: file parsial dialokasikan sesuai ukuran total, metadata berstatus uploading."""
+    max_bytes = ingest.MAX_UPLOAD_MB * 1024 * 1024
+    if size < 0:
+        raise HTTPException(status_code=422, detail="Ukuran upload tidak valid")
+    if size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File terlalu besar (maksimal {ingest.MAX_UPLOAD_MB}MB)")
+    file_id = str(uuid.uuid4())
+    filename = ingest.safe_filename(filename)
+    part_path = os.path.join(storage_dir, f"{file_id}.part")
+    with open(part_path, "wb") as f:
+        f.truncate(size)
+    entry = {
+        "original_filename": filename,
+        "mime_type": content_type,
+        "status": "uploading",
+        "owner_key": owner,
+        "upload_size": size,
+        "part_path": part_path,
+        "received": [],
+        "created_at": time.time(),
+    }
+    db_utils.save_result(file_id, entry)
+    # Sesi yang tidak difinalisasi dibersihkan GC setelah UPLOAD_SESSION_TTL
+    retention.touch(file_id, expires_at=entry["created_at"] + retention.UPLOAD_SESSION_TTL)
+    logging.info(f"RESUMABLE CREATE: file_id={file_id}, filename={filename}, size={size}")
+    return session_view(file_id, entry)
+
+
+def status(file_id):
+    return session_view(file_id, _load_session(file_id))
+
+
+def _write_block(fd, block, offset):
+    view = memoryview(block)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _open_part(entry, flags):
+    try:
+        return os.open(entry["part_path"], flags)
+    except FileNotFoundError:
+        # File parsial sudah dipindah ke blob store oleh finalize
+        raise HTTPException(status_code=409, detail="Upload sudah difinalisasi")
+
+
+async def write_chunk(file_id, offset, request):
+    """Tulis body request ke file parsial mulai dari offset, lalu catat rentangnya sebagai diterima."""
+    entry = _load_session(file_id)
+    if entry.get("status") != "uploading":
+        raise HTTPException(status_code=409, detail="Upload sudah difinalisasi")
+    size = entry["upload_size"]
+    if offset < 0 or offset > size:
+        raise HTTPException(status_code=416, detail=f"Upload-Offset di luar ukuran upload ({size} byte)")
+    fd = _open_part(entry, os.O_WRONLY)
+    position = offset
+    pending = bytearray()
+    try:
+        # Lock bersama: chunk paralel tetap boleh, finalize tidak bisa mulai sampai chunk ini tercatat
+        if fcntl is not None:
+            await run_in_threadpool(fcntl.flock, fd, fcntl.LOCK_SH)
+        entry = await run_in_threadpool(_load_session, file_id)
+        if entry.get("status") != "uploading":
+            raise HTTPException(status_code=409, detail="Upload sudah difinalisasi")
+        async for chunk in request.stream():
+            if position + len(pending) + len(chunk) > size:
+                raise HTTPException(status_code=416, detail=f"Chunk melewati ukuran upload ({size} byte)")
+            pending += chunk
+            if len(pending) >= ingest.WRITE_BLOCK:
+                await run_in_threadpool(_write_block, fd, bytes(pending), position)
+                position += len(pending)
+                pending.clear()
+        if pending:
+            await run_in_threadpool(_write_block, fd, bytes(pending), position)
+            position += len(pending)
+        if position == offset:
+            return session_view(file_id, entry)
+
+        def acknowledge(data):
+            data["received"] = _merge_range(data.get("received") or [], offset, position)
+        entry = await run_in_threadpool(db_utils.modify_result, file_id, acknowledge)
+    finally:
+        os.close(fd)
+    return session_view(file_id, entry)
+
+
+def _begin_finalize(file_id, entry):
+    """Ubah status sesi ke finalizing dengan flock eksklusif atas file parsial. Return entry terbaru."""
+    def begin(data):
+        if data.get("status") != "uploading":
+            raise HTTPException(status_code=409, detail="Upload sudah difinalisasi atau sedang difinalisasi")
+        if data.get("received") != [[0, data["upload_size"]]] and data["upload_size"] > 0:
+            missing = data["upload_size"] - sum(e - s for s, e in data.get("received") or [])
+            raise HTTPException(status_code=409, detail=f"Upload belum lengkap ({missing} byte belum diterima)")
+        data["status"] = "finalizing"
+
+    fd = _open_part(entry, os.O_RDONLY)
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise HTTPException(status_code=409, detail="Masih ada chunk yang sedang ditulis, ulangi finalize setelah selesai")
+        return db_utils.modify_result(file_id, begin)
+    finally:
+        os.close(fd)
+
+
+def _hash_part(path):
+    # Chunk datang paralel dan tidak berurutan, jadi hash dan fitur dihitung dalam satu baca saat finalize
+    hasher = ingest.new_hasher()
+    digest = ingest.Checksum()
+    extractor = features.FeatureExtractor()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(ingest.WRITE_BLOCK), b""):
+            hasher.update(block)
+            digest.update(block)
+            extractor.update(block)
+    return hasher.hexdigest(), digest.value(), extractor
+
+
+def _restore_part(part_path, blob_path, content_hash):
+    # adopt sudah memindahkan file parsial ke blob store: salin isinya kembali lalu lepas referensinya
+    with blobstore.open_raw(blob_path, content_hash) as src, open(part_path, 'wb') as out:
+        shutil.copyfileobj(src, out, ingest.WRITE_BLOCK)
+    blobstore.release(content_hash)
+
+
+def finalize(file_id, storage_dir, checksum=None):
+    """
+    Selesaikan upload: semua byte harus sudah diterima. File parsial di-hash, dipindah ke blob store,
+    dan metadata berubah menjadi uploaded (siap /compress). Return (view, deduplicated).
+    """
+    entry = _begin_finalize(file_id, _load_session(file_id))
+    part_path = entry["part_path"]
+    content_hash = None
+    adopted = None
+    try:
+        content_hash, file_checksum, extractor = _hash_part(part_path)
+        if checksum and checksum.lower() != content_hash:
+            raise HTTPException(status_code=422, detail="Checksum tidak cocok dengan isi upload")
+        mime_type = ingest.detect_mime(entry["original_filename"], entry.get("mime_type"), bytes(extractor.sample[:utils.SNIFF_BYTES]))
+        file_features = extractor.finish(part_path, mime_type, content_hash)
+        adopted, deduplicated = blobstore.adopt(part_path, content_hash, storage_dir, checksum=file_checksum)
+        for field in ("part_path", "received"):
+            entry.pop(field, None)
+        entry.update({
+            "file_path": adopted,
+            "mime_type": mime_type,
+            "status": "uploaded",
+            "size_before": entry["upload_size"],
+            "content_hash": content_hash,
+            "hash_algorithm": ingest.HASH_NAME,
+            "checksum": file_checksum,
+            "features": file_features,
+        })
+        db_utils.save_result(file_id, entry)
+    except Exception:
+        # Kembalikan sesi ke uploading supaya finalize bisa diulang
+        if adopted:
+            _restore_part(part_path, adopted, content_hash)
+        db_utils.update_result_field(file_id, "status", "uploading")
+        raise
+    db_utils.clear_expiry(file_id)
+    retention.touch(file_id)
+    logging.info(f"RESUMABLE FINALIZE: file_id={file_id}, size={entry['upload_size']}, deduplicated={deduplicated}")
+    return session_view(file_id, entry), deduplicated
@@ -0,0 +1,146 @@
+"""
+Retensi, garbage collection, dan kuota storage.
+
+Setiap file punya baris di index retensi (tabel ``retention``: last_access, expires_at opsional)
+yang diperbarui saat upload, kompresi, dan download. GC berjalan di thread background dan hanya
+memakai index ini (tanpa listing direktori atau stat per file):
+- file yang tidak diakses lebih dari RETENTION_DAYS atau melewati expires_at dihapus,
+- jika total blob melebihi STORAGE_QUOTA_MB, file yang paling lama tidak diakses dihapus (LRU),
+- segment packfile yang banyak berisi blob terhapus di-compact.
+Penghapusan dilakukan per batch GC_BATCH: referensi blob original dan hasil dilepas (file blob
+hilang saat referensi terakhir lepas), file parsial upload dan patch diff dihapus, lalu metadata
+dan baris retensi dihapus dalam satu transaksi. Patch diff dicatat di kedua file sumbernya dan baru
+dihapus saat semua entry yang mencatatnya ikut dihapus.
+"""
+import os
+import time
+import logging
+import threading
+
+from backend import db_utils
+from backend import blobstore
+
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', '7'))
+# 0 = tanpa kuota
+STORAGE_QUOTA_MB = int(os.environ.get('STORAGE_QUOTA_MB', '0'))
+GC_INTERVAL = int(os.environ.get('GC_INTERVAL', '300'))
+GC_BATCH = int(os.environ.get('GC_BATCH', '200'))
+# Sesi upload resumable yang tidak difinalisasi dalam waktu ini ikut dihapus
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', '86400'))
+
+# Entry yang sedang dipakai job/upload tidak boleh dihapus GC
+BUSY_STATUSES = ("queued", "running", "finalizing")
+
+_stop = threading.Event()
+_thread = None
+
+
+def touch(*file_ids, expires_at=None):
+    """Catat akses ke file (upload, kompresi, download) untuk LRU dan retensi."""
+    if file_ids:
+        db_utils.touch_files(file_ids, time.time(), expires_at)
+
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _release(content_hash, path):
+    # File yang belum masuk blob store (data lama sebelum migrasi) dihapus langsung. Path di dalam blob store
+    # tanpa baris blob yang cocok tidak pernah dihapus di sini: file/segment itu bisa dipakai bersama entry lain.
+    blob = db_utils.get_blob(content_hash) if content_hash else None
+    if blob and blob["path"] == path:
+        blobstore.release(content_hash)
+    elif path and blobstore.in_store(path):
+        logging.warning(f"GC: {path} ada di blob store tanpa baris blob yang cocok (hash={content_hash}), tidak dihapus")
+    else:
+        _remove(path)
+
+
+def delete_entries(file_ids):
+    """Hapus file beserta original, hasil, file parsial, patch, dan metadatanya. Return jumlah yang dihapus."""
+    entries = db_utils.load_results_many(file_ids)
+    deletable = {file_id for file_id, entry in entries.items() if entry.get("status") not in BUSY_STATUSES}
+    patches = {path for file_id in deletable for path in entries[file_id].get("patches") or []}
+    # Patch yang masih dicatat entry lain (file sumber satunya) dibiarkan; dihapus bersama entry itu nanti
+    shared = {path for path, owners in (db_utils.patch_owners(patches) if patches else {}).items() if owners - deletable}
+    deleted = []
+    for file_id in file_ids:
+        entry = entries.get(file_id)
+        if entry is None:
+            # Baris retensi yatim (metadata sudah tidak ada)
+            deleted.append(file_id)
+            continue
+        if file_id not in deletable:
+            continue
+        try:
+            _release(entry.get("content_hash"), entry.get("file_path"))
+            _release(entry.get("result_hash"), entry.get("output_path"))
+            _remove(entry.get("part_path"))
+            for patch_path in entry.get("patches") or []:
+                if patch_path not in shared:
+                    _remove(patch_path)
+        except OSError as e:
+            logging.warning(f"GC gagal menghapus file: file_id={file_id} | Error: {e}")
+            continue
+        deleted.append(file_id)
+    if deleted:
+        db_utils.delete_results_many(deleted)
+    return len(deleted)
+
+
+def collect(now=None):
+    """Satu putaran GC: hapus file kedaluwarsa, lalu tegakkan kuota dengan LRU. Return statistik."""
+    now = now or time.time()
+    stats = {"expired": 0, "evicted": 0}
+    access_before = now - RETENTION_DAYS * 86400
+    after = ''
+    while True:
+        file_ids = db_utils.expired_file_ids(now, access_before, GC_BATCH, after)
+        if not file_ids:
+            break
+        stats["expired"] += delete_entries(file_ids)
+        # Entry yang dilewati (sedang dipakai) tetap di index; lanjut dari file_id terakhir supaya tidak diulang
+        after = file_ids[-1]
+    if STORAGE_QUOTA_MB:
+        quota = STORAGE_QUOTA_MB * 1024 * 1024
+        offset = 0
+        while db_utils.blob_usage() > quota:
+            file_ids = db_utils.lru_file_ids(GC_BATCH, offset)
+            if not file_ids:
+                break
+            removed = delete_entries(file_ids)
+            stats["evicted"] += removed
+            # Entry yang dilewati (sedang dipakai) tetap di index; geser offset supaya tidak diulang
+            offset += len(file_ids) - removed
+    # Byte blob packfile yang terhapus baru kembali setelah segment-nya di-compact
+    stats["pack_reclaimed"] = blobstore.compact_packs()
+    stats["usage_bytes"] = db_utils.blob_usage()
+    if stats["expired"] or stats["evicted"] or stats["pack_reclaimed"]:
+        logging.info(f"GC: expired={stats['expired']}, evicted={stats['evicted']}, pack_reclaimed={stats['pack_reclaimed']}, usage={stats['usage_bytes']}")
+    return stats
+
+
+def _loop():
+    while not _stop.wait(GC_INTERVAL):
+        try:
+            collect()
+        except Exception as e:
+            logging.error(f"GC gagal: {e}")
+
+
+def start():
+    """Isi index retensi untuk data lama lalu jalankan GC background."""
+    global _thread
+    backfilled = db_utils.backfill_retention(time.time())
+    if backfilled:
+        logging.info(f"GC: index retensi diisi untuk {backfilled} file lama")
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_loop, name="retention-gc", daemon=True)
+        _thread.start()
+
+
+def shutdown():
+    _stop.set()
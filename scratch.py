@@ -0,0 +1,150 @@
+"""
+Workspace scratch per job untuk file sementara (ekstraksi Office, output Ghostscript, dekompresi original).
+
+Setiap pemakaian mendapat direktori unik ``<SCRATCH_ROOT>/<pid>-<token>-<label>-<acak>``, jadi job yang berjalan
+bersamaan di proses yang sama tidak saling menimpa atau menghapus. Direktori selalu dihapus saat blok
+with selesai (termasuk saat error), dan sisa workspace dari proses yang sudah mati dibersihkan oleh sweep()
+saat service start. token (boot id + waktu start proses) membedakan proses baru yang kebetulan mendapat pid
+yang sama, misal pid 1 setiap kali container di-restart.
+SCRATCH_ROOT bisa diarahkan ke tmpfs (misal /dev/shm) supaya I/O sementara tetap di RAM; kuota per workspace
+(SCRATCH_QUOTA_MB) mencegah satu job menghabiskan ruang/RAM scratch. Kuota ditegakkan selama menulis:
+lewat reserve()/open() untuk penulisan dari Python, dan lewat RLIMIT_FSIZE (file_limit()) untuk tool eksternal.
+"""
+import os
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+
+SCRATCH_ROOT = os.environ.get('SCRATCH_ROOT') or os.path.join(tempfile.gettempdir(), 'smartshrink-scratch')
+# 0 = tanpa kuota
+SCRATCH_QUOTA_MB = int(os.environ.get('SCRATCH_QUOTA_MB', '2048'))
+
+
+class ScratchQuotaExceeded(RuntimeError):
+    status_code = 507
+
+
+class Workspace:
+    def __init__(self, path, quota_bytes):
+        self.path = path
+        self.quota_bytes = quota_bytes
+        self.reserved = 0
+
+    def file(self, name):
+        """Path file di dalam workspace."""
+        return os.path.join(self.path, name)
+
+    def usage(self):
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for name in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def reserve(self, nbytes):
+        """Pesan ruang sebelum menulis (misal ukuran hasil ekstraksi zip). Raise ScratchQuotaExceeded jika melewati kuota."""
+        if self.quota_bytes and self.reserved + nbytes > self.quota_bytes:
+            raise ScratchQuotaExceeded(f"Workspace scratch butuh {self.reserved + nbytes} byte, kuota {self.quota_bytes} byte")
+        self.reserved += nbytes
+
+    @contextmanager
+    def open(self, name):
+        """Buka file workspace untuk ditulis; setiap write dipesan dulu lewat reserve() sehingga kuota berlaku saat menulis."""
+        with open(self.file(name), 'wb') as f:
+            yield _QuotaWriter(f, self)
+
+    def file_limit(self):
+        """Sisa kuota sebagai batas ukuran file untuk tool eksternal (supervisor.run_tool max_file_bytes). None jika tanpa kuota."""
+        if not self.quota_bytes:
+            return None
+        return max(0, self.quota_bytes - self.reserved - self.usage())
+
+    def check_truncated(self, path, limit):
+        """Setelah tool gagal: raise ScratchQuotaExceeded jika file output-nya berhenti di batas file_limit()."""
+        if limit is not None and os.path.exists(path) and os.path.getsize(path) >= limit:
+            raise ScratchQuotaExceeded(f"Output tool di workspace scratch melewati sisa kuota {limit} byte")
+
+    def check(self):
+        """Cek pemakaian aktual setelah tool menulis ke workspace. Raise ScratchQuotaExceeded jika melewati kuota."""
+        used = self.usage()
+        if self.quota_bytes and used > self.quota_bytes:
+            raise ScratchQuotaExceeded(f"Workspace scratch memakai {used} byte, kuota {self.quota_bytes} byte")
+        return used
+
+    def tool_env(self):
+        """Environment untuk subprocess supaya file sementara tool (TMPDIR) juga masuk workspace."""
+        return dict(os.environ, TMPDIR=self.path, TMP=self.path, TEMP=self.path)
+
+
+class _QuotaWriter:
+    def __init__(self, f, ws):
+        self._f = f
+        self._ws = ws
+
+    def write(self, data):
+        self._ws.reserve(len(data))
+        return self._f.write(data)
+
+
+def _process_token(pid):
+    """Boot id + waktu start proses dari /proc. None jika tidak tersedia (non-Linux atau proses tidak ada)."""
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip().replace('-', '')[:8]
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field ke-22 (starttime); nama proses di field ke-2 bisa berisi spasi, jadi dihitung setelah ')'
+    return f"{boot_id}{stat.rsplit(')', 1)[1].split()[19]}"
+
+
+@contextmanager
+def workspace(label='job', quota_mb=None):
+    """Buat workspace unik dan hapus setelah dipakai. Return Workspace (path, file, open, reserve, check)."""
+    os.makedirs(SCRATCH_ROOT, exist_ok=True)
+    pid = os.getpid()
+    path = tempfile.mkdtemp(prefix=f"{pid}-{_process_token(pid) or 0}-{label}-", dir=SCRATCH_ROOT)
+    quota_mb = SCRATCH_QUOTA_MB if quota_mb is None else quota_mb
+    try:
+        yield Workspace(path, quota_mb * 1024 * 1024)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner_alive(pid, token):
+    if not _pid_alive(pid):
+        return False
+    # pid dipakai lagi oleh proses lain (container di-restart, pid 1 lagi): workspace-nya sisa proses lama
+    current = _process_token(pid)
+    return current is None or current == token
+
+
+def sweep():
+    """Hapus workspace milik proses yang sudah tidak ada (sisa crash/kill). Return jumlah yang dihapus."""
+    if not os.path.isdir(SCRATCH_ROOT):
+        return 0
+    removed = 0
+    for name in os.listdir(SCRATCH_ROOT):
+        pid, _, rest = name.partition('-')
+        if not pid.isdigit() or _owner_alive(int(pid), rest.split('-', 1)[0]):
+            continue
+        shutil.rmtree(os.path.join(SCRATCH_ROOT, name), ignore_errors=True)
+        removed += 1
+    if removed:
+        logging.info(f"SCRATCH: {removed} workspace sisa dihapus dari {SCRATCH_ROOT}")
+    return removed
@@ -1,3 +1,6 @@
+import os
+import time
+import json
 import requests
 
 class SmartShrinkClient:
@@ -9,11 +12,48 @@ class SmartShrinkClient:
         resp = requests.post(f'{self.base_url}/upload', files=files)
         return resp.json()
 
-    def compress(self, file_id, method='ai', sensitive_mode=False, profile='default'):
+    def upload_resumable(self, file_path, chunk_size=8 * 1024 * 1024, parallel=4, file_id=None):
+        """
+        Upload file besar per chunk (paralel). Jika file_id diberikan, upload dilanjutkan:
+        hanya rentang yang belum diterima server yang dikirim ulang.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        size = os.path.getsize(file_path)
+        if file_id is None:
+            resp = requests.post(f'{self.base_url}/uploads', data={'filename': os.path.basename(file_path), 'size': size})
+            resp.raise_for_status()
+            file_id = resp.json()['file_id']
+        received = requests.get(f'{self.base_url}/uploads/{file_id}').json()['received']
+
+        def missing(offset):
+            return not any(start <= offset and offset + min(chunk_size, size - offset) <= end for start, end in received)
+
+        def send(offset):
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+            requests.patch(f'{self.base_url}/uploads/{file_id}', data=chunk, headers={'Upload-Offset': str(offset)}).raise_for_status()
+
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            list(pool.map(send, [offset for offset in range(0, size, chunk_size) if missing(offset)]))
+        resp = requests.post(f'{self.base_url}/uploads/{file_id}/finalize')
+        return resp.json()
+
+    def compress(self, file_id, method='ai', sensitive_mode=False, profile='default', idempotency_key=None):
         data = {'file_id': file_id, 'method': method, 'sensitive_mode': sensitive_mode, 'profile': profile}
-        resp = requests.post(f'{self.base_url}/compress', data=data)
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        resp = requests.post(f'{self.base_url}/compress', data=data, headers=headers)
         return resp.json()
 
+    def wait_result(self, file_id, interval=1.0, timeout=600):
+        """Poll /result sampai job kompresi selesai (done/failed) atau timeout."""
+        deadline = time.time() + timeout
+        while True:
+            resp = requests.get(f'{self.base_url}/result/{file_id}')
+            if resp.status_code != 202 or time.time() > deadline:
+                return resp.json()
+            time.sleep(interval)
+
     def download(self, file_id, out_path):
         resp = requests.get(f'{self.base_url}/download/{file_id}')
         with open(out_path, 'wb') as f:
@@ -24,10 +64,21 @@ class SmartShrinkClient:
         resp = requests.get(f'{self.base_url}/compare/{file_id}')
         return resp.json()
 
-    def batch_compress(self, items):
-        resp = requests.post(f'{self.base_url}/batch_compress', json={'items': items})
+    def batch_compress(self, items, idempotency_key=None):
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        resp = requests.post(f'{self.base_url}/batch_compress', json={'items': items}, headers=headers)
         return resp.json()
 
+    def batch_compress_stream(self, items, concurrency=None):
+        """Jalankan batch secara paralel dan yield hasil tiap item (NDJSON) sesuai urutan selesai."""
+        body = {'items': items, 'stream': True}
+        if concurrency:
+            body['concurrency'] = concurrency
+        with requests.post(f'{self.base_url}/batch_compress', json=body, stream=True) as resp:
+            for line in resp.iter_lines():
+                if line:
+                    yield json.loads(line)
+
     def diff_compress(self, file_id, base_file_id, method='patch', patch_file_id=None):
         data = {'file_id': file_id, 'base_file_id': base_file_id, 'method': method}
         if patch_file_id:
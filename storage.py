@@ -0,0 +1,244 @@
+"""
+Backend penyimpanan untuk blob (original, hasil kompresi, chunk CDC).
+
+Blob diidentifikasi dengan path logis di bawah STORAGE_ROOT (yang juga disimpan di DB). Backend
+menentukan di mana isinya benar-benar berada:
+- ``fs`` (default): path logis adalah file lokal.
+- ``s3``: path logis dipetakan ke object key ``S3_PREFIX + path relatif terhadap STORAGE_ROOT`` di bucket
+  S3-compatible (AWS S3, MinIO, atau stand-in lokal lewat S3_ENDPOINT_URL), sehingga beberapa node API bisa
+  berbagi satu blob store. Butuh paket boto3 (requirements-s3.txt). Upload multipart /upload dan /batch_upload
+  di-stream langsung ke object staging lewat writer() (multipart upload per S3_MULTIPART_MB, tanpa file lokal)
+  lalu dipindah ke key blob dengan copy di sisi server (promote); baca memakai streaming GET (dan GET dengan
+  header Range untuk range read), tanpa salinan lokal.
+
+Semua backend menyediakan operasi yang sama: put_file, put_bytes, writer, promote, open, iter_range,
+read_range, size, exists, delete. Atribut ``local`` menandai apakah path bisa dibuka langsung di disk (dipakai
+untuk fitur yang butuh filesystem lokal: packfile, chunking CDC, dan hardlink original terkompresi).
+"""
+import os
+import logging
+import threading
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'fs').lower()
+STORAGE_ROOT = os.path.abspath(os.environ.get('STORAGE_ROOT') or os.path.join(os.path.dirname(__file__), '../storage'))
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+# Ukuran part multipart upload (minimal 5 sesuai batas S3)
+S3_MULTIPART_MB = int(os.environ.get('S3_MULTIPART_MB', '8'))
+READ_BLOCK = 1024 * 1024
+
+
+class _FileWriter:
+    """Writer backend fs: tulis langsung ke file tujuan; abort() menghapus file parsial."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'wb')
+
+    def write(self, data):
+        return self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _S3Writer:
+    """
+    Writer backend s3: multipart upload yang mengirim part begitu buffer mencapai S3_MULTIPART_MB, jadi
+    memori yang dipakai hanya satu part dan tidak ada file lokal. Object kecil dikirim dengan satu PUT saat close().
+    """
+
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = None
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._send_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def _send_part(self, body):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+    def close(self):
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self._send_part(bytes(self.buffer))
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                  MultipartUpload={'Parts': self.parts})
+        self.buffer = bytearray()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+        self.buffer = bytearray()
+
+
+class FilesystemBackend:
+    local = True
+
+    def put_file(self, path, src_path):
+        """Pindahkan file lokal yang sudah selesai ditulis ke path blob."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src_path, path)
+
+    def writer(self, path):
+        """Tulis path secara streaming: write() per blok, close() menyelesaikan, abort() membatalkan."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return _FileWriter(path)
+
+    def promote(self, src, path):
+        """Pindahkan isi yang sudah tersimpan di backend (hasil writer) ke path lain."""
+        self.put_file(path, src)
+
+    def put_bytes(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def open(self, path):
+        return open(path, 'rb')
+
+    def iter_range(self, path, start=0, end=None, block=READ_BLOCK):
+        """Stream byte [start, end) (end None = sampai akhir)."""
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                data = f.read(block if remaining is None else min(block, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def read_range(self, path, start, length):
+        with open(path, 'rb') as f:
+            return os.pread(f.fileno(), length, start)
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def delete(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class S3Backend:
+    local = False
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, root=STORAGE_ROOT):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 butuh paket boto3 (pip install -r requirements-s3.txt)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 butuh S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.root = root
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        part = S3_MULTIPART_MB * 1024 * 1024
+        self.transfer = TransferConfig(multipart_threshold=part, multipart_chunksize=part)
+        self._client_error = ClientError
+
+    def key(self, path):
+        rel = os.path.relpath(path, self.root)
+        if rel.startswith('..'):
+            raise ValueError(f"Path di luar STORAGE_ROOT: {path}")
+        return self.prefix + rel.replace(os.sep, '/')
+
+    def put_file(self, path, src_path):
+        """Upload file lokal (multipart untuk file besar) lalu hapus salinan lokalnya."""
+        self.client.upload_file(src_path, self.bucket, self.key(path), Config=self.transfer)
+        os.remove(src_path)
+
+    def put_bytes(self, path, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(path), Body=data)
+
+    def writer(self, path):
+        """Tulis path secara streaming: write() per blok, close() menyelesaikan, abort() membatalkan."""
+        return _S3Writer(self.client, self.bucket, self.key(path), S3_MULTIPART_MB * 1024 * 1024)
+
+    def promote(self, src, path):
+        """Pindahkan object yang sudah ada di bucket ke key lain dengan copy di sisi server (multipart untuk object besar)."""
+        self.client.copy({'Bucket': self.bucket, 'Key': self.key(src)}, self.bucket, self.key(path), Config=self.transfer)
+        self.delete(src)
+
+    def _get(self, path, start=0, end=None):
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(path), **kwargs)['Body']
+
+    def open(self, path):
+        return self._get(path)
+
+    def iter_range(self, path, start=0, end=None, block=READ_BLOCK):
+        body = self._get(path, start, end)
+        try:
+            yield from body.iter_chunks(block)
+        finally:
+            body.close()
+
+    def read_range(self, path, start, length):
+        body = self._get(path, start, start + length)
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def size(self, path):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(path))['ContentLength']
+
+    def exists(self, path):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+            return True
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def delete(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(path))
+
+
+def create_backend(name=STORAGE_BACKEND):
+    if name == 's3':
+        logging.info(f"STORAGE: backend s3 bucket={S3_BUCKET} endpoint={S3_ENDPOINT_URL or 'default'}")
+        return S3Backend(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    if name != 'fs':
+        raise RuntimeError(f"STORAGE_BACKEND tidak dikenal: {name}")
+    return FilesystemBackend()
+
+
+backend = create_backend()
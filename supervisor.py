@@ -0,0 +1,183 @@
+"""
+Supervisor untuk encoder eksternal (ffmpeg, Ghostscript).
+
+Semua subprocess encoder dijalankan lewat run_tool, yang memberi:
+- batas proses paralel per tool (TOOL_CONCURRENCY),
+- timeout wall-clock per tool (TOOL_TIMEOUTS), proses yang lewat batas di-kill,
+- rlimit memori dan CPU (TOOL_MAX_MEMORY_MB, TOOL_MAX_CPU_SECONDS) serta ukuran file per pemanggilan
+  (max_file_bytes, sisa kuota workspace scratch) di Linux: perintah dibungkus CLI
+  ``prlimit`` (util-linux) sehingga batas berlaku sebelum exec; tanpa CLI itu batas dipasang dengan
+  resource.prlimit(pid) segera setelah spawn, dengan jeda singkat tanpa batas yang dicatat sebagai warning.
+  Tidak memakai preexec_fn, yang tidak aman di proses ber-thread. Batas memori default nonaktif:
+  RLIMIT_AS menghitung ruang alamat virtual, sehingga ffmpeg multithread gagal jauh sebelum RSS mendekati batas,
+- pembatalan: job yang dibatalkan lewat cancel_scope ikut mematikan proses tool-nya.
+"""
+import os
+import shutil
+import signal
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _parse_tool_map(value):
+    return {k.strip(): int(v) for k, _, v in (pair.partition(':') for pair in value.split(',') if ':' in pair)}
+
+
+TOOL_CONCURRENCY = _parse_tool_map(os.environ.get('TOOL_CONCURRENCY', 'ffmpeg:2,gs:4'))
+TOOL_TIMEOUTS = _parse_tool_map(os.environ.get('TOOL_TIMEOUTS', 'ffmpeg:3600,gs:900'))
+DEFAULT_TOOL_CONCURRENCY = 2
+DEFAULT_TOOL_TIMEOUT = 900
+# 0 = tanpa batas. RLIMIT_AS (ruang alamat virtual), jadi beri ruang lebar untuk tool multithread seperti ffmpeg
+TOOL_MAX_MEMORY_MB = int(os.environ.get('TOOL_MAX_MEMORY_MB', '0'))
+TOOL_MAX_CPU_SECONDS = int(os.environ.get('TOOL_MAX_CPU_SECONDS', '0'))
+# Interval pengecekan timeout/pembatalan selama menunggu slot atau proses
+POLL_SECONDS = 0.5
+STDERR_TAIL = 2000
+
+
+class ToolError(RuntimeError):
+    status_code = 500
+
+
+class ToolTimeout(ToolError):
+    status_code = 504
+
+
+class ToolCancelled(ToolError):
+    status_code = 409
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+_local = threading.local()
+_warned = set()
+
+
+def _warn_once(key, message):
+    if key not in _warned:
+        _warned.add(key)
+        logging.warning(message)
+
+
+def _semaphore(tool):
+    with _semaphores_lock:
+        if tool not in _semaphores:
+            _semaphores[tool] = threading.BoundedSemaphore(TOOL_CONCURRENCY.get(tool, DEFAULT_TOOL_CONCURRENCY))
+        return _semaphores[tool]
+
+
+@contextmanager
+def cancel_scope(event):
+    """Semua run_tool di thread ini dalam blok with akan dibatalkan jika event di-set."""
+    previous = getattr(_local, 'cancel_event', None)
+    _local.cancel_event = event
+    try:
+        yield
+    finally:
+        _local.cancel_event = previous
+
+
+def _cancelled():
+    event = getattr(_local, 'cancel_event', None)
+    return event is not None and event.is_set()
+
+
+def _rlimits(max_file_bytes=None):
+    """Batas yang dipasang ke proses tool: list of (resource, opsi CLI prlimit, (soft, hard))."""
+    if resource is None or not hasattr(resource, 'prlimit'):
+        if max_file_bytes is not None or TOOL_MAX_MEMORY_MB or TOOL_MAX_CPU_SECONDS:
+            _warn_once('unsupported', "TOOL RLIMIT: platform ini tidak mendukung prlimit, tool eksternal berjalan TANPA batas memori/CPU/ukuran file")
+        return []
+    limits = []
+    if max_file_bytes is not None:
+        limits.append((resource.RLIMIT_FSIZE, '--fsize', (max_file_bytes, max_file_bytes)))
+    if TOOL_MAX_MEMORY_MB:
+        memory = TOOL_MAX_MEMORY_MB * 1024 * 1024
+        limits.append((resource.RLIMIT_AS, '--as', (memory, memory)))
+    if TOOL_MAX_CPU_SECONDS:
+        limits.append((resource.RLIMIT_CPU, '--cpu', (TOOL_MAX_CPU_SECONDS, TOOL_MAX_CPU_SECONDS + 5)))
+    return limits
+
+
+def _with_prlimit(cmd, limits):
+    """Bungkus cmd dengan CLI prlimit supaya batas berlaku sejak exec. Return (cmd, True jika terbungkus)."""
+    prlimit = shutil.which('prlimit') if limits else None
+    if not prlimit:
+        return cmd, False
+    return [prlimit] + [f"{option}={soft}:{hard}" for _, option, (soft, hard) in limits] + ['--'] + list(cmd), True
+
+
+def _apply_rlimits(proc, limits):
+    # Fallback tanpa CLI prlimit: pasang batas dari parent; proses yang sudah keluar dilewati
+    _warn_once('fallback', "TOOL RLIMIT: CLI prlimit (util-linux) tidak ditemukan; batas dipasang setelah spawn, "
+                           "jadi tool berjalan TANPA batas sesaat setelah start. Install util-linux supaya batas berlaku sejak exec")
+    for limit, _, value in limits:
+        try:
+            resource.prlimit(proc.pid, limit, value)
+        except ProcessLookupError:
+            return
+        except OSError as e:
+            logging.warning(f"TOOL RLIMIT GAGAL: pid={proc.pid} | Error: {e}")
+
+
+def _kill(proc):
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.wait()
+
+
+def run_tool(tool, cmd, timeout=None, env=None, max_file_bytes=None):
+    """
+    Jalankan cmd sebagai tool `tool` di bawah supervisi (env opsional, misal TMPDIR workspace scratch). Raise ToolTimeout, ToolCancelled,
+    atau ToolError (exit code != 0) dengan potongan stderr terakhir. max_file_bytes: batas ukuran tiap file yang
+    ditulis tool (RLIMIT_FSIZE); tool yang melewatinya berhenti dengan error.
+    """
+    timeout = timeout or TOOL_TIMEOUTS.get(tool, DEFAULT_TOOL_TIMEOUT)
+    sem = _semaphore(tool)
+    while not sem.acquire(timeout=POLL_SECONDS):
+        if _cancelled():
+            raise ToolCancelled(f"{tool} dibatalkan sebelum dijalankan")
+    try:
+        popen_kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.PIPE, "env": env}
+        if os.name == 'posix':
+            popen_kwargs["start_new_session"] = True
+        limits = _rlimits(max_file_bytes)
+        cmd, wrapped = _with_prlimit(cmd, limits)
+        proc = subprocess.Popen(cmd, **popen_kwargs)
+        if not wrapped:
+            _apply_rlimits(proc, limits)
+        logging.info(f"TOOL START: {tool} pid={proc.pid}")
+        waited = 0.0
+        stderr = b""
+        while True:
+            try:
+                _, stderr = proc.communicate(timeout=POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                waited += POLL_SECONDS
+                if _cancelled():
+                    _kill(proc)
+                    logging.warning(f"TOOL CANCELLED: {tool} pid={proc.pid}")
+                    raise ToolCancelled(f"{tool} dibatalkan")
+                if waited >= timeout:
+                    _kill(proc)
+                    logging.error(f"TOOL TIMEOUT: {tool} pid={proc.pid} after {timeout}s")
+                    raise ToolTimeout(f"{tool} melebihi batas waktu {timeout} detik")
+        if proc.returncode != 0:
+            tail = (stderr or b"")[-STDERR_TAIL:].decode('utf-8', errors='replace')
+            raise ToolError(f"{tool} gagal (exit {proc.returncode}): {tail}")
+        return proc.returncode
+    finally:
+        sem.release()
@@ -0,0 +1,68 @@
+"""
+Test admission control lewat TestClient (tanpa server): saat antrean job penuh, disk hampir habis
+(termasuk ukuran upload yang akan masuk), atau memori proses di atas batas, /upload, chunk upload
+resumable, dan /compress ditolak 503 + Retry-After sebelum body dibaca; endpoint lain tetap dilayani.
+
+Jalankan: python -m pytest backend/test_admission.py
+"""
+import os
+import collections
+
+import pytest
+
+from backend import admission
+from backend import ingest
+from backend import main
+
+MB = 1024 * 1024
+DiskUsage = collections.namedtuple('DiskUsage', 'total used free')
+
+
+@pytest.fixture
+def free_disk(monkeypatch):
+    """Ruang disk bebas palsu: reserve 50MB, bebas 50.5MB."""
+    monkeypatch.setattr(admission, 'MIN_FREE_DISK_MB', 50)
+    monkeypatch.setattr(admission.shutil, 'disk_usage', lambda path: DiskUsage(100 * MB, 50 * MB, 50 * MB + MB // 2))
+
+
+def _assert_rejected(response):
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(admission.RETRY_AFTER_SECONDS)
+
+
+def test_full_queue_rejects_compress(client, monkeypatch):
+    monkeypatch.setattr(admission, 'MAX_QUEUE_DEPTH', 0)
+    _assert_rejected(client.post("/compress", data={"file_id": "apa-saja", "method": "gzip"}))
+    _assert_rejected(client.post("/batch_compress", json={"items": []}))
+    assert client.get("/health").status_code == 200
+
+
+def test_upload_rejected_before_body_is_read(client, free_disk, monkeypatch):
+    received = []
+    receive_files = ingest.receive_files
+
+    async def tracking_receive(*args, **kwargs):
+        received.append(True)
+        return await receive_files(*args, **kwargs)
+
+    monkeypatch.setattr(ingest, 'receive_files', tracking_receive)
+    # Upload 1MB tidak muat di atas reserve, upload kecil masih muat
+    _assert_rejected(client.post("/upload", files={"file": ("besar.bin", os.urandom(MB), "application/octet-stream")}))
+    assert received == [] and os.listdir(main.STORAGE_DIR) == ["results"]
+    small = client.post("/upload", files={"file": ("kecil.txt", b"isi kecil" * 100, "text/plain")})
+    assert small.status_code == 200 and received == [True]
+
+
+def test_resumable_chunk_rejected_when_disk_full(client, free_disk):
+    created = client.post("/uploads", data={"filename": "besar.bin", "size": str(2 * MB)})
+    assert created.status_code == 201
+    file_id = created.json()["file_id"]
+    _assert_rejected(client.patch(f"/uploads/{file_id}", content=os.urandom(MB), headers={"Upload-Offset": "0"}))
+    assert client.get(f"/uploads/{file_id}").json()["received"] == []
+
+
+def test_memory_limit_rejects_compress(client, monkeypatch):
+    monkeypatch.setattr(admission, 'MAX_RSS_MB', 1)
+    if admission.process_rss_bytes() is None:
+        pytest.skip("RSS proses hanya terbaca di Linux (/proc)")
+    _assert_rejected(client.post("/compress", data={"file_id": "apa-saja", "method": "gzip"}))
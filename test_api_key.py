@@ -24,7 +24,7 @@ def test_compress(file_id):
     data = {"file_id": file_id, "method": "gzip"}
     r = requests.post(f"{BASE_URL}/compress", data=data, headers=headers)
     safe_print_response(r, "COMPRESS")
-    assert r.status_code == 200
+    assert r.status_code == 202
     return r.json()
 
 def test_get_result(file_id):
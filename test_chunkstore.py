@@ -0,0 +1,117 @@
+"""
+Test content-defined chunking (tidak butuh server): stabilitas cut point setelah sisipan, kesamaan hasil
+gear hash vektor (numpy) dengan loop Python, perangkaian ulang isi blob ber-chunk, dan pembersihan chunk
+yang ditulis tapi tidak jadi dipakai.
+
+Jalankan: python -m pytest backend/test_chunkstore.py
+"""
+import os
+import random
+
+import pytest
+
+from backend import db_utils
+from backend import blobstore
+from backend import chunkstore
+
+
+def _data(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def _chunk_bytes(data, chunks):
+    pieces, offset = [], 0
+    for _, size in chunks:
+        pieces.append(data[offset:offset + size])
+        offset += size
+    return pieces
+
+
+def _split_bytes(tmp_dir, name, data):
+    path = os.path.join(tmp_dir, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return chunkstore.split(path)
+
+
+@pytest.fixture
+def tmp_dir(db, monkeypatch):
+    # Ambang CDC diturunkan supaya file uji beberapa MB sudah di-chunk
+    monkeypatch.setattr(chunkstore, 'CDC_MIN_FILE_MB', 1)
+    return str(db)
+
+
+def _chunk_files(root):
+    return [name for _, _, names in os.walk(os.path.join(root, chunkstore.CHUNK_DIRNAME)) for name in names]
+
+
+def test_cut_points_stable_after_insert(tmp_dir):
+    data = _data(6 * 1024 * 1024, 1)
+    middle = len(data) // 2
+    edited = data[:middle] + b"sisipan kecil di tengah file" + data[middle:]
+    before = _split_bytes(tmp_dir, 'v1', data)
+    after = _split_bytes(tmp_dir, 'v2', edited)
+    assert b"".join(_chunk_bytes(data, before)) == data
+    assert all(chunkstore.CDC_MIN <= size <= chunkstore.CDC_MAX for _, size in before[:-1])
+    # Hanya chunk di sekitar sisipan yang berubah; chunk sebelum dan sesudahnya dipakai ulang
+    changed = {chunk_hash for chunk_hash, _ in after} - {chunk_hash for chunk_hash, _ in before}
+    assert 1 <= len(changed) <= 2
+    boundary = next(i for i, (chunk_hash, _) in enumerate(after) if chunk_hash in changed)
+    assert after[:boundary] == before[:boundary]
+    assert after[-(len(before) - boundary - 1):] == before[boundary + 1:]
+
+
+def test_vectorized_cut_matches_python():
+    if chunkstore.numpy is None:
+        pytest.skip("numpy tidak terpasang")
+    data = _data(chunkstore.CDC_MAX * 6 + 12345, 2)
+    points = chunkstore._CutPoints(data)
+    pos = 0
+    while pos < len(data):
+        end = min(len(data), pos + chunkstore.CDC_MAX)
+        size = chunkstore._cut(data, pos, end)
+        assert points.cut(data, pos, end) == size
+        pos += size
+    # Buffer pendek (jendela 64 byte belum penuh) juga harus sama
+    for size in (1, chunkstore.CDC_MIN, chunkstore.CDC_MIN + 10, chunkstore.CDC_MIN + 200):
+        short = data[:size]
+        assert chunkstore._CutPoints(short).cut(short, 0, size) == chunkstore._cut(short, 0, size)
+
+
+def test_reassembly_and_shared_chunks(tmp_dir):
+    root = os.path.join(tmp_dir, 'storage')
+    versions = []
+    for i, data in enumerate((_data(3 * 1024 * 1024, 3), _data(3 * 1024 * 1024, 3)[:-1000] + b"versi baru")):
+        path = os.path.join(tmp_dir, f"upload-{i}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        content_hash = blobstore.hash_file(path)
+        blob, _ = blobstore.adopt(path, content_hash, root)
+        assert db_utils.get_blob(content_hash)["encoding"] == chunkstore.ENCODING
+        with blobstore.open_raw(blob, content_hash) as f:
+            assert f.read() == data
+        versions.append((content_hash, len(chunkstore.read_manifest(blob))))
+    # Versi kedua hanya menambah chunk terakhir yang berubah
+    assert len(_chunk_files(root)) <= versions[0][1] + 2
+    for content_hash, _ in versions:
+        blobstore.release(content_hash)
+    assert _chunk_files(root) == []
+
+
+def test_unused_chunks_discarded(tmp_dir, monkeypatch):
+    root = os.path.join(tmp_dir, 'storage')
+    data = _data(2 * 1024 * 1024, 4)
+    paths = []
+    for i in range(2):
+        paths.append(os.path.join(tmp_dir, f"copy-{i}"))
+        with open(paths[-1], 'wb') as f:
+            f.write(data)
+    content_hash = blobstore.hash_file(paths[0])
+    # Chunk ditulis untuk copy-1, lalu blob yang sama tersimpan lebih dulu tanpa chunk
+    chunks = blobstore._split(paths[1], content_hash, root, len(data))
+    assert _chunk_files(root)
+    monkeypatch.setattr(chunkstore, 'CDC_MIN_FILE_MB', 0)
+    blobstore.adopt(paths[0], content_hash, root)
+    with blobstore._lock:
+        blobstore._place(paths[1], content_hash, root, len(data), chunks)
+    assert _chunk_files(root) == []
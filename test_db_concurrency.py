@@ -0,0 +1,127 @@
+"""
+Stress test konkurensi db_utils (tidak butuh server).
+
+Beberapa thread menjalankan pola akses yang sama dengan satu request /compress (baca entry, ubah status,
+catat akses retensi, increment atomik, simpan hasil) pada sekumpulan file_id yang sama. Dibandingkan:
+- legacy: satu sqlite3.connect per panggilan, journal default, read-modify-write tanpa lock di awal
+  (cara db_utils sebelumnya),
+- pooled: db_utils sekarang (koneksi persisten per thread, WAL, synchronous=NORMAL, BEGIN IMMEDIATE).
+Test gagal jika pooled kehilangan increment, kena "database is locked", atau tidak minimal MIN_SPEEDUP kali
+lebih cepat dari legacy.
+
+Jalankan: python -m pytest -s backend/test_db_concurrency.py
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from backend import db_utils
+
+THREADS = int(os.environ.get('STRESS_THREADS', '8'))
+REQUESTS = int(os.environ.get('STRESS_REQUESTS', '150'))
+FILES = 4
+# Koneksi persisten + WAL terukur sekitar 10x koneksi per panggilan; batas bawah longgar supaya test tidak
+# bergantung pada kecepatan mesin, tapi tetap gagal jika keuntungan itu hilang
+MIN_SPEEDUP = float(os.environ.get('STRESS_MIN_SPEEDUP', '2'))
+
+
+class LegacyDb:
+    """Salinan pola akses db_utils lama: koneksi baru di setiap panggilan."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE results (file_id TEXT PRIMARY KEY, data TEXT)')
+        conn.execute('CREATE TABLE retention (file_id TEXT PRIMARY KEY, created_at REAL, last_access REAL, expires_at REAL)')
+        conn.commit()
+        conn.close()
+
+    def save_result(self, file_id, data):
+        conn = sqlite3.connect(self.path)
+        conn.execute('REPLACE INTO results (file_id, data) VALUES (?, ?)', (file_id, json.dumps(data)))
+        conn.commit()
+        conn.close()
+
+    def load_result(self, file_id):
+        conn = sqlite3.connect(self.path)
+        row = conn.execute('SELECT data FROM results WHERE file_id=?', (file_id,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row else None
+
+    def modify_result(self, file_id, modify):
+        conn = sqlite3.connect(self.path)
+        row = conn.execute('SELECT data FROM results WHERE file_id=?', (file_id,)).fetchone()
+        data = json.loads(row[0])
+        modify(data)
+        conn.execute('REPLACE INTO results (file_id, data) VALUES (?, ?)', (file_id, json.dumps(data)))
+        conn.commit()
+        conn.close()
+        return data
+
+    def update_result_field(self, file_id, field, value):
+        self.modify_result(file_id, lambda data: data.__setitem__(field, value))
+
+    def touch_files(self, file_ids, now):
+        conn = sqlite3.connect(self.path)
+        conn.executemany('INSERT INTO retention (file_id, created_at, last_access) VALUES (?, ?, ?) '
+                         'ON CONFLICT(file_id) DO UPDATE SET last_access=excluded.last_access',
+                         [(file_id, now, now) for file_id in file_ids])
+        conn.commit()
+        conn.close()
+
+
+def _increment(data):
+    data["hits"] += 1
+
+
+def _request(db, file_id):
+    # Pola akses satu request /compress
+    entry = db.load_result(file_id)
+    db.update_result_field(file_id, "status", "running")
+    db.touch_files([file_id], time.time())
+    db.modify_result(file_id, _increment)
+    entry["status"] = "compressed"
+    entry.pop("hits", None)
+    db.update_result_field(file_id, "status", entry["status"])
+
+
+def _stress(db):
+    """Return (request per detik, jumlah error 'database is locked', total hits tercatat)."""
+    file_ids = [f"file-{i}" for i in range(FILES)]
+    for file_id in file_ids:
+        db.save_result(file_id, {"status": "uploaded", "hits": 0})
+    errors = []
+    barrier = threading.Barrier(THREADS)
+
+    def worker(index):
+        barrier.wait()
+        for i in range(REQUESTS):
+            try:
+                _request(db, file_ids[(index + i) % FILES])
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    hits = sum(db.load_result(file_id)["hits"] for file_id in file_ids)
+    return THREADS * REQUESTS / elapsed, len(errors), hits
+
+
+def test_db_concurrency(db):
+    legacy_rate, legacy_errors, legacy_hits = _stress(LegacyDb(str(db / 'legacy.sqlite3')))
+    pooled_rate, pooled_errors, pooled_hits = _stress(db_utils)
+    expected = THREADS * REQUESTS
+    print(f"[LEGACY] {legacy_rate:.0f} req/s, locked={legacy_errors}, hits={legacy_hits}/{expected}")
+    print(f"[POOLED] {pooled_rate:.0f} req/s, locked={pooled_errors}, hits={pooled_hits}/{expected}")
+    print(f"[SPEEDUP] {pooled_rate / legacy_rate:.1f}x")
+    # Tidak ada "database is locked", tidak ada increment yang hilang, dan throughput jauh di atas cara lama
+    assert pooled_errors == 0
+    assert pooled_hits == expected
+    assert pooled_rate >= MIN_SPEEDUP * legacy_rate
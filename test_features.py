@@ -0,0 +1,83 @@
+"""
+Test fitur file saat ingest: entropi, format, resolusi gambar, jumlah halaman PDF, dan hash dihitung sekali
+saat upload dan disimpan di metadata; pipeline memakai fitur tersimpan tanpa membaca ulang file, dan entry
+lama tanpa fitur dihitung sekali dari sampel awal.
+
+Jalankan: python -m pytest backend/test_features.py
+"""
+import io
+import os
+
+import pikepdf
+from PIL import Image
+
+from backend import db_utils
+from backend import features
+from backend import pipeline
+
+
+def _png(width=64, height=32):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _pdf(pages):
+    pdf = pikepdf.new()
+    for _ in range(pages):
+        pdf.add_blank_page()
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    return buffer.getvalue()
+
+
+def _features(client, name, content, content_type):
+    uploaded = client.post("/upload", files={"file": (name, content, content_type)}).json()
+    return uploaded, db_utils.load_result(uploaded["file_id"])["features"]
+
+
+def test_image_features_stored_at_upload(client):
+    uploaded, stored = _features(client, "gambar.png", _png(), "image/png")
+    assert stored["format"] == "image/png" and stored["img_res"] == [64, 32]
+    assert stored["content_hash"] == uploaded["content_hash"] and stored["size"] == len(_png())
+    assert 0 < stored["entropy"] <= 8
+
+
+def test_pdf_page_count_stored_at_upload(client):
+    _, stored = _features(client, "dokumen.pdf", _pdf(3), "application/pdf")
+    assert stored["format"] == "application/pdf" and stored["pdf_pages"] == 3
+
+
+def test_streamed_blocks_match_file_extraction(tmp_path):
+    data = os.urandom(3 * 1024 * 1024)
+    path = tmp_path / 'acak.bin'
+    path.write_bytes(data)
+    extractor = features.FeatureExtractor()
+    for start in range(0, len(data), 65536):
+        extractor.update(data[start:start + 65536])
+    assert extractor.finish(str(path)) == features.extract_file(str(path))
+    assert extractor.finish(str(path))["entropy"] > 7.9
+
+
+def test_pipeline_uses_stored_features(client, monkeypatch):
+    uploaded, stored = _features(client, "gambar.png", _png(), "image/png")
+
+    def no_reread(*args, **kwargs):
+        raise AssertionError("file dibaca ulang untuk ekstraksi fitur")
+
+    monkeypatch.setattr(features, 'extract_file', no_reread)
+    entry = db_utils.load_result(uploaded["file_id"])
+    pipeline.analyze(entry, "image/png", ".png", "ai", False, 'default')
+    assert entry["ai_analysis"] == {"entropy": stored["entropy"], "pdf_pages": None, "img_res": [64, 32]}
+
+
+def test_legacy_entry_features_computed_once(client, monkeypatch):
+    uploaded, _ = _features(client, "gambar.png", _png(), "image/png")
+    db_utils.update_result_field(uploaded["file_id"], "features", None)
+    entry = db_utils.load_result(uploaded["file_id"])
+    calls = []
+    extract_file = features.extract_file
+    monkeypatch.setattr(features, 'extract_file', lambda *args: calls.append(args) or extract_file(*args))
+    assert pipeline.stored_features(entry, "image/png")["img_res"] == [64, 32]
+    assert pipeline.stored_features(entry, "image/png")["img_res"] == [64, 32]
+    assert len(calls) == 1
@@ -0,0 +1,78 @@
+"""
+Test header Idempotency-Key lewat TestClient (tanpa server): request ulang /compress dan /batch_compress
+mendapat response tersimpan tanpa job baru, key yang dipakai untuk isi berbeda ditolak, request gagal
+melepas key supaya bisa di-retry, dan key dibedakan per API key.
+
+Jalankan: python -m pytest backend/test_idempotency.py
+"""
+import pytest
+
+from backend import jobs
+from backend import main
+
+
+@pytest.fixture
+def submitted(client, monkeypatch):
+    calls = []
+    submit = jobs.submit
+
+    def counting_submit(file_id, *args, **kwargs):
+        calls.append(file_id)
+        job = submit(file_id, *args, **kwargs)
+        job["future"].result(timeout=60)
+        return job
+
+    monkeypatch.setattr(jobs, 'submit', counting_submit)
+    return calls
+
+
+def _upload(client, name="data.txt"):
+    content = f"isi {name}\n".encode() * 2000
+    return client.post("/upload", files={"file": (name, content, "text/plain")}).json()["file_id"]
+
+
+def _compress(client, file_id, key, method="gzip", **headers):
+    return client.post("/compress", data={"file_id": file_id, "method": method}, headers={"Idempotency-Key": key, **headers})
+
+
+def test_compress_replay(client, submitted):
+    file_id = _upload(client)
+    first = _compress(client, file_id, "retry-1")
+    second = _compress(client, file_id, "retry-1")
+    assert first.status_code == second.status_code == 202
+    assert second.json() == first.json() and second.headers["Idempotent-Replayed"] == "true"
+    assert second.headers["Location"] == first.headers["Location"]
+    assert submitted == [file_id]
+
+
+def test_key_reused_with_different_payload(client, submitted):
+    file_id = _upload(client)
+    _compress(client, file_id, "retry-2")
+    assert _compress(client, file_id, "retry-2", method="brotli").status_code == 422
+    assert submitted == [file_id]
+
+
+def test_failed_request_releases_key(client, submitted):
+    assert _compress(client, "belum-ada", "retry-3").status_code == 404
+    # Key dilepas: retry dengan key yang sama diproses lagi, bukan replay 404
+    assert _compress(client, "belum-ada", "retry-3").status_code == 404
+    assert submitted == ["belum-ada", "belum-ada"]
+
+
+def test_key_scoped_per_api_key(client, submitted, monkeypatch):
+    monkeypatch.setattr(main, 'API_KEYS', main.API_KEYS + ["tenant-lain"])
+    file_id = _upload(client)
+    _compress(client, file_id, "retry-4")
+    other = _compress(client, file_id, "retry-4", **{"X-API-Key": "tenant-lain"})
+    assert "Idempotent-Replayed" not in other.headers
+    assert submitted == [file_id, file_id]
+
+
+def test_batch_compress_replay(client, submitted):
+    file_ids = [_upload(client, f"batch{i}.txt") for i in range(2)]
+    body = {"items": [{"file_id": file_id, "method": "gzip"} for file_id in file_ids]}
+    first = client.post("/batch_compress", json=body, headers={"Idempotency-Key": "batch-1"})
+    second = client.post("/batch_compress", json=body, headers={"Idempotency-Key": "batch-1"})
+    assert first.status_code == second.status_code == 202
+    assert second.json() == first.json() and second.headers["Idempotent-Replayed"] == "true"
+    assert submitted == file_ids
@@ -0,0 +1,248 @@
+"""
+Test job kompresi (tidak butuh server): request bersamaan untuk file yang sama dengan alias method
+berbeda (gzip/auto/ai) atau sensitive_mode berbeda tidak boleh saling menimpa output, dan urutan
+weighted fair queueing antar tenant di satu lane. Estimasi biaya job dan lane terpisah (job kecil tidak
+menunggu job besar), worker lane tetap hidup saat pencatatan job gagal, dan batch stream tidak mendaftarkan
+job melebihi jumlah worker lane.
+
+Jalankan: python -m pytest backend/test_jobs.py
+"""
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from backend import db_utils
+from backend import jobs
+from backend import pipeline
+
+FILES = 6
+
+
+@pytest.fixture
+def file_ids(db):
+    ids = []
+    for i in range(FILES):
+        file_id = f"job-file-{i}"
+        path = db / f"{file_id}.txt"
+        path.write_bytes((f"baris {i} kontak user{i}@example.com\n" * 20000).encode())
+        db_utils.save_result(file_id, {
+            "original_filename": f"data{i}.txt",
+            "file_path": str(path),
+            "mime_type": "text/plain",
+            "size_before": path.stat().st_size,
+            "status": "uploaded",
+        })
+        ids.append(file_id)
+    return ids
+
+
+def _submit_together(monkeypatch, requests):
+    """
+    Submit semua request (file_id, method, sensitive_mode) bersamaan, tunggu selesai, return list job.
+    Worker baru menjalankan pipeline setelah semua submit kembali, jadi tidak ada job yang sudah selesai
+    (dan keluar dari single-flight) sebelum request lain untuk file yang sama masuk.
+    """
+    results_dir = os.path.dirname(db_utils.DB_PATH)
+    submitted = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+    gate = threading.Event()
+    run = pipeline.run
+
+    def gated_run(*args, **kwargs):
+        gate.wait(timeout=60)
+        return run(*args, **kwargs)
+
+    def submit(index):
+        file_id, method, sensitive_mode = requests[index]
+        barrier.wait()
+        submitted[index] = jobs.submit(file_id, method, results_dir, sensitive_mode=sensitive_mode, tenant="test")
+
+    monkeypatch.setattr(pipeline, 'run', gated_run)
+    try:
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        gate.set()
+    for job in submitted:
+        job["future"].result(timeout=60)
+    return submitted
+
+
+def test_method_aliases_coalesce(monkeypatch, file_ids):
+    submitted = _submit_together(monkeypatch, [(file_id, method, False) for file_id in file_ids for method in ("gzip", "auto", "ai")])
+    for job in submitted:
+        assert job["status"] == "done", job["error"]
+    # Alias yang berujung di codec yang sama digabung ke satu job per file
+    for file_id in file_ids:
+        assert len({job["job_id"] for job in submitted if job["file_id"] == file_id}) == 1
+        entry = db_utils.load_result(file_id)
+        assert entry["status"] == "compressed"
+        assert entry["compressed_filename"] == f"compressed_{file_id}_{entry['original_filename']}.gz"
+
+
+def test_sensitive_and_plain_jobs_do_not_collide(monkeypatch, file_ids):
+    submitted = _submit_together(monkeypatch, [(file_id, "gzip", sensitive) for file_id in file_ids for sensitive in (False, True)])
+    for job in submitted:
+        assert job["status"] == "done", job["error"]
+    results_dir = os.path.dirname(db_utils.DB_PATH)
+    # Output per job sudah masuk blob store, tidak ada sisa file kerja
+    assert not [name for name in os.listdir(results_dir) if name.startswith(".job-")]
+
+
+def test_unsupported_method_rejected(file_ids):
+    with pytest.raises(Exception) as excinfo:
+        jobs.submit(file_ids[0], "lzma", os.path.dirname(db_utils.DB_PATH))
+    assert getattr(excinfo.value, "status_code", None) == 501
+
+
+def test_worker_survives_bookkeeping_error(monkeypatch, file_ids):
+    workers = []
+    update_result_fields = db_utils.update_result_fields
+
+    def crashing_run(*args, **kwargs):
+        workers.append(threading.current_thread())
+        raise RuntimeError("encoder crash")
+
+    def failing_update(file_id, fields):
+        if fields.get("status") == "failed":
+            raise sqlite3.OperationalError("database is locked")
+        update_result_fields(file_id, fields)
+
+    monkeypatch.setattr(pipeline, 'run', crashing_run)
+    monkeypatch.setattr(db_utils, 'update_result_fields', failing_update)
+    job = jobs.submit(file_ids[0], "gzip", os.path.dirname(db_utils.DB_PATH), tenant="test")
+    job["future"].result(timeout=60)
+    assert job["status"] == "failed"
+    # Error saat mencatat kegagalan tidak mematikan thread worker
+    workers[0].join(timeout=1)
+    assert workers[0].is_alive()
+
+
+def test_estimate_cost_from_size_and_throughput(monkeypatch):
+    monkeypatch.setattr(jobs, '_throughput', dict(jobs.DEFAULT_THROUGHPUT))
+    video = {"original_filename": "rekaman.mp4", "mime_type": "video/mp4", "size_before": 100 * 1024 * 1024}
+    text = {"original_filename": "log.txt", "mime_type": "text/plain", "size_before": 1024 * 1024}
+    # MIME generik: format hasil sniff saat upload yang dipakai
+    sniffed = {"original_filename": "scan", "mime_type": "application/octet-stream", "size_before": 1024 * 1024,
+               "features": {"format": "application/pdf"}}
+    assert jobs.estimate_cost(video) == ("ffmpeg", 200.0)
+    assert jobs.estimate_cost(text)[0] == "gzip" and jobs.estimate_cost(text)[1] < 0.1
+    assert jobs.estimate_cost(sniffed) == ("pdf_optimize", 1.0)
+    # Riwayat throughput menggeser estimasi (EWMA)
+    jobs.record_throughput("ffmpeg", 10 * 1024 * 1024, 1)
+    assert jobs.estimate_cost(video)[1] < 200.0
+
+
+def test_small_job_not_stuck_behind_large(monkeypatch, file_ids):
+    monkeypatch.setattr(jobs, '_throughput', dict(jobs.DEFAULT_THROUGHPUT))
+    large, small = file_ids[0], file_ids[1]
+    # Estimasi biaya dari size_before: file ini tercatat 10GB, jadi masuk lane large
+    db_utils.update_result_fields(large, {"size_before": 10 * 1024 ** 3})
+    started, release = threading.Event(), threading.Event()
+    run = pipeline.run
+
+    def blocking_run(file_id, *args, **kwargs):
+        if file_id == large:
+            started.set()
+            release.wait(timeout=60)
+        return run(file_id, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'run', blocking_run)
+    results_dir = os.path.dirname(db_utils.DB_PATH)
+    try:
+        large_job = jobs.submit(large, "gzip", results_dir, tenant="test")
+        assert started.wait(timeout=60)
+        small_job = jobs.submit(small, "gzip", results_dir, tenant="test")
+        assert (large_job["lane"], small_job["lane"]) == ("large", "small")
+        small_job["future"].result(timeout=60)
+        assert small_job["status"] == "done" and large_job["status"] == "running"
+    finally:
+        release.set()
+    large_job["future"].result(timeout=60)
+    assert large_job["status"] == "done"
+
+
+def test_batch_concurrency_clamped_to_lane_workers(monkeypatch):
+    monkeypatch.setitem(jobs.LANES["small"], "workers", 2)
+    monkeypatch.setitem(jobs.LANES["large"], "workers", 1)
+    futures = []
+
+    def submit_item(item):
+        # Paling banyak 2 job (worker lane terbesar) belum selesai saat item berikutnya didaftarkan
+        assert sum(not future.done() for future in futures) < 2
+        future = Future()
+        threading.Timer(0.01, future.set_result, [None]).start()
+        futures.append(future)
+        return {"file_id": item["file_id"], "job_id": item["file_id"], "status": "done", "result": {}, "future": future}
+
+    items = [{"file_id": f"batch-{i}"} for i in range(6)]
+    lines = list(jobs.iter_batch(items, submit_item, concurrency=8))
+    assert sorted(line["index"] for line in lines) == list(range(6))
+    assert all(line["status"] == "done" for line in lines)
+
+
+def _lane():
+    return {"workers": 0, "queues": {}, "finish": {}, "vtime": 0.0, "threads": []}
+
+
+def _task(name, estimated_seconds):
+    return ({"job_id": name, "estimated_seconds": estimated_seconds},)
+
+
+def _drain(lane):
+    order = []
+    while True:
+        task = jobs._dequeue(lane)
+        if task is None:
+            return order
+        order.append(task[0]["job_id"])
+
+
+def test_fair_queueing_interleaves_tenants():
+    lane = _lane()
+    for i in range(20):
+        jobs._enqueue(lane, "batch", (i, 1.0), _task(f"batch-{i}", 1.0))
+    jobs._enqueue(lane, "interactive", (0, 1.0), _task("interactive-0", 1.0))
+    jobs._enqueue(lane, "interactive", (1, 1.0), _task("interactive-1", 1.0))
+    order = _drain(lane)
+    # Job tenant kedua tidak menunggu 20 job batch selesai, dan urutan per tenant tetap terjaga
+    assert order.index("interactive-0") <= 1 and order.index("interactive-1") <= 3
+    assert [name for name in order if name.startswith("batch")] == [f"batch-{i}" for i in range(20)]
+
+
+def test_fair_queueing_weights_and_shortest_first(monkeypatch):
+    monkeypatch.setitem(jobs.TENANT_WEIGHTS, "gold", 3)
+    lane = _lane()
+    for i in range(12):
+        jobs._enqueue(lane, "gold", (i, 1.0), _task(f"gold-{i}", 1.0))
+        jobs._enqueue(lane, "free", (i, 1.0), _task(f"free-{i}", 1.0))
+    first = _drain(lane)[:8]
+    # Bobot 3:1 -> tenant gold mendapat tiga kali jatah worker
+    assert sum(name.startswith("gold") for name in first) == 6
+
+    lane = _lane()
+    jobs._enqueue(lane, "t", (10.0, 0), _task("besar", 9.0))
+    jobs._enqueue(lane, "t", (2.0, 1), _task("kecil", 0.5))
+    # Di dalam satu tenant, kunci (waktu masuk + estimasi biaya) terkecil jalan lebih dulu
+    assert _drain(lane) == ["kecil", "besar"]
+
+
+def test_idle_tenant_does_not_bank_credit():
+    lane = _lane()
+    for i in range(10):
+        jobs._enqueue(lane, "busy", (i, 1.0), _task(f"busy-{i}", 1.0))
+    _drain(lane)
+    for i in range(4):
+        jobs._enqueue(lane, "busy", (i, 1.0), _task(f"busy-late-{i}", 1.0))
+    # Tenant yang idle selama busy berjalan mulai dari virtual clock lane, bukan dari nol
+    jobs._enqueue(lane, "idle", (0, 1.0), _task("idle-0", 1.0))
+    jobs._enqueue(lane, "idle", (1, 1.0), _task("idle-1", 1.0))
+    jobs._enqueue(lane, "idle", (2, 1.0), _task("idle-2", 1.0))
+    order = _drain(lane)
+    assert order.index("busy-late-1") < order.index("idle-2")
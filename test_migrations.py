@@ -0,0 +1,124 @@
+"""
+Test migrasi data lama (tidak butuh server):
+- migrate_layout: blob dengan SHARD_DEPTH lama, file upload/hasil datar, dan patch diff datar dipindah ke
+  layout ter-shard, metadata ikut diperbarui per halaman, --dry-run tidak mengubah apa pun, dan aman dijalankan ulang.
+- migrate_schema: baris results format lama (JSON di kolom data) terbaca sebelum migrasi, dipindah per
+  batch ke kolom bertipe tanpa kehilangan field, created_at dari mtime file (NULL jika tidak ada).
+
+Jalankan: python -m pytest backend/test_migrations.py
+"""
+import os
+import json
+import sqlite3
+
+from backend import db_utils
+from backend import blobstore
+from backend import migrate_layout
+from backend import migrate_schema
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_migrate_layout(db, monkeypatch):
+    tmp_dir = str(db)
+    storage_dir = os.path.join(tmp_dir, 'storage')
+    results_dir = os.path.join(storage_dir, 'results')
+    # Blob yang tersimpan dengan SHARD_DEPTH lama
+    with monkeypatch.context() as old_layout:
+        old_layout.setattr(blobstore, 'SHARD_DEPTH', 1)
+        sharded_hash = blobstore.hash_file(_write(os.path.join(tmp_dir, 'a.txt'), b"isi blob lama" * 100))
+        old_blob, _ = blobstore.adopt(os.path.join(tmp_dir, 'a.txt'), sharded_hash, storage_dir)
+    db_utils.save_result("sharded", {"file_path": old_blob, "content_hash": sharded_hash, "status": "uploaded"})
+    # File datar dari versi sebelum blob store
+    flat_upload = _write(os.path.join(storage_dir, 'uuid1_laporan.txt'), b"laporan lama\n" * 500)
+    flat_result = _write(os.path.join(results_dir, 'compressed_flat_laporan.txt.gz'), b"hasil lama")
+    db_utils.save_result("flat", {"file_path": flat_upload, "output_path": flat_result, "status": "compressed"})
+    patch = _write(os.path.join(results_dir, 'patch_flat_v2.diff'), b"@@ diff @@")
+
+    planned = migrate_layout.migrate(storage_dir, results_dir, dry_run=True)
+    assert planned == {"blobs": 1, "chunks": 0, "entries": 2, "named": 1}
+    assert all(os.path.exists(path) for path in (old_blob, flat_upload, flat_result, patch))
+
+    assert migrate_layout.migrate(storage_dir, results_dir) == planned
+    new_blob = blobstore.blob_path(storage_dir, sharded_hash)
+    assert not os.path.exists(old_blob) and os.path.exists(new_blob)
+    assert db_utils.get_blob(sharded_hash)["path"] == new_blob
+    assert db_utils.load_result("sharded")["file_path"] == new_blob
+
+    flat = db_utils.load_result("flat")
+    assert not os.path.exists(flat_upload) and not os.path.exists(flat_result)
+    assert flat["file_path"] == blobstore.blob_path(storage_dir, flat["content_hash"])
+    assert flat["output_path"] == blobstore.blob_path(results_dir, flat["result_hash"])
+    assert flat["compressed_filename"] == 'compressed_flat_laporan.txt.gz'
+    with blobstore.open_raw(flat["file_path"], flat["content_hash"]) as f:
+        assert f.read() == b"laporan lama\n" * 500
+    assert not os.path.exists(patch)
+    assert os.path.exists(blobstore.named_path(results_dir, 'patch_flat_v2.diff'))
+
+    # Dijalankan ulang: semua sudah di layout baru
+    assert migrate_layout.migrate(storage_dir, results_dir) == {"blobs": 0, "chunks": 0, "entries": 0, "named": 0}
+
+
+def test_migrate_layout_pages_entries(db, monkeypatch):
+    # Entry dibaca dan disimpan per halaman SAVE_BATCH, tidak pernah seluruh tabel sekaligus
+    monkeypatch.setattr(migrate_layout, 'SAVE_BATCH', 2)
+    monkeypatch.setattr(db_utils, 'load_all_results', None)
+    saved = []
+    save_results_many = db_utils.save_results_many
+    monkeypatch.setattr(db_utils, 'save_results_many', lambda items: saved.append(len(items)) or save_results_many(items))
+    storage_dir = os.path.join(str(db), 'storage')
+    for i in range(5):
+        db_utils.save_result(f"flat-{i}", {"file_path": _write(os.path.join(storage_dir, f'uuid{i}_data.txt'), b"isi %d" % i),
+                                           "status": "uploaded"})
+    assert migrate_layout.migrate(storage_dir, os.path.join(storage_dir, 'results'))["entries"] == 5
+    assert saved == [2, 2, 1]
+    for i in range(5):
+        entry = db_utils.load_result(f"flat-{i}")
+        assert entry["file_path"] == blobstore.blob_path(storage_dir, entry["content_hash"])
+
+
+def test_migrate_schema(db_path, tmp_path):
+    tmp_dir = str(tmp_path)
+    upload = _write(os.path.join(tmp_dir, 'upload.txt'), b"isi")
+    os.utime(upload, (1700000000, 1700000000))
+    legacy = {
+        "with-file": {"status": "compressed", "mime_type": "text/plain", "size_before": 3, "size_after": 2,
+                      "compression_method": "gzip", "file_path": upload, "original_filename": "upload.txt"},
+        "missing-file": {"status": "uploaded", "mime_type": "image/png", "file_path": os.path.join(tmp_dir, 'hilang.png')},
+        "third": {"status": "uploaded", "mime_type": "text/plain", "warning": "field tambahan"},
+    }
+    # Database format lama: seluruh entry sebagai JSON di kolom data
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE results (file_id TEXT PRIMARY KEY, data TEXT)')
+    conn.executemany('INSERT INTO results (file_id, data) VALUES (?, ?)',
+                     [(file_id, json.dumps(data)) for file_id, data in legacy.items()])
+    conn.commit()
+    conn.close()
+
+    db_utils.init_db()
+    # Baris lama tetap terbaca sebelum dimigrasi
+    assert db_utils.load_result("third") == legacy["third"]
+    assert db_utils.find_results(status="compressed") == []
+
+    assert migrate_schema.run(batch=2) == len(legacy)
+    for file_id, data in legacy.items():
+        entry = db_utils.load_result(file_id)
+        assert {key: entry[key] for key in data} == data
+    assert [file_id for file_id, _ in db_utils.find_results(status="compressed")] == ["with-file"]
+    assert [file_id for file_id, _ in db_utils.find_results(mime_type="text/plain")] == ["with-file", "third"]
+    # created_at dari mtime file, NULL jika file tidak ada; tidak pernah waktu migrasi
+    assert db_utils.load_result("with-file")["created_at"] == 1700000000
+    assert "created_at" not in db_utils.load_result("missing-file")
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM results WHERE data IS NOT NULL OR extra IS NULL').fetchone()[0] == 0
+    conn.close()
+
+    # Aman dijalankan ulang, dan created_at tidak berubah saat entry ditulis lagi
+    assert migrate_schema.run(batch=2) == 0
+    db_utils.update_result_field("with-file", "status", "expired")
+    assert db_utils.load_result("with-file")["created_at"] == 1700000000
@@ -0,0 +1,43 @@
+"""
+Test STORE_ORIGINALS_COMPRESSED: setelah kompresi gzip, blob original diganti hardlink ke hasil dan diberi
+encoding di DB sehingga isi mentah tidak disimpan dua kali, sementara /download?mode=original tetap
+mengirim isi asli (didekompresi secara streaming). Tanpa flag, original tetap mentah.
+
+Jalankan: python -m pytest backend/test_originals.py
+"""
+import os
+
+from backend import blobstore
+from backend import db_utils
+from backend import jobs
+
+CONTENT = b"baris log yang sangat berulang\n" * 20000
+
+
+def _upload_and_compress(client):
+    uploaded = client.post("/upload", files={"file": ("app.log", CONTENT, "text/plain")}).json()
+    queued = client.post("/compress", data={"file_id": uploaded["file_id"], "method": "gzip"}).json()
+    job = jobs.get_job(queued["job_id"])
+    job["future"].result(timeout=60)
+    assert job["status"] == "done"
+    return uploaded
+
+
+def test_original_stored_compressed(client, monkeypatch):
+    monkeypatch.setattr(blobstore, 'STORE_ORIGINALS_COMPRESSED', True)
+    uploaded = _upload_and_compress(client)
+    entry = db_utils.load_result(uploaded["file_id"])
+    original = db_utils.get_blob(uploaded["content_hash"])
+    assert original["encoding"] == "gzip" and original["size"] < len(CONTENT)
+    assert os.path.samefile(original["path"], db_utils.get_blob(entry["result_hash"])["path"])
+    response = client.get(f"/download/{uploaded['file_id']}", params={"mode": "original"})
+    assert response.status_code == 200 and response.content == CONTENT
+
+
+def test_original_kept_raw_by_default(client, monkeypatch):
+    monkeypatch.setattr(blobstore, 'STORE_ORIGINALS_COMPRESSED', False)
+    uploaded = _upload_and_compress(client)
+    original = db_utils.get_blob(uploaded["content_hash"])
+    assert original["encoding"] is None and original["size"] == len(CONTENT)
+    with open(original["path"], 'rb') as f:
+        assert f.read() == CONTENT
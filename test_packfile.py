@@ -0,0 +1,146 @@
+"""
+Test packfile blob kecil (tidak butuh server): blob kecil ditambahkan ke segment, byte blob yang dilepas
+dicatat sebagai dead, compaction menulis ulang segment hanya dengan blob hidup (offset diperbarui, isi
+tetap terbaca), segment tanpa blob hidup dihapus, dan segment yang masih di-append proses lain tidak
+di-compact.
+
+Jalankan: python -m pytest backend/test_packfile.py
+"""
+import os
+import random
+import multiprocessing
+
+import pytest
+
+from backend import db_utils
+from backend import blobstore
+from backend import packfile
+
+BLOBS = 8
+BLOB_SIZE = 4000
+
+
+@pytest.fixture
+def tmp_dir(db, monkeypatch):
+    monkeypatch.setattr(packfile, 'PACK_MAX_KB', 16)
+    # Segment aktif per root; diganti dict baru supaya tidak tersisa setelah test
+    active = {}
+    monkeypatch.setattr(packfile, '_active', active)
+    yield str(db)
+    for _, _, fd in active.values():
+        os.close(fd)
+
+
+@pytest.fixture
+def root(tmp_dir):
+    return os.path.join(tmp_dir, 'storage')
+
+
+def _adopt_blob(tmp_dir, root, seed):
+    """Adopt satu blob kecil dengan isi dari seed. Return (content_hash, data)."""
+    data = random.Random(seed).randbytes(BLOB_SIZE)
+    path = os.path.join(tmp_dir, f"small-{seed}")
+    with open(path, 'wb') as f:
+        f.write(data)
+    content_hash = blobstore.hash_file(path)
+    blobstore.adopt(path, content_hash, root)
+    return content_hash, data
+
+
+def _adopt_small(tmp_dir, root):
+    """Adopt BLOBS blob kecil berbeda. Return list of (content_hash, data)."""
+    return [_adopt_blob(tmp_dir, root, i) for i in range(BLOBS)]
+
+
+def _read(content_hash):
+    blob = db_utils.get_blob(content_hash)
+    with blobstore.open_raw(blob["path"], content_hash) as f:
+        return f.read()
+
+
+def test_small_blobs_share_segment(tmp_dir, root):
+    blobs = _adopt_small(tmp_dir, root)
+    segments = {db_utils.get_blob(content_hash)["path"] for content_hash, _ in blobs}
+    assert len(segments) == 1 and packfile.is_segment(segments.pop())
+    assert os.listdir(os.path.join(root, packfile.PACK_DIRNAME))
+    assert not os.path.exists(os.path.join(root, blobstore.BLOB_DIRNAME))
+    for content_hash, data in blobs:
+        assert _read(content_hash) == data
+
+
+def test_compaction_keeps_live_blobs(tmp_dir, root):
+    blobs = _adopt_small(tmp_dir, root)
+    segment = db_utils.get_blob(blobs[0][0])["path"]
+    dead, live = blobs[:BLOBS - 2], blobs[BLOBS - 2:]
+    for content_hash, _ in dead:
+        blobstore.release(content_hash)
+    assert db_utils.pack_segments_to_compact(packfile.PACK_COMPACT_RATIO) == [segment]
+    assert blobstore.compact_packs() == len(dead) * BLOB_SIZE
+    assert os.path.getsize(segment) == len(live) * BLOB_SIZE
+    assert db_utils.pack_segments_to_compact(packfile.PACK_COMPACT_RATIO) == []
+    # Path segment tetap, offset blob hidup pindah ke awal segment
+    assert sorted(db_utils.get_blob(content_hash)["pack_offset"] for content_hash, _ in live) == [0, BLOB_SIZE]
+    for content_hash, data in live:
+        assert db_utils.get_blob(content_hash)["path"] == segment
+        assert _read(content_hash) == data
+    # Append setelah compaction melanjutkan segment yang sudah dipadatkan
+    path = os.path.join(tmp_dir, 'small-new')
+    with open(path, 'wb') as f:
+        f.write(b"blob baru" * 100)
+    new_hash = blobstore.hash_file(path)
+    blobstore.adopt(path, new_hash, root)
+    assert db_utils.get_blob(new_hash)["path"] == segment
+    assert db_utils.get_blob(new_hash)["pack_offset"] == len(live) * BLOB_SIZE
+    # Segment tanpa blob hidup dihapus
+    for content_hash in [content_hash for content_hash, _ in live] + [new_hash]:
+        blobstore.release(content_hash)
+    blobstore.compact_packs()
+    assert not os.path.exists(segment)
+    assert db_utils.pack_segments_to_compact(0) == []
+
+
+APPENDS = 300
+
+
+def _append_in_other_process(db_path, tmp_dir, root, ready, appended, finish):
+    # Proses lain (worker uvicorn lain): buat segment dengan byte mati, lalu terus append. Proses tetap
+    # hidup (segment masih aktif) sampai test selesai memeriksa
+    db_utils.DB_PATH = db_path
+    packfile.PACK_MAX_KB = 16
+    for content_hash, _ in _adopt_small(tmp_dir, root)[:BLOBS - 2]:
+        blobstore.release(content_hash)
+    ready.set()
+    for seed in range(1000, 1000 + APPENDS):
+        _adopt_blob(tmp_dir, root, seed)
+    appended.set()
+    finish.wait(60)
+
+
+def test_no_compaction_while_other_process_appends(tmp_dir, root, db_path, monkeypatch):
+    # Segment apa pun yang punya byte mati jadi kandidat compaction
+    monkeypatch.setattr(packfile, 'PACK_COMPACT_RATIO', 0.0001)
+    context = multiprocessing.get_context('spawn')
+    ready, appended, finish = context.Event(), context.Event(), context.Event()
+    writer = context.Process(target=_append_in_other_process, args=(db_path, tmp_dir, root, ready, appended, finish))
+    writer.start()
+    try:
+        assert ready.wait(60)
+        attempts = 0
+        while not appended.is_set():
+            assert blobstore.compact_packs() == 0
+            attempts += 1
+        assert blobstore.compact_packs() == 0
+    finally:
+        finish.set()
+        writer.join(60)
+    assert writer.exitcode == 0 and attempts
+    live = [random.Random(seed).randbytes(BLOB_SIZE) for seed in [BLOBS - 2, BLOBS - 1] + list(range(1000, 1000 + APPENDS))]
+    # Semua append proses lain tetap di segment dan terbaca di offset yang tercatat
+    segments = db_utils.pack_segments_to_compact(0)
+    assert len(segments) == 1
+    segment = segments[0]
+    assert [_read(content_hash) for content_hash, _, _ in db_utils.pack_blobs(segment)] == live
+
+    # Proses penulisnya sudah selesai (flock lepas): segment boleh di-compact, isi tetap utuh
+    assert blobstore.compact_packs() == (BLOBS - 2) * BLOB_SIZE
+    assert [_read(content_hash) for content_hash, _, _ in db_utils.pack_blobs(segment)] == live
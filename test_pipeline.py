@@ -0,0 +1,119 @@
+"""
+Test pipeline kompresi (tidak butuh server): registry codec dipilih lewat MIME type/ekstensi, setiap tahap
+berjalan sekali dengan durasi nyata di timings, dan cache hasil: isi yang sama dari file_id lain memakai hasil
+tersimpan tanpa encode ulang, sensitive_mode tidak membaca maupun menulis cache, dan referensi blob hasil
+dilepas jika metadata gagal disimpan.
+
+Jalankan: python -m pytest backend/test_pipeline.py
+"""
+import os
+import time
+
+import pytest
+
+from backend import db_utils
+from backend import blobstore
+from backend import pipeline
+
+CONTENT = b"baris data yang sama untuk dua upload\n" * 5000
+
+
+@pytest.fixture
+def results_dir(db):
+    path = db / 'results'
+    path.mkdir()
+    return str(path)
+
+
+def _upload(tmp_dir, file_id, data=CONTENT):
+    """Simpan upload teks seperti /upload: blob content-addressed plus entry metadata."""
+    path = os.path.join(tmp_dir, f"{file_id}.upload")
+    with open(path, 'wb') as f:
+        f.write(data)
+    content_hash, checksum = blobstore.digest_file(path)
+    blob, _ = blobstore.adopt(path, content_hash, os.path.join(tmp_dir, 'storage'), checksum)
+    db_utils.save_result(file_id, {
+        "original_filename": "data.txt",
+        "file_path": blob,
+        "content_hash": content_hash,
+        "mime_type": "text/plain",
+        "size_before": len(data),
+        "status": "uploaded",
+    })
+    return content_hash
+
+
+def _cache_key(file_id):
+    entry = db_utils.load_result(file_id)
+    _, _, codec = pipeline.sniff(entry)
+    return pipeline.result_cache_key(entry, codec, 'default')
+
+
+@pytest.mark.parametrize("mime_type, ext, codec", [
+    ("text/plain", ".txt", "gzip"),
+    ("image/png", ".png", "webp"),
+    (None, ".docx", "office_optimize"),
+    ("application/pdf", ".bin", "pdf_optimize"),
+    ("application/x-unknown", ".bin", None),
+])
+def test_codec_registry_lookup(mime_type, ext, codec):
+    found = pipeline.lookup_codec(mime_type, ext)
+    assert (found.name if found else None) == codec
+
+
+def test_each_stage_runs_once(db, results_dir, monkeypatch):
+    _upload(str(db), "staged")
+    calls = []
+    encode = pipeline.encode
+
+    def slow_encode(*args, **kwargs):
+        calls.append(args[0].name)
+        time.sleep(0.05)
+        return encode(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'encode', slow_encode)
+    entry = pipeline.run("staged", "gzip", results_dir)
+    assert calls == ["gzip"]
+    timings = entry["timings"]
+    assert list(timings) == ["sniff", "cache", "analyze", "encode", "persist"]
+    # Durasi encode diukur di sekitar encoder, bukan setelahnya
+    assert timings["encode"] >= 0.05
+    assert entry["elapsed"] == round(sum(timings.values()), 4)
+
+
+def test_same_content_reuses_result(db, results_dir):
+    _upload(str(db), "first")
+    _upload(str(db), "second")
+    first = pipeline.run("first", "gzip", results_dir)
+    second = pipeline.run("second", "gzip", results_dir)
+    assert first["cache_hit"] is False and second["cache_hit"] is True
+    assert second["result_hash"] == first["result_hash"] and second["size_after"] == first["size_after"]
+    # Satu blob hasil dipakai bersama dua entry
+    assert db_utils.get_blob(first["result_hash"])["refcount"] == 2
+
+
+def test_sensitive_mode_skips_result_cache(db, results_dir):
+    _upload(str(db), "sensitive")
+    _upload(str(db), "plain")
+    entry = pipeline.run("sensitive", "gzip", results_dir, sensitive_mode=True)
+    assert entry["status"] == "compressed"
+    assert db_utils.load_cached_result(_cache_key("sensitive")) is None
+    assert pipeline.run("plain", "gzip", results_dir)["cache_hit"] is False
+
+
+def test_failed_save_releases_result_ref(db, results_dir, monkeypatch):
+    content_hash = _upload(str(db), "broken")
+    save_result = db_utils.save_result
+
+    def failing_save(file_id, entry):
+        if entry.get("status") == "compressed":
+            raise RuntimeError("disk penuh")
+        save_result(file_id, entry)
+
+    monkeypatch.setattr(db_utils, 'save_result', failing_save)
+    with pytest.raises(RuntimeError):
+        pipeline.run("broken", "gzip", results_dir)
+    # Hanya blob upload yang tersisa: blob hasil dan entry cache-nya ikut dilepas
+    assert [blob_hash for blob_hash, _ in db_utils.list_blobs()] == [content_hash]
+    assert db_utils.load_cached_result(_cache_key("broken")) is None
+    assert not [name for name in os.listdir(results_dir) if name.startswith(".job-")]
@@ -0,0 +1,68 @@
+"""
+Test process pool codec (tidak butuh server): ukuran pool dari kuota CPU cgroup (v2 dan v1) atau
+CODEC_WORKERS, codec berjalan di proses worker dengan argumen path file, dan pool dibuat ulang setelah
+worker crash.
+
+Jalankan: python -m pytest backend/test_procpool.py
+"""
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import brotli
+import pytest
+
+from backend import procpool
+from backend import utils
+
+
+def _fake_files(monkeypatch, files):
+    def fake_open(path, *args, **kwargs):
+        if path not in files:
+            raise FileNotFoundError(path)
+        return io.StringIO(files[path])
+    monkeypatch.setattr(procpool, 'open', fake_open, raising=False)
+
+
+@pytest.mark.parametrize("files, limit", [
+    ({'/sys/fs/cgroup/cpu.max': "150000 100000\n"}, 2),
+    ({'/sys/fs/cgroup/cpu.max': "max 100000\n"}, None),
+    ({'/sys/fs/cgroup/cpu/cpu.cfs_quota_us': "300000\n", '/sys/fs/cgroup/cpu/cpu.cfs_period_us': "100000\n"}, 3),
+    ({'/sys/fs/cgroup/cpu/cpu.cfs_quota_us': "-1\n", '/sys/fs/cgroup/cpu/cpu.cfs_period_us': "100000\n"}, None),
+    ({}, None),
+])
+def test_cgroup_cpu_limit(monkeypatch, files, limit):
+    _fake_files(monkeypatch, files)
+    assert procpool.cgroup_cpu_limit() == limit
+
+
+def test_pool_size(monkeypatch):
+    monkeypatch.delenv('CODEC_WORKERS', raising=False)
+    monkeypatch.setattr(procpool, 'cgroup_cpu_limit', lambda: 1)
+    assert procpool.pool_size() == 1
+    monkeypatch.setenv('CODEC_WORKERS', '3')
+    assert procpool.pool_size() == 3
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv('CODEC_WORKERS', '1')
+    procpool.start()
+    yield
+    procpool.shutdown()
+
+
+def test_codec_runs_in_worker(pool, tmp_path):
+    source = tmp_path / 'data.txt'
+    source.write_bytes(b"baris teks berulang\n" * 5000)
+    output = tmp_path / 'data.txt.br'
+    # Worker menerima path, bukan isi file
+    procpool.run(utils.compress_brotli, str(source), str(output))
+    assert brotli.decompress(output.read_bytes()) == source.read_bytes()
+    assert procpool.run(os.getpid) != os.getpid()
+
+
+def test_pool_restarts_after_worker_crash(pool):
+    with pytest.raises(BrokenProcessPool):
+        procpool.run(os._exit, 1)
+    assert procpool.run(os.getpid) != os.getpid()
@@ -0,0 +1,114 @@
+"""
+Test upload resumable (tidak butuh server): chunk tidak berurutan digabung jadi satu blob, finalize
+ditolak selama masih ada chunk yang ditulis, chunk setelah finalize tidak mengubah blob, dan finalize yang
+gagal mengembalikan sesi ke uploading dengan file parsial utuh.
+
+Jalankan: python -m pytest backend/test_resumable.py
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend import db_utils
+from backend import blobstore
+from backend import resumable
+
+DATA = bytes(range(256)) * 400
+HALF = len(DATA) // 2
+
+
+class _Request:
+    """Pengganti Request Starlette: stream() menghasilkan body per potongan."""
+
+    def __init__(self, *parts, started=None, release=None):
+        self.parts = parts
+        self.started = started
+        self.release = release
+
+    async def stream(self):
+        for i, part in enumerate(self.parts):
+            if i == 1 and self.started:
+                # Potongan pertama sudah dikirim, body berikutnya tertahan di jaringan
+                self.started.set()
+                await self.release.wait()
+            yield part
+
+
+def _write(file_id, offset, *parts):
+    return asyncio.run(resumable.write_chunk(file_id, offset, _Request(*parts)))
+
+
+@pytest.fixture
+def storage_dir(db):
+    path = db / 'storage'
+    path.mkdir()
+    return str(path)
+
+
+def _read_blob(view):
+    with blobstore.open_raw(db_utils.load_result(view["file_id"])["file_path"], view["content_hash"]) as f:
+        return f.read()
+
+
+def test_out_of_order_chunks(storage_dir):
+    file_id = resumable.create(storage_dir, "data.bin", len(DATA))["file_id"]
+    assert _write(file_id, HALF, DATA[HALF:])["offset"] == 0
+    assert _write(file_id, 0, DATA[:HALF])["received"] == [[0, len(DATA)]]
+    view, deduplicated = resumable.finalize(file_id, storage_dir)
+    assert view["status"] == "uploaded" and not deduplicated
+    assert _read_blob(view) == DATA
+
+
+def test_finalize_excludes_chunk_writes(storage_dir):
+    file_id = resumable.create(storage_dir, "data.bin", len(DATA))["file_id"]
+    _write(file_id, 0, DATA)
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+        # Client mengirim ulang rentang yang sama, sisa body-nya belum sampai
+        writer = asyncio.create_task(resumable.write_chunk(
+            file_id, 0, _Request(b"X" * 10, b"Y" * 10, started=started, release=release)))
+        await started.wait()
+        with pytest.raises(HTTPException) as rejected:
+            resumable.finalize(file_id, storage_dir)
+        assert rejected.value.status_code == 409
+        assert db_utils.load_result(file_id)["status"] == "uploading"
+        release.set()
+        await writer
+
+    asyncio.run(scenario())
+    view, _ = resumable.finalize(file_id, storage_dir)
+    expected = b"X" * 10 + b"Y" * 10 + DATA[20:]
+    assert _read_blob(view) == expected
+    # Chunk yang datang setelah finalize ditolak tanpa menyentuh blob
+    with pytest.raises(HTTPException) as late:
+        _write(file_id, 0, b"Z" * 10)
+    assert late.value.status_code == 409
+    assert _read_blob(view) == expected
+
+
+def test_failed_finalize_restores_session(storage_dir, monkeypatch):
+    file_id = resumable.create(storage_dir, "data.bin", len(DATA))["file_id"]
+    _write(file_id, 0, DATA)
+    with pytest.raises(HTTPException) as mismatch:
+        resumable.finalize(file_id, storage_dir, checksum="0" * 64)
+    assert mismatch.value.status_code == 422
+
+    # Gagal setelah file parsial dipindah ke blob store: file dikembalikan, blob tidak tersisa
+    save_result = db_utils.save_result
+
+    def failing_save(file_id, entry):
+        if entry.get("status") == "uploaded":
+            raise RuntimeError("disk penuh")
+        save_result(file_id, entry)
+
+    monkeypatch.setattr(db_utils, 'save_result', failing_save)
+    with pytest.raises(RuntimeError):
+        resumable.finalize(file_id, storage_dir)
+    assert db_utils.load_result(file_id)["status"] == "uploading"
+    assert db_utils.list_blobs() == []
+
+    monkeypatch.setattr(db_utils, 'save_result', save_result)
+    view, _ = resumable.finalize(file_id, storage_dir)
+    assert _read_blob(view) == DATA
@@ -0,0 +1,81 @@
+"""
+Test retensi dan GC (tidak butuh server): file kedaluwarsa dihapus beserta blob-nya, entry yang sedang
+dipakai job dilewati tanpa menghentikan GC, kuota ditegakkan dengan LRU, dan patch diff yang dicatat dua
+file sumber baru dihapus saat keduanya terhapus.
+
+Jalankan: python -m pytest backend/test_retention.py
+"""
+import os
+
+import pytest
+
+from backend import db_utils
+from backend import blobstore
+from backend import retention
+
+NOW = 1700000000
+
+
+@pytest.fixture
+def tmp_dir(db, monkeypatch):
+    monkeypatch.setattr(retention, 'RETENTION_DAYS', 1)
+    monkeypatch.setattr(retention, 'GC_BATCH', 2)
+    return str(db)
+
+
+def _upload(tmp_dir, file_id, last_access, status="uploaded", size=1000):
+    """Simpan file seperti /upload (isi unik per file_id) dengan waktu akses terakhir last_access."""
+    path = os.path.join(tmp_dir, f"{file_id}.upload")
+    with open(path, 'wb') as f:
+        f.write(file_id.encode().ljust(size, b"."))
+    content_hash = blobstore.hash_file(path)
+    blob, _ = blobstore.adopt(path, content_hash, os.path.join(tmp_dir, 'storage'))
+    db_utils.save_result(file_id, {"file_path": blob, "content_hash": content_hash, "status": status})
+    db_utils.touch_files([file_id], last_access, None)
+    return blob
+
+
+def test_expired_files_are_deleted(tmp_dir):
+    blob = _upload(tmp_dir, "old", NOW - 2 * 86400)
+    _upload(tmp_dir, "fresh", NOW)
+    assert retention.collect(NOW)["expired"] == 1
+    assert db_utils.load_result("old") is None and not os.path.exists(blob)
+    assert db_utils.load_result("fresh")["status"] == "uploaded"
+
+
+def test_busy_batch_does_not_stall_gc(tmp_dir):
+    # Satu batch GC penuh berisi entry yang sedang dipakai job; entry sesudahnya tetap dihapus
+    for file_id in ("a-busy-1", "a-busy-2", "a-busy-3"):
+        _upload(tmp_dir, file_id, NOW - 2 * 86400, status="running")
+    blob = _upload(tmp_dir, "z-old", NOW - 2 * 86400)
+    assert retention.collect(NOW)["expired"] == 1
+    assert not os.path.exists(blob)
+    assert sorted(file_id for file_id, _ in db_utils.find_results(status="running")) == ["a-busy-1", "a-busy-2", "a-busy-3"]
+
+
+def test_quota_evicts_least_recently_used(tmp_dir, monkeypatch):
+    # Kuota 1MB dengan tiga file 400KB: file yang paling lama tidak diakses dihapus sampai muat
+    monkeypatch.setattr(retention, 'STORAGE_QUOTA_MB', 1)
+    monkeypatch.setattr(retention, 'GC_BATCH', 1)
+    for i, file_id in enumerate(("first", "second", "third")):
+        _upload(tmp_dir, file_id, NOW - 3600 + i, size=400 * 1024)
+    stats = retention.collect(NOW)
+    assert stats["evicted"] == 1 and stats["usage_bytes"] <= 1024 * 1024
+    assert db_utils.load_result("first") is None
+    assert db_utils.load_result("second") and db_utils.load_result("third")
+
+
+def test_shared_patch_kept_until_both_sources_deleted(tmp_dir):
+    _upload(tmp_dir, "base", NOW - 2 * 86400)
+    _upload(tmp_dir, "new", NOW)
+    patch = os.path.join(tmp_dir, 'patch_base_new')
+    with open(patch, 'wb') as f:
+        f.write(b"@@ diff @@")
+    # Seperti /diff_compress method=patch: patch dicatat di kedua file sumber
+    for file_id in ("base", "new"):
+        db_utils.update_result_field(file_id, "patches", [patch])
+    assert retention.collect(NOW)["expired"] == 1
+    assert db_utils.load_result("base") is None and os.path.exists(patch)
+
+    assert retention.collect(NOW + 2 * 86400)["expired"] == 1
+    assert not os.path.exists(patch)
@@ -0,0 +1,64 @@
+"""
+Test workspace scratch (tidak butuh server): kuota ditegakkan selama menulis (penulisan dari Python dan file
+output tool eksternal), dan sweep() menghapus workspace proses mati atau proses lama yang pid-nya dipakai
+lagi, tanpa menyentuh workspace proses yang masih berjalan.
+
+Jalankan: python -m pytest backend/test_scratch.py
+"""
+import os
+import sys
+
+import pytest
+
+from backend import scratch
+from backend import supervisor
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def scratch_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(scratch, 'SCRATCH_ROOT', str(tmp_path / 'scratch'))
+    return tmp_path / 'scratch'
+
+
+def test_quota_enforced_while_writing(scratch_root):
+    with scratch.workspace('test', quota_mb=1) as ws:
+        with pytest.raises(scratch.ScratchQuotaExceeded):
+            with ws.open('input') as out:
+                for _ in range(4):
+                    out.write(b"x" * (MB // 2))
+        # Write yang melewati kuota ditolak sebelum byte-nya ditulis
+        assert os.path.getsize(ws.file('input')) == MB
+
+
+@pytest.mark.skipif(supervisor.resource is None, reason="RLIMIT_FSIZE hanya tersedia di POSIX")
+def test_tool_output_limited_by_quota(scratch_root):
+    with scratch.workspace('test', quota_mb=1) as ws:
+        output = ws.file('output.bin')
+        limit = ws.file_limit()
+        script = f"import sys; f = open({output!r}, 'wb'); [f.write(b'x' * 65536) for _ in range(64)]"
+        with pytest.raises(supervisor.ToolError):
+            supervisor.run_tool('test', [sys.executable, '-c', script], max_file_bytes=limit)
+        assert os.path.getsize(output) <= MB
+        with pytest.raises(scratch.ScratchQuotaExceeded):
+            ws.check_truncated(output, limit)
+
+
+def _stale_dir(scratch_root, name):
+    path = scratch_root / name
+    path.mkdir(parents=True)
+    return path
+
+
+def test_sweep_removes_stale_workspaces(scratch_root):
+    with scratch.workspace('live') as ws:
+        # pid yang sudah tidak ada, dan pid proses ini dengan token proses lama (pid dipakai ulang)
+        dead = _stale_dir(scratch_root, f"{2 ** 22 + 1}-0-job-abc")
+        reused = _stale_dir(scratch_root, f"{os.getpid()}-00000000123-job-abc")
+        other = _stale_dir(scratch_root, "bukan-workspace")
+        assert scratch.sweep() == (2 if scratch._process_token(os.getpid()) else 1)
+        assert os.path.isdir(ws.path) and other.is_dir() and not dead.exists()
+    assert not os.path.exists(ws.path)
+    if scratch._process_token(os.getpid()):
+        assert not reused.exists()
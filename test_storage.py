@@ -0,0 +1,131 @@
+"""
+Test kontrak backend storage (tidak butuh server): operasi yang sama dijalankan terhadap FilesystemBackend
+dan S3Backend. S3 memakai moto (S3 palsu di dalam proses, pip install moto boto3); jika paketnya tidak ada,
+hanya backend fs yang diuji. Juga menguji adopt untuk upload yang di-stream langsung ke backend (staged).
+
+Jalankan: python -m pytest backend/test_storage.py
+"""
+import os
+import random
+
+import pytest
+
+from backend import blobstore
+from backend import storage
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+BUCKET = 'smartshrink'
+
+
+@pytest.fixture
+def tmp_dir(db):
+    return str(db)
+
+
+@pytest.fixture
+def root(tmp_dir):
+    return os.path.join(tmp_dir, 'storage')
+
+
+@pytest.fixture(params=['fs', 's3'])
+def backend(request, root, monkeypatch):
+    """Backend yang diuji dipasang sebagai storage.backend: fs, dan s3 lewat moto jika paketnya ada."""
+    if request.param == 'fs':
+        monkeypatch.setattr(storage, 'backend', storage.FilesystemBackend())
+        yield storage.backend
+        return
+    if mock_aws is None:
+        pytest.skip("moto/boto3 tidak terpasang")
+    for name, value in (('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'), ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+    with mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(storage, 'backend', storage.S3Backend(BUCKET, 'test/', region='us-east-1', root=root))
+        yield storage.backend
+
+
+def _local_file(tmp_dir, name, data):
+    path = os.path.join(tmp_dir, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _read(backend, path):
+    body = backend.open(path)
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+
+def test_backend_contract(backend, root, tmp_dir):
+    data = random.Random(1).randbytes(300000)
+    a = os.path.join(root, 'blobs', 'aa', 'a')
+    src = _local_file(tmp_dir, 'src', data)
+    backend.put_file(a, src)
+    assert not os.path.exists(src)
+    assert backend.exists(a) and backend.size(a) == len(data)
+    assert _read(backend, a) == data
+    assert backend.read_range(a, 1000, 50) == data[1000:1050]
+    assert b"".join(backend.iter_range(a, 10, 100010, block=4096)) == data[10:100010]
+    assert b"".join(backend.iter_range(a)) == data
+
+    b = os.path.join(root, 'chunks', 'bb', 'b')
+    backend.put_bytes(b, b"manifest")
+    assert _read(backend, b) == b"manifest"
+
+    backend.delete(a)
+    assert not backend.exists(a)
+    # delete untuk path yang tidak ada bukan error
+    backend.delete(a)
+
+
+def test_backend_writer_and_promote(backend, root, monkeypatch):
+    # Lebih besar dari satu part multipart (minimal 5MB di S3) supaya jalur multipart ikut teruji
+    monkeypatch.setattr(storage, 'S3_MULTIPART_MB', 5)
+    big = random.Random(2).randbytes(11 * 1024 * 1024 + 123)
+    small = b"isi kecil"
+    for i, data in enumerate((big, small)):
+        staged = os.path.join(root, f"upload-{i}")
+        writer = backend.writer(staged)
+        for offset in range(0, len(data), 1024 * 1024):
+            writer.write(data[offset:offset + 1024 * 1024])
+        writer.close()
+        assert backend.size(staged) == len(data)
+        target = os.path.join(root, 'blobs', f"{i}{i}", f"target-{i}")
+        backend.promote(staged, target)
+        assert not backend.exists(staged)
+        assert _read(backend, target) == data
+
+    aborted = os.path.join(root, 'aborted')
+    writer = backend.writer(aborted)
+    writer.write(big)
+    writer.abort()
+    assert not backend.exists(aborted)
+
+
+def test_staged_adopt_deduplicates(backend, root, tmp_dir):
+    data = random.Random(3).randbytes(200000)
+    staged_paths = []
+    for i in range(2):
+        staged_paths.append(os.path.join(root, f"staged-{i}"))
+        writer = backend.writer(staged_paths[-1])
+        writer.write(data)
+        writer.close()
+    content_hash = blobstore.hash_file(_local_file(tmp_dir, 'copy', data))
+    first, deduplicated = blobstore.adopt(staged_paths[0], content_hash, root, staged=True)
+    assert not deduplicated
+    second, deduplicated = blobstore.adopt(staged_paths[1], content_hash, root, staged=True)
+    assert deduplicated and second == first
+    assert not any(backend.exists(path) for path in staged_paths)
+    with blobstore.open_raw(first, content_hash) as f:
+        assert f.read() == data
+    blobstore.release(content_hash)
+    blobstore.release(content_hash)
+    assert not backend.exists(first)
@@ -0,0 +1,59 @@
+"""
+Test supervisor tool eksternal (tidak butuh server): proses yang melewati timeout atau dibatalkan di-kill,
+exit code != 0 menjadi ToolError dengan potongan stderr, dan rlimit tetap dipasang (dengan warning) saat
+CLI prlimit tidak ada.
+
+Jalankan: python -m pytest backend/test_supervisor.py
+"""
+import sys
+import time
+import logging
+import threading
+
+import pytest
+
+from backend import supervisor
+
+SLEEPER = [sys.executable, '-c', 'import time; time.sleep(60)']
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(supervisor, 'POLL_SECONDS', 0.05)
+
+
+def test_timeout_kills_tool():
+    started = time.monotonic()
+    with pytest.raises(supervisor.ToolTimeout):
+        supervisor.run_tool('test', SLEEPER, timeout=0.5)
+    assert time.monotonic() - started < 10
+
+
+def test_cancel_kills_tool():
+    event = threading.Event()
+    threading.Timer(0.3, event.set).start()
+    started = time.monotonic()
+    with supervisor.cancel_scope(event):
+        with pytest.raises(supervisor.ToolCancelled):
+            supervisor.run_tool('test', SLEEPER, timeout=60)
+    assert time.monotonic() - started < 10
+
+
+def test_failed_tool_reports_stderr():
+    with pytest.raises(supervisor.ToolError) as failed:
+        supervisor.run_tool('test', [sys.executable, '-c', 'import sys; sys.exit("encoder rusak")'])
+    assert "exit 1" in str(failed.value) and "encoder rusak" in str(failed.value)
+
+
+@pytest.mark.skipif(not hasattr(supervisor.resource, 'prlimit'), reason="resource.prlimit hanya ada di Linux")
+def test_fallback_without_prlimit_cli(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(supervisor.shutil, 'which', lambda name: None)
+    monkeypatch.setattr(supervisor, 'TOOL_MAX_CPU_SECONDS', 30)
+    monkeypatch.setattr(supervisor, '_warned', set())
+    output = tmp_path / 'limit'
+    # Batas dipasang dari parent setelah spawn; tool membacanya setelah jeda singkat
+    script = f"import time, resource; time.sleep(0.5); open({str(output)!r}, 'w').write(str(resource.getrlimit(resource.RLIMIT_CPU)[0]))"
+    with caplog.at_level(logging.WARNING):
+        supervisor.run_tool('test', [sys.executable, '-c', script])
+    assert output.read_text() == "30"
+    assert any("prlimit" in record.message and "TANPA batas" in record.message for record in caplog.records)
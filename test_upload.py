@@ -0,0 +1,85 @@
+"""
+Test endpoint /upload dan /batch_upload lewat TestClient (tanpa server): upload duplikat berbagi blob,
+field 'file' wajib, file/referensi blob tidak tertinggal saat metadata gagal disimpan, batch disimpan dalam
+satu transaksi dengan job opsional per file, dan batch yang ditolak (method tidak dikenal, MAX_BATCH_FILES)
+tidak meninggalkan file.
+
+Jalankan: python -m pytest backend/test_upload.py
+"""
+import os
+
+import pytest
+
+from backend import db_utils
+from backend import jobs
+from backend import main
+
+CONTENT = b"isi file upload\n" * 1000
+
+
+def _stored_files(client):
+    return sorted(os.path.join(dirpath, name) for dirpath, _, names in os.walk(main.STORAGE_DIR) for name in names)
+
+
+def test_duplicate_upload_shares_blob(client):
+    first = client.post("/upload", files={"file": ("a.txt", CONTENT, "text/plain")}).json()
+    second = client.post("/upload", files={"file": ("b.txt", CONTENT, "text/plain")}).json()
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert first["content_hash"] == second["content_hash"]
+    assert db_utils.get_blob(first["content_hash"])["refcount"] == 2
+
+
+def test_upload_requires_file_field(client):
+    response = client.post("/upload", files={"document": ("a.txt", CONTENT, "text/plain")})
+    assert response.status_code == 422
+    assert _stored_files(client) == []
+
+
+def test_failed_save_leaves_no_blob(client, monkeypatch):
+    def failing_save(*args):
+        raise RuntimeError("disk penuh")
+
+    monkeypatch.setattr(db_utils, 'save_result', failing_save)
+    monkeypatch.setattr(db_utils, 'save_results_many', failing_save)
+    with pytest.raises(RuntimeError):
+        client.post("/upload", files={"file": ("a.txt", CONTENT, "text/plain")})
+    with pytest.raises(RuntimeError):
+        client.post("/batch_upload", files=[("files", ("b.txt", b"lain" * 100, "text/plain")),
+                                            ("files", ("c.txt", CONTENT, "text/plain"))])
+    # Referensi blob dilepas, jadi file blob ikut terhapus
+    assert db_utils.list_blobs() == []
+    assert _stored_files(client) == []
+
+
+def test_batch_upload_single_transaction(client, monkeypatch):
+    transactions = []
+    save_results_many = db_utils.save_results_many
+    monkeypatch.setattr(db_utils, 'save_results_many', lambda items: transactions.append(len(items)) or save_results_many(items))
+    files = [("files", (f"file{i}.txt", b"isi %d\n" % i * 500, "text/plain")) for i in range(3)]
+    files.append(("files", ("duplikat.txt", b"isi 0\n" * 500, "text/plain")))
+    uploaded = client.post("/batch_upload", files=files).json()["files"]
+    assert transactions == [4]
+    assert [f["filename"] for f in uploaded] == ["file0.txt", "file1.txt", "file2.txt", "duplikat.txt"]
+    assert [f["deduplicated"] for f in uploaded] == [False, False, False, True]
+    for f in uploaded:
+        assert db_utils.load_result(f["file_id"])["content_hash"] == f["content_hash"]
+
+
+def test_batch_upload_queues_jobs(client):
+    files = [("files", (f"file{i}.txt", b"baris %d\n" % i * 2000, "text/plain")) for i in range(2)]
+    uploaded = client.post("/batch_upload", files=files, data={"method": "gzip"}).json()["files"]
+    for f in uploaded:
+        job = jobs.get_job(f["job"]["job_id"])
+        job["future"].result(timeout=60)
+        assert job["status"] == "done" and db_utils.load_result(f["file_id"])["status"] == "compressed"
+
+
+@pytest.mark.parametrize("data, count, status", [
+    ({"method": "tidak-ada"}, 2, 422),
+    ({}, 3, 400),
+])
+def test_rejected_batch_leaves_no_files(client, monkeypatch, data, count, status):
+    monkeypatch.setattr(main, 'MAX_BATCH_FILES', 2)
+    files = [("files", (f"file{i}.txt", b"isi %d" % i, "text/plain")) for i in range(count)]
+    assert client.post("/batch_upload", files=files, data=data).status_code == status
+    assert _stored_files(client) == [] and db_utils.list_blobs() == []
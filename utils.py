@@ -10,8 +10,8 @@ import os
 # Kompresi file menggunakan gzip
 # Keluaran: file .gz
 
-def compress_gzip(input_path, output_path):
-    with open(input_path, 'rb') as f_in, gzip.open(output_path, 'wb') as f_out:
+def compress_gzip(input_path, output_path, compresslevel=9):
+    with open(input_path, 'rb') as f_in, gzip.open(output_path, 'wb', compresslevel=compresslevel) as f_out:
         shutil.copyfileobj(f_in, f_out)
 
 # Kompresi file menggunakan brotli
@@ -40,6 +40,33 @@ def auto_select_compression(mime_type):
         return 'webp'
     return 'brotli'
 
+# Deteksi format dari byte awal file (magic number), dipakai jika MIME dari nama file tidak ada
+
+SNIFF_BYTES = 64
+MAGIC_SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'Rar!\x1a\x07', 'application/x-rar-compressed'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (b'\x1f\x8b', 'application/gzip'),
+]
+
+def sniff_mime(head):
+    for magic, mime_type in MAGIC_SIGNATURES:
+        if head.startswith(magic):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        return 'video/mp4'
+    return None
+
 # AI selector stub (rule-based, bisa diganti ML model nanti)
 import math
 from PIL import Image
@@ -77,13 +104,15 @@ def image_resolution(path):
     except Exception:
         return None
 
-def ai_selector_stub(mime_type, file_size, filename, profile='default'):
+def ai_selector_stub(mime_type, file_size, filename, profile='default', features=None):
     """
     Wrapper ke ai_selector_ml (ML sederhana) agar tetap backward compatible.
+    features: fitur file dari metadata upload (entropy, img_res, pdf_pages, format), opsional.
     """
+    entropy = (features or {}).get("entropy")
     try:
         from backend.utils_ai_selector import ai_selector_ml
-        return ai_selector_ml(mime_type, file_size, filename, profile)
+        return ai_selector_ml(mime_type, file_size, filename, profile, features=features)
     except Exception as e:
         # Fallback rule jika modul gagal
         if profile == 'web':
@@ -103,11 +132,10 @@ def ai_selector_stub(mime_type, file_size, filename, profile='default'):
             return "brotli"
         if filename.lower().endswith(('.docx','.xlsx','.pptx')):
             return "gzip"
-        return "brotli"
-    if entropy and entropy < 3.5:
-        print("[AI SELECTOR] Chosen: gzip (low entropy)")
-        return 'gzip'
-    print("[AI SELECTOR] Chosen: brotli (default)")
-    return 'brotli'
+        if entropy and entropy < 3.5:
+            print("[AI SELECTOR] Chosen: gzip (low entropy)")
+            return 'gzip'
+        print("[AI SELECTOR] Chosen: brotli (default)")
+        return 'brotli'
 
 
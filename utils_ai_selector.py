@@ -1,10 +1,12 @@
 import re
 
-def ai_selector_ml(mime_type, file_size, filename, profile='default'):
+def ai_selector_ml(mime_type, file_size, filename, profile='default', features=None):
     """
     ML sederhana (decision tree/rule-based) untuk memilih metode kompresi optimal, mendukung profile.
+    features: fitur file dari metadata upload (entropy, img_res, pdf_pages, format), opsional.
     """
     ext = filename.lower().split('.')[-1]
+    entropy = (features or {}).get("entropy")
     if profile == 'web':
         if mime_type.startswith("image/"):
             return "webp" if ext in ["jpg", "jpeg", "png", "webp"] else "heic"
@@ -37,6 +39,9 @@ def ai_selector_ml(mime_type, file_size, filename, profile='default'):
         else:
             return "webp"
     if mime_type.startswith("text/") or filename.lower().endswith((".log", ".txt", ".csv", ".json", ".xml")):
+        # Teks berentropi rendah sudah optimal dengan gzip, berapapun ukurannya
+        if entropy is not None and entropy < 3.5:
+            return "gzip"
         if file_size > 1*1024*1024:
             return "brotli"
         else: